@@ -0,0 +1,99 @@
+from django.db.models import Avg, Count, F, Sum, Window
+from django.db.models.functions import Ceil, RowNumber
+
+from .models import *
+
+# group_by dimension -> (id lookup, label lookups) on CropRotationEntry
+DIMENSIONS = {
+    "company": ("rotation__company_id", {"company": "rotation__company__name"}),
+    "region": ("rotation__region_id", {"region": "rotation__region__name"}),
+    "sector": ("rotation__sector_id", {"sector": "rotation__sector__name"}),
+    "crop": ("crop_id", {"crop_name": "crop__name", "crop_subtype": "crop__subtype"}),
+    "year": ("rotation__year", {}),
+}
+DEFAULT_PERCENTILES = (25, 50, 75)
+
+
+def parse_group_by(value):
+    """Split ``?group_by=``; raises ValueError naming unknown dimensions."""
+    dimensions = [part.strip() for part in (value or "year").split(",") if part.strip()]
+    unknown = [dimension for dimension in dimensions if dimension not in DIMENSIONS]
+    if unknown or not dimensions:
+        raise ValueError(f"Unknown group_by: {', '.join(unknown)}. Choose from: {', '.join(DIMENSIONS)}.")
+    return list(dict.fromkeys(dimensions))
+
+
+def parse_percentiles(value):
+    if not value:
+        return list(DEFAULT_PERCENTILES)
+    try:
+        percentiles = sorted({float(part) for part in value.split(",") if part.strip()})
+    except ValueError:
+        percentiles = [-1]
+    if not percentiles or not all(0 < p <= 100 for p in percentiles):
+        raise ValueError("percentiles must be comma-separated numbers in (0, 100].")
+    return percentiles
+
+
+def _group_columns(dimensions):
+    columns = {}
+    for dimension in dimensions:
+        id_lookup, labels = DIMENSIONS[dimension]
+        columns[f"{dimension}_id" if dimension != "year" else "year"] = id_lookup
+        columns.update(labels)
+    return columns
+
+
+def yield_analytics(entries, dimensions, percentiles):
+    """
+    Yield statistics of ``entries`` grouped by ``dimensions``, computed by the database.
+
+    Sums, means and counts come from one GROUP BY query. Each percentile of
+    ``actual_yield_tons`` is one more query: rows are numbered per group by a
+    window function and the nearest-rank row (``ceil(p * n)``) is kept, which
+    works on every backend without an ordered-set aggregate.
+    """
+    columns = _group_columns(dimensions)
+    names = list(columns)
+    # The entry's own crop_id column is selected as is; it can't be annotated under its own name.
+    rows = (
+        entries.values(*[name for name in names if columns[name] == name],
+                       **{name: F(lookup) for name, lookup in columns.items() if lookup != name})
+        .annotate(
+            entries=Count("id"),
+            actual_count=Count("actual_yield_tons"),
+            actual_sum=Sum("actual_yield_tons"),
+            expected_sum=Sum("expected_yield_tons"),
+            actual_avg=Avg("actual_yield_tons"),
+            expected_avg=Avg("expected_yield_tons"),
+        )
+        .order_by(*names)
+    )
+    groups = {}
+    for row in rows:
+        actual, expected = row["actual_sum"], row["expected_sum"]
+        row["gap"] = actual - expected if actual is not None and expected is not None else None
+        row["gap_pct"] = round(100 * row["gap"] / expected, 2) if row["gap"] is not None and expected else None
+        row["percentiles"] = {}
+        groups[tuple(row[name] for name in names)] = row
+
+    partition = [F(columns[name]) for name in names]
+    ranked = (
+        entries.filter(actual_yield_tons__isnull=False)
+        .annotate(**{f"_{name}": F(lookup) for name, lookup in columns.items()})
+        .annotate(
+            position=Window(RowNumber(), partition_by=partition, order_by=F("actual_yield_tons").asc()),
+            group_size=Window(Count("id"), partition_by=partition),
+        )
+    )
+    for percentile in percentiles:
+        label = f"p{percentile:g}"
+        hits = ranked.filter(position=Ceil(F("group_size") * percentile / 100.0)).values_list(
+            *[f"_{name}" for name in names], "actual_yield_tons"
+        )
+        for *key, value in hits:
+            group = groups.get(tuple(key))
+            if group is not None:
+                group["percentiles"][label] = value
+    return list(groups.values())
+
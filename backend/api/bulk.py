@@ -0,0 +1,319 @@
+from django.conf import settings
+from django.db import transaction
+from rest_framework import serializers
+
+from . import rollups, spatial, tiles
+from .caching import bump_tenant_version
+from .conflicts import ConflictChecker, conflict_messages, plot_values
+from .models import *
+
+BULK_BATCH_SIZE = 500
+
+
+class PlotBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Field-level validation for one bulk item.
+
+    Relations are plain ids here; sector ownership and crop existence are
+    checked once for the whole payload instead of one lookup per item.
+    New plots without ``sector_id`` are placed in the sector containing them.
+    """
+    id = serializers.IntegerField(required=False)
+    sector_id = serializers.IntegerField(required=False)
+    crop_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class CropPivotBulkItemSerializer(PlotBulkItemSerializer):
+    plot_layer = "pivots"
+    geometry_columns = ("center", "radius_m")
+
+    class Meta:
+        model = CropPivot
+        fields = [
+            "id", "logical_name", "area", "crop_ids", "seeding_date", "harvest_date",
+            "center", "radius_m", "sector_id", "color"
+        ]
+
+
+class CropFieldBulkItemSerializer(PlotBulkItemSerializer):
+    plot_layer = "fields"
+    geometry_columns = ("shape",)
+
+    class Meta:
+        model = CropField
+        fields = [
+            "id", "logical_name", "area", "crop_ids", "seeding_date", "harvest_date",
+            "shape", "color", "sector_id"
+        ]
+
+
+class BulkPlotWriter:
+    """Validate and write a list of pivots or fields for one user with a fixed number of queries."""
+
+    def __init__(self, serializer_class, user):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.user = user
+        self.existing = {}
+
+    def write(self, items, update=False):
+        errors = {}
+        valid = []
+        # One serializer validates every item, so its fields are built once rather than per item.
+        serializer = self.serializer_class(partial=update)
+        for index, item in enumerate(items):
+            try:
+                data = serializer.run_validation(item)
+            except serializers.ValidationError as exc:
+                errors[index] = serializers.as_serializer_error(exc)
+                continue
+            if update and "id" not in data:
+                errors[index] = {"id": ["This field is required."]}
+            else:
+                valid.append((index, data))
+
+        if not update:
+            valid = self.assign_sectors(valid, errors)
+        valid = self.check_relations(valid, errors, update)
+        # bulk_create/bulk_update send no signals, so the rollups get the batch's net change.
+        self.rollup_deltas = rollups.RollupDeltas()
+        with transaction.atomic():
+            ids = self.apply_updates(valid) if update else self.apply_creates(valid)
+            self.rollup_deltas.apply()
+            if ids:
+                # Inside the transaction, so the new versions become visible together with the rows.
+                bump_tenant_version(self.user.pk)
+                spatial.invalidate(self.user.pk)
+                tiles.clear_tiles(self.user.pk)
+
+        return {
+            "updated" if update else "created": ids,
+            "errors": [{"index": index, "errors": errors[index]} for index in sorted(errors)],
+        }
+
+    def assign_sectors(self, valid, errors):
+        if all("sector_id" in data for _, data in valid):
+            return valid
+        index = spatial.get_index(self.user.pk)
+        column = self.serializer_class.geometry_columns[0]
+        assigned = []
+        for position, data in valid:
+            if "sector_id" not in data:
+                sector_id, error = spatial.assign_sector(index, self.serializer_class.plot_layer, data.get(column))
+                if error:
+                    errors[position] = {"sector_id": [error]}
+                    continue
+                data["sector_id"] = sector_id
+            assigned.append((position, data))
+        return assigned
+
+    def check_relations(self, valid, errors, update):
+        sector_ids = {data["sector_id"] for _, data in valid if "sector_id" in data}
+        owned_sectors = set(WaterwaySector.objects.filter(
+            pk__in=sector_ids, region__company__owner=self.user
+        ).values_list("pk", flat=True))
+        crop_ids = {crop for _, data in valid for crop in data.get("crop_ids", ())}
+        known_crops = set(Crop.objects.filter(pk__in=crop_ids).values_list("pk", flat=True))
+        if update:
+            self.existing = self.model.objects.filter(
+                pk__in=[data["id"] for _, data in valid], sector__region__company__owner=self.user
+            ).in_bulk()
+
+        checker = ConflictChecker(self.user.pk) if settings.PLOT_CONFLICT_CHECK else None
+        checked = []
+        for index, data in valid:
+            item_errors = {}
+            if "sector_id" in data and data["sector_id"] not in owned_sectors:
+                item_errors["sector_id"] = ["Sector does not exist or you do not own this sector's company."]
+            unknown = set(data.get("crop_ids", ())) - known_crops
+            if unknown:
+                item_errors["crop_ids"] = [f"Unknown crop ids: {sorted(unknown)}"]
+            if update and data["id"] not in self.existing:
+                item_errors["id"] = ["Not found."]
+            if checker is not None and not item_errors:
+                problems = self.check_conflicts(checker, index, data, update)
+                if problems:
+                    item_errors["non_field_errors"] = problems
+            if item_errors:
+                errors[index] = item_errors
+            else:
+                checked.append(data)
+        return checked
+
+    def check_conflicts(self, checker, index, data, update):
+        # Earlier items of the payload are staged, so two new plots overlapping each other are caught too.
+        serializer_class = self.serializer_class
+        existing = self.existing.get(data["id"]) if update else None
+        values = plot_values(self.model, serializer_class.geometry_columns, data, existing)
+        sector_id = data.get("sector_id", existing.sector_id if existing is not None else None)
+        key = data["id"] if update else f"item {index}"
+        problems = checker.conflicts(serializer_class.plot_layer, key, values, sector_id)
+        if not problems:
+            checker.stage(serializer_class.plot_layer, key, values)
+        return conflict_messages(problems)
+
+    def apply_creates(self, valid):
+        plots = [
+            self.model(**{key: value for key, value in data.items() if key not in ("id", "crop_ids")})
+            for data in valid
+        ]
+        for plot in plots:
+            self.update_derived(plot)
+            self.rollup_deltas.add(rollups.plot_contribution(self.model, plot.sector_id, plot.area))
+        self.model.objects.bulk_create(plots, batch_size=BULK_BATCH_SIZE)
+        self.set_crops([(plot, data.get("crop_ids", [])) for plot, data in zip(plots, valid)], replace=False)
+        return [plot.pk for plot in plots]
+
+    def apply_updates(self, valid):
+        plots = []
+        update_fields = set()
+        crop_changes = []
+        # Derived columns follow the geometry, and a shape's area wins over a supplied one, as in save().
+        derived_from = set(self.serializer_class.geometry_columns)
+        if issubclass(self.model, ShapeArea):
+            derived_from.add(self.model.AREA_FIELD)
+        for data in valid:
+            plot = self.existing[data["id"]]
+            if "crop_ids" in data:
+                crop_changes.append((plot, data["crop_ids"]))
+            # Rows a re-import leaves as they are are not rewritten.
+            changed = {key for key, value in data.items() if key not in ("id", "crop_ids") and getattr(plot, key) != value}
+            if not changed:
+                continue
+            self.rollup_deltas.add(rollups.plot_contribution(self.model, plot.sector_id, plot.area), -1)
+            for key in changed:
+                setattr(plot, key, data[key])
+            update_fields |= changed
+            if derived_from & changed:
+                self.update_derived(plot)
+            self.rollup_deltas.add(rollups.plot_contribution(self.model, plot.sector_id, plot.area))
+            plots.append(plot)
+        if update_fields:
+            # Leaving unchanged derived columns out keeps the UPDATE's CASE lists short.
+            if update_fields & derived_from:
+                update_fields.update(self.derived_fields())
+            self.model.objects.bulk_update(plots, sorted(update_fields), batch_size=BULK_BATCH_SIZE)
+        self.set_crops(crop_changes, replace=True)
+        return [data["id"] for data in valid]
+
+    def update_derived(self, plot):
+        # bulk_create/bulk_update skip save(), so fill the columns it would derive.
+        plot.update_bbox()
+        if isinstance(plot, SimplifiedShape):
+            plot.update_shape_lod()
+        if isinstance(plot, ShapeArea):
+            plot.update_area()
+
+    def derived_fields(self):
+        fields = list(self.model.BBOX_FIELDS)
+        if issubclass(self.model, SimplifiedShape):
+            fields.append("shape_lod")
+        if issubclass(self.model, ShapeArea):
+            fields.append(self.model.AREA_FIELD)
+        return fields
+
+    def set_crops(self, changes, replace):
+        # One DELETE and one multi-row INSERT on the through table instead of crops.set() per plot.
+        through = self.model.crops.through
+        plot_column = f"{self.model._meta.model_name}_id"
+        if replace and changes:
+            through.objects.filter(**{f"{plot_column}__in": [plot.pk for plot, _ in changes]}).delete()
+        rows = [
+            through(**{plot_column: plot.pk, "crop_id": crop_id})
+            for plot, crop_ids in changes
+            for crop_id in set(crop_ids)
+        ]
+        through.objects.bulk_create(rows, batch_size=BULK_BATCH_SIZE)
+
+
+class CropRotationEntryUpsertItemSerializer(serializers.ModelSerializer):
+    rotation_id = serializers.IntegerField()
+    crop_id = serializers.IntegerField()
+
+    class Meta:
+        model = CropRotationEntry
+        fields = [
+            "rotation_id", "crop_id", "seeding_date", "harvest_date",
+            "actual_yield_tons", "expected_yield_tons"
+        ]
+
+
+def upsert_rotation_entries(user, items):
+    """
+    Insert or update entries keyed by (rotation, crop) for one user.
+
+    Ownership and existing keys are resolved with set-based queries; rows are
+    written with INSERT ... ON CONFLICT DO UPDATE, one statement per batch and
+    per distinct set of supplied columns, so omitted values are left untouched.
+    """
+    errors = {}
+    valid = {}
+    serializer = CropRotationEntryUpsertItemSerializer()
+    for index, item in enumerate(items):
+        try:
+            data = serializer.run_validation(item)
+        except serializers.ValidationError as exc:
+            errors[index] = serializers.as_serializer_error(exc)
+            continue
+        key = (data["rotation_id"], data["crop_id"])
+        if key in valid:
+            errors[index] = {"non_field_errors": [f"Duplicate of item {valid[key][0]}."]}
+        else:
+            valid[key] = (index, data)
+
+    owned_rotations = {
+        pk: (sector_id, year, owner_id)
+        for pk, sector_id, year, owner_id in CropRotation.objects.filter(
+            pk__in={rotation for rotation, _ in valid}, owner=user
+        ).values_list("pk", "sector_id", "year", "owner_id")
+    }
+    known_crops = set(Crop.objects.filter(pk__in={crop for _, crop in valid}).values_list("pk", flat=True))
+    for (rotation, crop), (index, _) in list(valid.items()):
+        item_errors = {}
+        if rotation not in owned_rotations:
+            item_errors["rotation_id"] = ["Rotation does not exist or you do not own this rotation's company."]
+        if crop not in known_crops:
+            item_errors["crop_id"] = ["Crop does not exist."]
+        if item_errors:
+            errors[index] = item_errors
+            del valid[(rotation, crop)]
+
+    existing = {
+        (rotation, crop): (actual, expected)
+        for rotation, crop, actual, expected in CropRotationEntry.objects.filter(
+            rotation_id__in={rotation for rotation, _ in valid}
+        ).values_list("rotation_id", "crop_id", "actual_yield_tons", "expected_yield_tons")
+    }
+    updated = sum(1 for key in valid if key in existing)
+
+    # The upsert sends no signals; the rollups get the net change from the old and new values.
+    deltas = rollups.RollupDeltas()
+    for (rotation, crop), (_, data) in valid.items():
+        old = existing.get((rotation, crop))
+        if old is not None:
+            deltas.add(rollups.entry_contribution(*owned_rotations[rotation], crop, *old), -1)
+        actual, expected = old or (None, None)
+        deltas.add(rollups.entry_contribution(
+            *owned_rotations[rotation], crop,
+            data.get("actual_yield_tons", actual), data.get("expected_yield_tons", expected),
+        ))
+
+    groups = {}
+    for index, data in valid.values():
+        columns = tuple(sorted(set(data) - {"rotation_id", "crop_id"}))
+        groups.setdefault(columns, []).append(CropRotationEntry(owner_id=user.pk, **data))
+    with transaction.atomic():
+        for columns, entries in groups.items():
+            CropRotationEntry.objects.bulk_create(
+                entries, batch_size=BULK_BATCH_SIZE, update_conflicts=True,
+                unique_fields=["rotation", "crop"], update_fields=[*columns, "owner"],
+            )
+        deltas.apply()
+        if valid:
+            bump_tenant_version(user.pk)
+
+    return {
+        "created": len(valid) - updated,
+        "updated": updated,
+        "errors": [{"index": index, "errors": errors[index]} for index in sorted(errors)],
+    }
@@ -0,0 +1,172 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .models import *
+
+# Crops are shared by every tenant, so their changes move a global version instead.
+GLOBAL_TENANT = "global"
+CACHED_ENDPOINTS = ("companies", "regions", "sectors", "pivots", "fields")
+
+
+def tenant_owner_id(instance):
+    """Return the id of the user whose data ``instance`` belongs to, or None if it cannot be resolved."""
+    try:
+        if isinstance(instance, Company):
+            return instance.owner_id
+        if isinstance(instance, Region):
+            return instance.company.owner_id
+        if isinstance(instance, WaterwaySector):
+            return instance.region.company.owner_id
+        if isinstance(instance, (CropPivot, CropField)):
+            return instance.sector.region.company.owner_id
+        if isinstance(instance, (CropRotation, CropRotationEntry)):
+            return instance.owner_id
+    except ObjectDoesNotExist:
+        # A parent deleted in the same cascade; its own signal moves the version.
+        return None
+    return None
+
+
+def get_tenant_version(tenant):
+    """
+    Version stamp (nanoseconds since epoch) of the tenant's data; 0 before its first write.
+
+    Stamps live in the database rather than the cache, so every worker
+    process and management command sees the same one, and a write that
+    rolls back takes its stamp with it.
+    """
+    versions = TenantVersion.objects.filter(tenant=str(tenant)).values_list("version", flat=True)
+    return next(iter(versions), 0)
+
+
+def bump_tenant_version(tenant):
+    if tenant is None:
+        return None
+    version = time.time_ns()
+    TenantVersion.objects.bulk_create(
+        [TenantVersion(tenant=str(tenant), version=version)],
+        update_conflicts=True, unique_fields=["tenant"], update_fields=["version"],
+    )
+    return version
+
+
+def data_versions(user):
+    """Versions of everything a user's responses can depend on: their own data and the shared crops."""
+    tenants = [str(user.pk), GLOBAL_TENANT]
+    versions = dict(TenantVersion.objects.filter(tenant__in=tenants).values_list("tenant", "version"))
+    return tuple(versions.get(tenant, 0) for tenant in tenants)
+
+
+def data_version(user, versions=None):
+    return ".".join(str(version) for version in versions or data_versions(user))
+
+
+def request_data_versions(request):
+    """``data_versions`` read once per request, shared by the conditional GET and the response cache."""
+    if not hasattr(request, "_data_versions"):
+        request._data_versions = data_versions(request.user)
+    return request._data_versions
+
+
+def _record(endpoint, outcome):
+    key = f"api:cache-stats:{endpoint}:{outcome}"
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr(); the count restarts.
+        cache.set(key, 1, None)
+
+
+def cache_stats():
+    keys = [f"api:cache-stats:{endpoint}:{outcome}" for endpoint in CACHED_ENDPOINTS for outcome in ("hits", "misses")]
+    values = cache.get_many(keys)
+    return {
+        endpoint: {
+            outcome: values.get(f"api:cache-stats:{endpoint}:{outcome}", 0)
+            for outcome in ("hits", "misses")
+        }
+        for endpoint in CACHED_ENDPOINTS
+    }
+
+
+class TenantCachedListMixin:
+    """
+    Serve list responses from the cache, keyed by user, data version and URL.
+
+    Writes bump the owner's version (see api.signals), which orphans every
+    cached response of that tenant at once and leaves other tenants' entries alone.
+    """
+    cache_endpoint = None
+
+    def list(self, request, *args, **kwargs):
+        url_hash = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = f"api:response:{self.cache_endpoint}:{request.user.pk}:{data_version(request.user, request_data_versions(request))}:{url_hash}"
+
+        data = cache.get(key)
+        if data is not None:
+            _record(self.cache_endpoint, "hits")
+            return Response(data)
+
+        response = super().list(request, *args, **kwargs)
+        cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+        _record(self.cache_endpoint, "misses")
+        return response
+
+
+class NotModified(Exception):
+    """Raised from ``initial`` to answer a request with ``response`` before its handler runs."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Answer GETs with a strong ETag and Last-Modified derived from the data version.
+
+    The ETag comes from the version stamps alone, so a matching
+    If-None-Match returns 304 after one query and before any queryset is
+    built. Hooks DRF's ``initial`` (after authentication and content
+    negotiation) and ``finalize_response`` rather than ``get``, so it
+    applies to views that define their own ``get`` too.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validators = None
+        if request.method not in ("GET", "HEAD"):
+            return
+        versions = request_data_versions(request)
+        validator = f"{request.user.pk}:{versions}:{request.accepted_renderer.format}:{request.get_full_path()}"
+        self.validators = (f'"{hashlib.md5(validator.encode()).hexdigest()}"', max(versions) // 1_000_000_000)
+        # Last-Modified has one-second resolution, too coarse to validate against after a write in the
+        # same second, so If-Modified-Since alone never earns a 304.
+        response = get_conditional_response(request._request, etag=self.validators[0])
+        if response is not None:
+            raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, "validators", None) is None or response.status_code not in (200, 304):
+            return response
+        etag, last_modified = self.validators
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        # Per-user data: browsers may keep it, but must revalidate before reuse.
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Authorization"])
+        return response
@@ -0,0 +1,101 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import spatial
+from .caching import data_version
+from .models import *
+
+CLUSTER_LAYERS = ("pivots", "fields")
+# Width of a cluster cell in screen pixels (256px web-mercator tiles).
+CELL_PX = 64
+
+
+def _cell(lon, lat, zoom):
+    lat = max(min(lat, 85.0511), -85.0511)
+    scale = 2 ** zoom * 256 / CELL_PX
+    x = (lon + 180.0) / 360.0 * scale
+    y = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * scale
+    return math.floor(x), math.floor(y)
+
+
+def _plot_points(owner_id, layer):
+    """``(lon, lat, area, crop_ids)`` of the tenant's plots: pivot centers and field centroids."""
+    model, owner_lookup, columns = spatial.LAYERS[layer]
+    plot_column = f"{model._meta.model_name}_id"
+    crops = defaultdict(list)
+    through = model.crops.through.objects.filter(**{f"{model._meta.model_name}__{owner_lookup}": owner_id})
+    for plot_id, crop_id in through.values_list(plot_column, "crop_id").iterator(chunk_size=2000):
+        crops[plot_id].append(crop_id)
+
+    rows = model.objects.filter(**{owner_lookup: owner_id}).values_list("pk", columns[0], "area")
+    for pk, wkt, area in rows.iterator(chunk_size=2000):
+        point = spatial.plot_point(layer, pk, wkt)
+        if point is not None:
+            yield point[0], point[1], area or 0.0, crops.get(pk, ())
+
+
+def build_clusters(owner_id, layers, zoom):
+    """
+    Group the tenant's plots into grid cells of CELL_PX screen pixels at ``zoom``.
+
+    Each cluster has its plot count per layer, total area, the mean position
+    of its plots and the crop covering the most area among them.
+    """
+    cells = {}
+    for layer in layers:
+        for lon, lat, area, crop_ids in _plot_points(owner_id, layer):
+            key = _cell(lon, lat, zoom)
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = {
+                    "count": 0, "pivots": 0, "fields": 0, "area": 0.0, "lon": 0.0, "lat": 0.0,
+                    "crop_area": defaultdict(float),
+                }
+            cell["count"] += 1
+            cell[layer] += 1
+            cell["area"] += area
+            cell["lon"] += lon
+            cell["lat"] += lat
+            for crop_id in crop_ids:
+                cell["crop_area"][crop_id] += area
+
+    dominant = {
+        key: max(cell["crop_area"].items(), key=lambda item: (item[1], -item[0]))[0]
+        for key, cell in cells.items() if cell["crop_area"]
+    }
+    crops = Crop.objects.in_bulk(set(dominant.values()))
+    clusters = []
+    for key, cell in sorted(cells.items()):
+        crop = crops.get(dominant.get(key))
+        clusters.append({
+            "lon": cell["lon"] / cell["count"],
+            "lat": cell["lat"] / cell["count"],
+            "count": cell["count"],
+            "pivots": cell["pivots"],
+            "fields": cell["fields"],
+            "area": round(cell["area"], 4),
+            "dominant_crop": {"id": crop.pk, "name": str(crop)} if crop else None,
+        })
+    return clusters
+
+
+def tenant_clusters(user, layers, zoom, bbox=None, version=None):
+    """
+    Clusters of the user's plots at ``zoom``, optionally only those centred inside ``bbox``.
+
+    The whole-tenant result is cached per data version (``version`` when the
+    caller has read it already), layers and zoom, so panning at one zoom
+    reuses it and any plot or crop write invalidates it.
+    """
+    key = f"api:clusters:{user.pk}:{version or data_version(user)}:{','.join(layers)}:{zoom}"
+    clusters = cache.get(key)
+    if clusters is None:
+        clusters = build_clusters(user.pk, layers, zoom)
+        cache.set(key, clusters, settings.API_CACHE_TIMEOUT)
+    if bbox is not None:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        clusters = [c for c in clusters if min_lon <= c["lon"] <= max_lon and min_lat <= c["lat"] <= max_lat]
+    return clusters
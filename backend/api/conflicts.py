@@ -0,0 +1,123 @@
+from django.conf import settings
+
+from . import spatial
+from .geometry import (
+    bboxes_intersect, circle_bbox, circle_within, circles_overlap, polygons_overlap, polygons_within, wkt_bbox,
+)
+
+# Circles overlapping by less than this (metres) count as touching, e.g. rounded centers.
+OVERLAP_TOLERANCE_M = 0.01
+
+
+def _overlap(layer, a, b):
+    if layer == "pivots":
+        return circles_overlap(a, b) > OVERLAP_TOLERANCE_M
+    return polygons_overlap(a, b)
+
+
+def _within(layer, shape, sector_polygons):
+    if layer == "pivots":
+        return circle_within(shape, sector_polygons)
+    return polygons_within(shape, sector_polygons)
+
+
+class ConflictChecker:
+    """
+    Overlap and containment checks for one tenant's pivots and fields.
+
+    Candidates come from the tenant's grid index (api.spatial), so checking
+    one plot reads the few cells its bbox covers instead of every plot.
+    Plots staged with :meth:`stage` (e.g. earlier items of a bulk payload)
+    are checked as well and shadow their indexed version.
+    """
+
+    def __init__(self, owner_id):
+        self.index = spatial.get_index(owner_id)
+        self.staged = {layer: spatial.GridIndex(settings.SPATIAL_INDEX_CELL_DEGREES) for layer in ("pivots", "fields")}
+
+    def shape(self, layer, pk, values):
+        """Bbox and index shape of a plot from its geometry column values, or (None, None)."""
+        shape = spatial.index_shape(layer, pk, values)
+        if not shape:
+            return None, None
+        bbox = circle_bbox(values[0], shape[2]) if layer == "pivots" else wkt_bbox(values[0])
+        return bbox, shape
+
+    def conflicts(self, layer, key, values, sector_id):
+        """
+        Problems of one plot as ``[{"type": ..., ...}]``.
+
+        ``key`` is the plot's pk, or a label such as ``"item 3"`` for a plot not saved yet.
+        """
+        bbox, shape = self.shape(layer, key, values)
+        if shape is None:
+            return []
+        problems = []
+        staged = self.staged[layer]
+        indexed = self.index.layers[layer]
+        others = [(other, staged) for other in staged.candidates(bbox)]
+        others += [(other, indexed) for other in indexed.candidates(bbox) if other not in staged.items]
+        for other, source in sorted(others, key=lambda item: str(item[0])):
+            if other != key and _overlap(layer, shape, source.items[other][1]):
+                problems.append({"type": "overlap", "other_id": other})
+
+        sector = self.index.layers["sectors"].items.get(sector_id)
+        if sector is not None and not (bboxes_intersect(sector[0], bbox) and _within(layer, shape, sector[1])):
+            problems.append({"type": "outside_sector", "sector_id": sector_id})
+        return problems
+
+    def stage(self, layer, key, values):
+        bbox, shape = self.shape(layer, key, values)
+        if shape is not None:
+            self.staged[layer].insert(key, bbox, shape)
+
+
+def plot_values(model, columns, data, instance=None):
+    """Geometry column values a write would leave on a plot: the new data over the instance or model defaults."""
+    return [
+        data[column] if column in data
+        else getattr(instance, column) if instance is not None
+        else model._meta.get_field(column).get_default()
+        for column in columns
+    ]
+
+
+def conflict_messages(problems):
+    messages = []
+    for problem in problems:
+        if problem["type"] == "overlap" and isinstance(problem["other_id"], str):
+            messages.append(f"Overlaps {problem['other_id']} of this request.")
+        elif problem["type"] == "overlap":
+            messages.append(f"Overlaps plot {problem['other_id']}.")
+        else:
+            messages.append(f"Not inside sector {problem['sector_id']}.")
+    return messages
+
+
+def conflict_report(owner_id):
+    """
+    Every pivot-pivot and field-field overlap, and every plot not inside its sector's polygon.
+
+    Each pair is reported once (lower id first). Plots whose sector has no
+    shape are not checked for containment.
+    """
+    index = spatial.get_index(owner_id)
+    sectors = index.layers["sectors"].items
+    report = {"overlaps": [], "outside_sector": []}
+    for layer in ("pivots", "fields"):
+        model, owner_lookup, _ = spatial.LAYERS[layer]
+        plot_sectors = dict(model.objects.filter(**{owner_lookup: owner_id}).values_list("pk", "sector_id"))
+        grid = index.layers[layer]
+        for pk in sorted(grid.items):
+            bbox, shape = grid.items[pk]
+            for other in sorted(grid.candidates(bbox)):
+                if other > pk and _overlap(layer, shape, grid.items[other][1]):
+                    overlap = {"layer": layer, "id": pk, "other_id": other}
+                    if layer == "pivots":
+                        overlap["depth_m"] = round(circles_overlap(shape, grid.items[other][1]), 2)
+                    report["overlaps"].append(overlap)
+            sector_id = plot_sectors.get(pk)
+            sector = sectors.get(sector_id)
+            if sector is not None and not (bboxes_intersect(sector[0], bbox) and _within(layer, shape, sector[1])):
+                report["outside_sector"].append({"layer": layer, "id": pk, "sector_id": sector_id})
+    return report
@@ -0,0 +1,77 @@
+import csv
+import json
+
+from .geojson import STREAM_WRITE_SIZE
+from .models import *
+
+EXPORT_CHUNK_SIZE = 5000
+# format -> content type
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+# output column -> lookup from CropRotation; one row per entry, or one per rotation without entries.
+EXPORT_COLUMNS = {
+    "rotation_id": "id",
+    "year": "year",
+    "company": "company__name",
+    "region": "region__name",
+    "sector": "sector__name",
+    "pivot_id": "pivot_id",
+    "pivot": "pivot__logical_name",
+    "field_id": "field_id",
+    "field": "field__logical_name",
+    "notes": "notes",
+    "entry_id": "entries__id",
+    "crop_id": "entries__crop_id",
+    "crop": "entries__crop__name",
+    "crop_subtype": "entries__crop__subtype",
+    "seeding_date": "entries__seeding_date",
+    "harvest_date": "entries__harvest_date",
+    "actual_yield_tons": "entries__actual_yield_tons",
+    "expected_yield_tons": "entries__expected_yield_tons",
+}
+
+
+def export_rows(user):
+    """
+    Flat rows of the user's rotations joined with their entries, names resolved in the same query.
+
+    Read with a server-side iterator in rotation and entry id order, so
+    memory stays flat however many rows the tenant has.
+    """
+    rows = CropRotation.objects.filter(owner=user).order_by("id", "entries__id").values_list(*EXPORT_COLUMNS.values())
+    return rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """File-like object for csv.writer that returns each line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _lines(rows, fmt):
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        columns = list(EXPORT_COLUMNS)
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), default=str, separators=(",", ":")) + "\n"
+
+
+def stream_export(rows, fmt):
+    """Yield ``rows`` as CSV (with a header line) or newline-delimited JSON, in writes of STREAM_WRITE_SIZE."""
+    buffer = []
+    size = 0
+    for line in _lines(rows, fmt):
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_WRITE_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
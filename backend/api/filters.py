@@ -0,0 +1,82 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .geometry import parse_bbox
+
+MAX_ZOOM = 24
+
+
+def filter_bbox(queryset, bbox):
+    """Keep rows whose stored bounding box intersects ``bbox`` (min_lon, min_lat, max_lon, max_lat)."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return queryset.filter(
+        min_lon__lte=max_lon, max_lon__gte=min_lon,
+        min_lat__lte=max_lat, max_lat__gte=min_lat,
+    )
+
+
+def bbox_from_request(request):
+    value = request.query_params.get(BBoxFilter.bbox_param)
+    if not value:
+        return None
+    try:
+        return parse_bbox(value)
+    except ValueError as exc:
+        raise ValidationError({BBoxFilter.bbox_param: [str(exc)]})
+
+
+def zoom_from_request(request):
+    value = request.query_params.get(ZoomFilter.zoom_param)
+    if value in (None, ""):
+        return None
+    try:
+        zoom = int(value)
+    except ValueError:
+        zoom = -1
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValidationError({ZoomFilter.zoom_param: [f"zoom must be an integer between 0 and {MAX_ZOOM}."]})
+    return zoom
+
+
+class BBoxFilter(BaseFilterBackend):
+    """``?bbox=min_lon,min_lat,max_lon,max_lat`` viewport filter over the BoundingBox columns."""
+    bbox_param = 'bbox'
+
+    def filter_queryset(self, request, queryset, view):
+        bbox = bbox_from_request(request)
+        if bbox is None:
+            return queryset
+        return filter_bbox(queryset, bbox)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.bbox_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Only return rows intersecting min_lon,min_lat,max_lon,max_lat.',
+            'schema': {'type': 'string'},
+        }]
+
+
+class ZoomFilter(BaseFilterBackend):
+    """
+    ``?zoom=`` selects a precomputed simplification of ``shape`` (see SimplifiedShape).
+
+    The serializer swaps the shape in (``zoom`` context); this backend only
+    skips loading the simplified levels when no zoom was asked for.
+    """
+    zoom_param = 'zoom'
+
+    def filter_queryset(self, request, queryset, view):
+        if zoom_from_request(request) is None:
+            return queryset.defer('shape_lod')
+        return queryset
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.zoom_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Map zoom level; shapes are returned simplified to about one pixel at that zoom.',
+            'schema': {'type': 'integer', 'minimum': 0, 'maximum': MAX_ZOOM},
+        }]
@@ -0,0 +1,95 @@
+import json
+
+from .geometry import cached_geometry, select_lod
+from .models import *
+
+STREAM_CHUNK_SIZE = 2000
+# Features are buffered into writes of roughly this many characters.
+STREAM_WRITE_SIZE = 64 * 1024
+
+# layer -> (model, owner lookup, geometry column, property columns)
+LAYERS = {
+    "sectors": (
+        WaterwaySector, "region__company__owner", "shape",
+        ["id", "name", "color", "area_ha", "region_id"],
+    ),
+    "pivots": (
+        CropPivot, "sector__region__company__owner", "center",
+        ["id", "logical_name", "color", "area", "radius_m", "sector_id", "seeding_date", "harvest_date"],
+    ),
+    "fields": (
+        CropField, "sector__region__company__owner", "shape",
+        ["id", "logical_name", "color", "area", "sector_id", "seeding_date", "harvest_date"],
+    ),
+}
+
+
+def parse_layers(value):
+    """Split a ``?layers=`` value; raises ValueError naming any unknown layer."""
+    if not value:
+        return list(LAYERS)
+    layers = [layer.strip() for layer in value.split(",") if layer.strip()]
+    unknown = [layer for layer in layers if layer not in LAYERS]
+    if unknown:
+        raise ValueError(f"Unknown layers: {', '.join(unknown)}. Choose from: {', '.join(LAYERS)}.")
+    return layers
+
+
+def layer_queryset(layer, user):
+    model, owner_lookup, geometry_column, _ = LAYERS[layer]
+    return model.objects.filter(**{owner_lookup: user}).exclude(**{f"{geometry_column}__isnull": True})
+
+
+def layer_rows(layer, queryset, zoom=None):
+    """
+    ``(wkt, properties)`` per row of a layer, ordered by id and read with a server-side iterator.
+
+    With a ``zoom``, shapes come from the precomputed simplification for that zoom.
+    """
+    model, _, geometry_column, columns = LAYERS[layer]
+    simplified = zoom is not None and issubclass(model, SimplifiedShape)
+    extra = ["shape_lod"] if simplified else []
+    rows = queryset.order_by("id").values_list(geometry_column, *extra, *columns)
+    for wkt, *values in rows.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        if simplified:
+            levels, *values = values
+            wkt = select_lod(wkt, levels, zoom)
+        yield wkt, dict(zip(columns, values))
+
+
+def iter_features(layer, queryset, zoom=None):
+    model = LAYERS[layer][0]
+    for wkt, properties in layer_rows(layer, queryset, zoom):
+        geometry = cached_geometry(model._meta.label, properties["id"], wkt)
+        if geometry is None:
+            continue
+        properties["layer"] = layer
+        yield {
+            "type": "Feature",
+            "id": f"{layer}.{properties['id']}",
+            "geometry": geometry.to_geojson(),
+            "properties": properties,
+        }
+
+
+def stream_feature_collection(querysets, zoom=None):
+    """
+    Yield a FeatureCollection as JSON text in bounded chunks.
+
+    ``querysets`` maps layer names to querysets; rows are read with a
+    server-side iterator so memory stays flat regardless of the row count.
+    """
+    buffer = ['{"type":"FeatureCollection","features":[']
+    size = 0
+    separator = ""
+    for layer, queryset in querysets.items():
+        for feature in iter_features(layer, queryset, zoom):
+            text = separator + json.dumps(feature, default=str, separators=(",", ":"))
+            buffer.append(text)
+            size += len(text)
+            separator = ","
+            if size >= STREAM_WRITE_SIZE:
+                yield "".join(buffer)
+                buffer, size = [], 0
+    buffer.append("]}")
+    yield "".join(buffer)
@@ -0,0 +1,658 @@
+import math
+import re
+import threading
+from array import array
+from collections import OrderedDict
+
+# Geometry is stored as EWKT text, e.g. "SRID=4326;POLYGON((lon lat, lon lat, ...))".
+_SRID_PREFIX = re.compile(r"^\s*SRID=\d+;", re.IGNORECASE)
+_TYPE = re.compile(r"\s*([A-Za-z]+)\s*")
+_TOKENS = re.compile(r"[()]|[^()]+")
+_GEOJSON_TYPES = {
+    "POINT": "Point",
+    "LINESTRING": "LineString",
+    "POLYGON": "Polygon",
+    "MULTIPOINT": "MultiPoint",
+    "MULTILINESTRING": "MultiLineString",
+    "MULTIPOLYGON": "MultiPolygon",
+}
+# Parenthesis depth at which each top-level part (polygon, line, ...) opens.
+_PART_DEPTH = {"POINT": 1, "LINESTRING": 1, "MULTIPOINT": 1, "POLYGON": 1, "MULTILINESTRING": 1, "MULTIPOLYGON": 2}
+_POLYGON_KINDS = ("POLYGON", "MULTIPOLYGON")
+EARTH_RADIUS_M = 6_378_137.0
+SQUARE_METERS_PER_HECTARE = 10_000.0
+
+
+class Geometry:
+    """
+    A parsed WKT geometry held as one contiguous float64 coordinate array.
+
+    ``coords`` is ``[x0, y0, x1, y1, ...]``; ``parts`` holds, per part
+    (polygon, line or point set), the ``(start, end)`` position ranges of its
+    rings. Shapes with hundreds of vertices cost 16 bytes per vertex instead
+    of a Python list and two floats each.
+    """
+    __slots__ = ("kind", "coords", "parts")
+
+    def __init__(self, kind, coords, parts):
+        self.kind = kind
+        self.coords = coords
+        self.parts = parts
+
+    @property
+    def nbytes(self):
+        return len(self.coords) * self.coords.itemsize + 64 * sum(len(rings) for rings in self.parts) + 200
+
+    def ring(self, start, end):
+        coords = self.coords
+        return [(coords[i], coords[i + 1]) for i in range(2 * start, 2 * end, 2)]
+
+    def polygons(self):
+        """Polygons as lists of rings of ``(lon, lat)`` tuples (first ring outer); empty for non-polygons."""
+        if self.kind not in _POLYGON_KINDS:
+            return []
+        return [[self.ring(start, end) for start, end in rings] for rings in self.parts]
+
+    @property
+    def bbox(self):
+        xs, ys = self.coords[0::2], self.coords[1::2]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def _ring_moments(self, start, end):
+        coords = self.coords
+        area = cx = cy = 0.0
+        x1, y1 = coords[2 * end - 2], coords[2 * end - 1]
+        for i in range(2 * start, 2 * end, 2):
+            x2, y2 = coords[i], coords[i + 1]
+            cross = x1 * y2 - x2 * y1
+            area += cross
+            cx += (x1 + x2) * cross
+            cy += (y1 + y2) * cross
+            x1, y1 = x2, y2
+        return area / 2, cx / 6, cy / 6
+
+    def planar_area(self):
+        """Shoelace area in squared coordinate units (holes subtracted)."""
+        if self.kind not in _POLYGON_KINDS:
+            return 0.0
+        total = 0.0
+        for rings in self.parts:
+            for index, (start, end) in enumerate(rings):
+                area = abs(self._ring_moments(start, end)[0])
+                total += -area if index else area
+        return total
+
+    def _ring_geodesic_area(self, start, end):
+        # Chamberlain & Duquette on a sphere of the WGS84 equatorial radius, the formula the
+        # field form already uses client-side (Leaflet.draw L.GeometryUtil.geodesicArea).
+        coords = self.coords
+        n = end - start
+        if n < 3:
+            return 0.0
+        lons = [math.radians(coords[2 * i]) for i in range(start, end)]
+        sin_lats = [math.sin(math.radians(coords[2 * i + 1])) for i in range(start, end)]
+        total = 0.0
+        for i in range(n):
+            total += (lons[(i + 1) % n] - lons[i - 1]) * sin_lats[i]
+        return abs(total) * EARTH_RADIUS_M * EARTH_RADIUS_M / 2
+
+    def geodesic_area(self):
+        """Area on the sphere in square metres (holes subtracted); 0 for non-polygons."""
+        if self.kind not in _POLYGON_KINDS:
+            return 0.0
+        total = 0.0
+        for rings in self.parts:
+            for index, (start, end) in enumerate(rings):
+                area = self._ring_geodesic_area(start, end)
+                total += -area if index else area
+        return total
+
+    @property
+    def centroid(self):
+        """Area-weighted centroid for polygons, mean position otherwise."""
+        if self.kind in _POLYGON_KINDS:
+            area = cx = cy = 0.0
+            for rings in self.parts:
+                for index, (start, end) in enumerate(rings):
+                    ring_area, ring_cx, ring_cy = self._ring_moments(start, end)
+                    # Orient the outer ring positive and holes negative, whatever the input winding.
+                    sign = (1 if ring_area >= 0 else -1) * (-1 if index else 1)
+                    area += sign * ring_area
+                    cx += sign * ring_cx
+                    cy += sign * ring_cy
+            if area:
+                return cx / area, cy / area
+        xs, ys = self.coords[0::2], self.coords[1::2]
+        return sum(xs) / len(xs), sum(ys) / len(ys)
+
+    def to_geojson(self):
+        def positions(start, end):
+            return [list(position) for position in self.ring(start, end)]
+
+        kind = self.kind
+        if kind == "POINT":
+            coordinates = positions(*self.parts[0][0])[0]
+        elif kind == "LINESTRING":
+            coordinates = positions(*self.parts[0][0])
+        elif kind == "MULTIPOINT":
+            coordinates = [position for start, end in self.parts[0] for position in positions(start, end)]
+        elif kind in ("POLYGON", "MULTILINESTRING"):
+            coordinates = [positions(start, end) for start, end in self.parts[0]]
+        else:
+            coordinates = [[positions(start, end) for start, end in rings] for rings in self.parts]
+        return {"type": _GEOJSON_TYPES[kind], "coordinates": coordinates}
+
+    def to_wkt(self):
+        """WKT of a polygon or multipolygon (without SRID prefix), coordinates rounded to 1e-7 degrees."""
+        def ring_text(start, end):
+            return "(" + ", ".join(f"{_wkt_number(x)} {_wkt_number(y)}" for x, y in self.ring(start, end)) + ")"
+
+        polygons = ["(" + ",".join(ring_text(start, end) for start, end in rings) + ")" for rings in self.parts]
+        if self.kind == "POLYGON":
+            return f"POLYGON{polygons[0]}"
+        return f"MULTIPOLYGON({','.join(polygons)})"
+
+    def simplify(self, tolerance):
+        """
+        Douglas-Peucker simplification of every ring, as a new polygon Geometry.
+
+        Outer rings keep at least a triangle so small plots stay visible;
+        holes narrower than ``tolerance`` are dropped.
+        """
+        coords = array("d")
+        parts = []
+        for rings in self.parts:
+            simplified = []
+            for index, (start, end) in enumerate(rings):
+                ring = simplify_ring(self.ring(start, end), tolerance, keep=index == 0)
+                if ring is None:
+                    continue
+                position = len(coords) // 2
+                for x, y in ring:
+                    coords.append(x)
+                    coords.append(y)
+                simplified.append((position, len(coords) // 2))
+            parts.append(tuple(simplified))
+        return Geometry(self.kind, coords, tuple(parts))
+
+
+def _wkt_number(value):
+    return f"{value:.7f}".rstrip("0").rstrip(".")
+
+
+def _geojson_position(position):
+    if (not isinstance(position, (list, tuple)) or len(position) < 2
+            or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in position[:2])
+            or not all(math.isfinite(value) for value in position[:2])):
+        raise ValueError(f"Invalid position: {position!r}")
+    return float(position[0]), float(position[1])
+
+
+def geojson_to_wkt(geometry):
+    """
+    EWKT (SRID 4326) of a GeoJSON Point, Polygon or MultiPolygon, as the shape columns store it.
+
+    Unclosed rings are closed. Raises ValueError for other types or malformed coordinates.
+    """
+    if not isinstance(geometry, dict):
+        raise ValueError("Feature has no geometry.")
+    kind, coordinates = geometry.get("type"), geometry.get("coordinates")
+    if kind == "Point":
+        x, y = _geojson_position(coordinates)
+        return f"SRID=4326;POINT({_wkt_number(x)} {_wkt_number(y)})"
+    if kind not in ("Polygon", "MultiPolygon") or not isinstance(coordinates, list) or not coordinates:
+        raise ValueError(f"Unsupported or empty geometry: {kind!r}.")
+
+    coords = array("d")
+    parts = []
+    for polygon in [coordinates] if kind == "Polygon" else coordinates:
+        rings = []
+        for ring in polygon if isinstance(polygon, list) else ():
+            positions = [_geojson_position(position) for position in ring] if isinstance(ring, list) else []
+            if positions and positions[0] != positions[-1]:
+                positions.append(positions[0])
+            if len(positions) < 4:
+                raise ValueError("A polygon ring needs at least three positions.")
+            start = len(coords) // 2
+            for x, y in positions:
+                coords.append(x)
+                coords.append(y)
+            rings.append((start, len(coords) // 2))
+        if not rings:
+            raise ValueError("Empty polygon.")
+        parts.append(tuple(rings))
+    return "SRID=4326;" + Geometry(kind.upper(), coords, tuple(parts)).to_wkt()
+
+
+def _append_positions(coords, text):
+    values = text.replace(",", " ").split()
+    if len(values) != 2 * (text.count(",") + 1):
+        # Z/M ordinates or stray separators: keep the first two numbers of each position.
+        values = []
+        for position in text.split(","):
+            numbers = position.split()
+            if len(numbers) < 2:
+                raise ValueError(f"Invalid coordinate: {position!r}")
+            values += numbers[:2]
+    values = [float(value) for value in values]
+    if not all(map(math.isfinite, values)):
+        raise ValueError("Non-finite coordinate.")
+    coords.extend(values)
+
+
+def parse_geometry(wkt):
+    """
+    Parse a (E)WKT string into a :class:`Geometry`.
+
+    Returns None for empty or unparseable input, so callers can skip rows
+    whose free-text geometry is missing or malformed.
+    """
+    if not wkt:
+        return None
+    text = _SRID_PREFIX.sub("", wkt, count=1)
+    match = _TYPE.match(text)
+    if not match or match.group(1).upper() not in _GEOJSON_TYPES:
+        return None
+    kind = match.group(1).upper()
+    part_depth = _PART_DEPTH[kind]
+
+    coords = array("d")
+    parts = []
+    depth = 0
+    try:
+        for token in _TOKENS.findall(text[match.end():]):
+            if token == "(":
+                depth += 1
+                if depth == part_depth:
+                    parts.append([])
+            elif token == ")":
+                depth -= 1
+                if depth < 0:
+                    return None
+            elif token.strip(", \t\r\n"):
+                if depth < part_depth:
+                    return None  # coordinates outside any parentheses, or "EMPTY"
+                start = len(coords) // 2
+                _append_positions(coords, token)
+                parts[-1].append((start, len(coords) // 2))
+    except ValueError:
+        return None
+    if depth != 0 or not coords:
+        return None
+    return Geometry(kind, coords, tuple(tuple(rings) for rings in parts))
+
+
+def wkt_to_geojson(wkt):
+    """Convert a (E)WKT string to a GeoJSON geometry dict, or None if it cannot be parsed."""
+    geometry = parse_geometry(wkt)
+    return geometry.to_geojson() if geometry is not None else None
+
+
+class GeometryCache:
+    """Thread-safe LRU of parsed geometries, evicting least recently used entries past a byte budget."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_parse(self, key, wkt):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        geometry = parse_geometry(wkt)
+        nbytes = geometry.nbytes if geometry is not None else 100
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (geometry, nbytes)
+                self.size += nbytes
+                while self.size > self.max_bytes and self._entries:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.size -= evicted
+        return geometry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+_geometry_cache = None
+
+
+def geometry_cache():
+    global _geometry_cache
+    if _geometry_cache is None:
+        from django.conf import settings
+        _geometry_cache = GeometryCache(settings.GEOMETRY_CACHE_BYTES)
+    return _geometry_cache
+
+
+def cached_geometry(model_label, pk, wkt):
+    """
+    Parsed geometry of one row's WKT column, shared by serializers, models and analytics.
+
+    Entries are keyed by ``(model, pk, version)`` where the version is the
+    text's hash, so an edited shape gets a fresh entry and the stale one ages
+    out. Unsaved rows use ``pk=None`` and are effectively content-addressed.
+    """
+    if not wkt:
+        return None
+    return geometry_cache().get_or_parse((model_label, pk, hash(wkt)), wkt)
+
+
+METERS_PER_DEGREE = 111_320.0
+
+
+def wkt_bbox(wkt, model_label=None, pk=None):
+    """Return ``(min_lon, min_lat, max_lon, max_lat)`` of a WKT geometry, or None."""
+    geometry = cached_geometry(model_label, pk, wkt)
+    return geometry.bbox if geometry is not None else None
+
+
+def wkt_area_ha(wkt, model_label=None, pk=None):
+    """Geodesic area of a WKT polygon in hectares, or None when it is not a parseable polygon."""
+    geometry = cached_geometry(model_label, pk, wkt)
+    if geometry is None or geometry.kind not in _POLYGON_KINDS:
+        return None
+    return geometry.geodesic_area() / SQUARE_METERS_PER_HECTARE
+
+
+def circle_bbox(center_wkt, radius_m):
+    """Bounding box of a pivot circle: its WKT center point grown by ``radius_m`` metres."""
+    geometry = parse_geometry(center_wkt)
+    if geometry is None or geometry.kind != "POINT":
+        return None
+    lon, lat = geometry.coords[0], geometry.coords[1]
+    radius_m = radius_m or 0
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+def _lon_lat(lon, lat):
+    # float() accepts "inf" and "nan", which no grid cell or comparison can handle.
+    if not (math.isfinite(lon) and math.isfinite(lat) and -180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError("Longitudes must lie within -180..180 and latitudes within -90..90.")
+    return lon, lat
+
+
+def parse_bbox(value):
+    """Parse a ``minx,miny,maxx,maxy`` query value; raises ValueError when malformed."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be four comma-separated numbers: min_lon,min_lat,max_lon,max_lat.")
+    _lon_lat(min_lon, min_lat)
+    _lon_lat(max_lon, max_lat)
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox minimums must not exceed maximums.")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_point(value):
+    """Parse a ``lon,lat`` query value; raises ValueError when malformed."""
+    try:
+        lon, lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("Expected lon,lat.")
+    return _lon_lat(lon, lat)
+
+
+def _point_in_ring(x, y, ring):
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def point_in_polygons(x, y, polygons):
+    """Even-odd test against polygons with holes (first ring outer, the rest holes)."""
+    for rings in polygons:
+        if rings and _point_in_ring(x, y, rings[0]) and not any(_point_in_ring(x, y, hole) for hole in rings[1:]):
+            return True
+    return False
+
+
+def _segments(polygons):
+    for rings in polygons:
+        for ring in rings:
+            yield from zip(ring, ring[1:])
+            # Forms send rings without repeating the first point; their closing edge counts too.
+            if ring and ring[0] != ring[-1]:
+                yield ring[-1], ring[0]
+
+
+def _orientation(a, b, c):
+    value = (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return (value > 0) - (value < 0)
+
+
+def _on_segment(a, b, c):
+    return min(a[0], b[0]) <= c[0] <= max(a[0], b[0]) and min(a[1], b[1]) <= c[1] <= max(a[1], b[1])
+
+
+def segments_intersect(p1, p2, q1, q2):
+    o1, o2 = _orientation(p1, p2, q1), _orientation(p1, p2, q2)
+    o3, o4 = _orientation(q1, q2, p1), _orientation(q1, q2, p2)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and _on_segment(p1, p2, q1)) or (o2 == 0 and _on_segment(p1, p2, q2))
+            or (o3 == 0 and _on_segment(q1, q2, p1)) or (o4 == 0 and _on_segment(q1, q2, p2)))
+
+
+def polygons_intersect(a, b):
+    """True when two polygon sets share any area or boundary point."""
+    b_segments = list(_segments(b))
+    for p1, p2 in _segments(a):
+        pxmin, pxmax = min(p1[0], p2[0]), max(p1[0], p2[0])
+        pymin, pymax = min(p1[1], p2[1]), max(p1[1], p2[1])
+        for q1, q2 in b_segments:
+            if (max(q1[0], q2[0]) < pxmin or min(q1[0], q2[0]) > pxmax
+                    or max(q1[1], q2[1]) < pymin or min(q1[1], q2[1]) > pymax):
+                continue
+            if segments_intersect(p1, p2, q1, q2):
+                return True
+    # No crossing edges: either disjoint or one lies entirely inside the other.
+    return (any(rings and point_in_polygons(*rings[0][0], b) for rings in a)
+            or any(rings and point_in_polygons(*rings[0][0], a) for rings in b))
+
+
+def bboxes_intersect(a, b):
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+# Distance (degrees) under which a point counts as lying on a boundary.
+BOUNDARY_TOLERANCE = 1e-9
+
+
+def _on_boundary(point, polygons):
+    return any(_segment_distance(point, a, b) <= BOUNDARY_TOLERANCE for a, b in _segments(polygons))
+
+
+def _strictly_inside(point, polygons):
+    return point_in_polygons(*point, polygons) and not _on_boundary(point, polygons)
+
+
+def _edges_cross(a, b):
+    """True when an edge of ``a`` properly crosses an edge of ``b`` (touching and collinear runs excluded)."""
+    b_segments = list(_segments(b))
+    for p1, p2 in _segments(a):
+        for q1, q2 in b_segments:
+            if (_orientation(p1, p2, q1) * _orientation(p1, p2, q2) < 0
+                    and _orientation(q1, q2, p1) * _orientation(q1, q2, p2) < 0):
+                return True
+    return False
+
+
+def _probe_points(polygons):
+    """Vertices and edge midpoints, which together catch overlaps that share every vertex."""
+    for p1, p2 in _segments(polygons):
+        yield p1
+        yield ((p1[0] + p2[0]) / 2, (p1[1] + p2[1]) / 2)
+
+
+def polygons_overlap(a, b):
+    """
+    True when two polygon sets share interior area.
+
+    Unlike :func:`polygons_intersect`, neighbours that only share an edge
+    or a vertex do not overlap.
+    """
+    if _edges_cross(a, b):
+        return True
+    return (any(_strictly_inside(point, b) for point in _probe_points(a))
+            or any(_strictly_inside(point, a) for point in _probe_points(b))
+            # Boundaries that coincide everywhere (e.g. the same shape twice) leave only interior points.
+            or any(_strictly_inside(point, b) for point in _interior_points(a)))
+
+
+def _interior_points(polygons):
+    """Centroid of each polygon's outer ring, where it lies inside that polygon."""
+    for rings in polygons:
+        if not rings:
+            continue
+        ring = rings[0]
+        area = cx = cy = 0.0
+        for (x1, y1), (x2, y2) in _segments([[ring]]):
+            cross = x1 * y2 - x2 * y1
+            area += cross
+            cx += (x1 + x2) * cross
+            cy += (y1 + y2) * cross
+        if area:
+            point = (cx / (3 * area), cy / (3 * area))
+            if _strictly_inside(point, [rings]):
+                yield point
+
+
+def polygons_within(inner, outer):
+    """True when ``inner`` lies inside ``outer``, boundaries allowed to touch."""
+    if _edges_cross(inner, outer):
+        return False
+    return all(point_in_polygons(*point, outer) or _on_boundary(point, outer) for point in _probe_points(inner))
+
+
+def _local_meters(lon, lat, origin_lat):
+    return lon * METERS_PER_DEGREE * math.cos(math.radians(origin_lat)), lat * METERS_PER_DEGREE
+
+
+def circles_overlap(a, b):
+    """
+    Overlap depth in metres of two ``(lon, lat, radius_m)`` circles; > 0 when they overlap.
+
+    Pivots are a few hundred metres across, so a local equirectangular
+    projection is accurate to well under a centimetre.
+    """
+    origin = (a[1] + b[1]) / 2
+    ax, ay = _local_meters(a[0], a[1], origin)
+    bx, by = _local_meters(b[0], b[1], origin)
+    return a[2] + b[2] - math.hypot(ax - bx, ay - by)
+
+
+def circle_within(circle, polygons):
+    """True when a ``(lon, lat, radius_m)`` circle lies inside the polygons (touching allowed)."""
+    lon, lat, radius_m = circle
+    if not point_in_polygons(lon, lat, polygons):
+        return False
+    center = _local_meters(lon, lat, lat)
+    tolerance = 0.01
+    return all(
+        _segment_distance(center, _local_meters(*p1, lat), _local_meters(*p2, lat)) >= radius_m - tolerance
+        for p1, p2 in _segments(polygons)
+    )
+
+
+def _segment_distance(point, a, b):
+    (px, py), (ax, ay), (bx, by) = point, a, b
+    dx, dy = bx - ax, by - ay
+    if dx == dy == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def _douglas_peucker(points, tolerance):
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, distance = None, tolerance
+        for i in range(first + 1, last):
+            d = _segment_distance(points[i], points[first], points[last])
+            if d > distance:
+                farthest, distance = i, d
+        if farthest is not None:
+            keep[farthest] = True
+            stack += [(first, farthest), (farthest, last)]
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def simplify_ring(ring, tolerance, keep=False):
+    """
+    Simplify a closed ring; returns None when it collapses below ``tolerance``.
+
+    The ring is split at the vertex farthest from its start so both halves
+    are open polylines. With ``keep`` a collapsed ring becomes its widest triangle.
+    """
+    points = ring[:-1] if len(ring) > 1 and ring[0] == ring[-1] else list(ring)
+    if len(points) < 3:
+        return None
+    split = max(range(1, len(points)), key=lambda i: math.hypot(points[i][0] - points[0][0], points[i][1] - points[0][1]))
+    head = _douglas_peucker(points[:split + 1], tolerance)
+    tail = _douglas_peucker(points[split:] + [points[0]], tolerance)
+    simplified = head[:-1] + tail
+    if len(simplified) >= 4:
+        return simplified
+    if not keep:
+        return None
+    apex = max(points, key=lambda point: _segment_distance(point, points[0], points[split]))
+    return [points[0], points[split], apex, points[0]]
+
+
+# Zoom levels with a precomputed simplification; each uses a tolerance of about one screen pixel.
+LOD_ZOOMS = (6, 9, 12, 15)
+
+
+def zoom_tolerance(zoom):
+    """Degrees per pixel of a 256px web-mercator tile at ``zoom`` (at the equator)."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def simplified_levels(wkt):
+    """
+    Simplified WKT of a polygon shape per zoom in LOD_ZOOMS, as ``{"<zoom>": wkt}``.
+
+    A level is only stored when it drops vertices compared with the next
+    finer one, so coarse levels of already-simple shapes cost nothing.
+    """
+    geometry = parse_geometry(wkt)
+    if geometry is None or geometry.kind not in _POLYGON_KINDS:
+        return {}
+    prefix = _SRID_PREFIX.match(wkt)
+    prefix = prefix.group(0).strip() if prefix else ""
+    levels = {}
+    finer = geometry
+    for zoom in sorted(LOD_ZOOMS, reverse=True):
+        simplified = finer.simplify(zoom_tolerance(zoom))
+        if len(simplified.coords) < len(finer.coords):
+            levels[str(zoom)] = prefix + simplified.to_wkt()
+            finer = simplified
+    return levels
+
+
+def select_lod(wkt, levels, zoom):
+    """The coarsest stored shape still accurate at ``zoom``, falling back to the full-resolution ``wkt``."""
+    if zoom is None or not levels:
+        return wkt
+    usable = [int(level) for level in levels if int(level) >= zoom]
+    return levels[str(min(usable))] if usable else wkt
@@ -0,0 +1,577 @@
+import csv
+import io
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from rest_framework import serializers
+
+from . import spatial, tiles
+from .bulk import (
+    BULK_BATCH_SIZE, BulkPlotWriter, CropFieldBulkItemSerializer, CropPivotBulkItemSerializer, upsert_rotation_entries,
+)
+from .caching import bump_tenant_version
+from .geometry import SQUARE_METERS_PER_HECTARE, geojson_to_wkt, parse_geometry
+from .models import *
+
+IMPORT_BATCH_SIZE = 2000
+# Rejected rows listed in a report; ``rejected_count`` covers all of them.
+MAX_REPORTED_REJECTIONS = 1000
+PLOT_SERIALIZERS = {"pivots": CropPivotBulkItemSerializer, "fields": CropFieldBulkItemSerializer}
+IMPORT_KINDS = (*PLOT_SERIALIZERS, "yields")
+ENTRY_COLUMNS = ("seeding_date", "harvest_date", "actual_yield_tons", "expected_yield_tons")
+# Text read from a GeoJSON file at a time; a feature larger than this grows the read.
+GEOJSON_READ_SIZE = 64 * 1024
+GEOJSON_LAYERS = ("sectors", "pivots", "fields")
+
+PlotRef = namedtuple("PlotRef", "pk sector_id sector region_id company_id")
+
+
+def _key(value):
+    return (value or "").strip().casefold()
+
+
+def csv_rows(stream):
+    """``(line number, row dict)`` per data row of a binary CSV stream, read incrementally."""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    for row in reader:
+        yield reader.line_num, {(column or "").strip(): (value or "").strip() for column, value in row.items()}
+
+
+def crop_lookup():
+    """Crop ids by case-insensitive ``(name, subtype)``."""
+    return {(_key(name), _key(subtype)): pk for pk, name, subtype in Crop.objects.values_list("pk", "name", "subtype")}
+
+
+class PlotLookup:
+    """A tenant's pivots or fields by logical name, so CSV rows are matched without a query per row."""
+
+    def __init__(self, model, user):
+        self.model = model
+        self.by_name = defaultdict(list)
+        self.load(model.objects.filter(sector__region__company__owner=user))
+
+    def load(self, queryset):
+        rows = queryset.values_list(
+            "logical_name", "pk", "sector_id", "sector__name", "sector__region_id", "sector__region__company_id",
+        )
+        for name, *ref in rows.iterator(chunk_size=IMPORT_BATCH_SIZE):
+            self.by_name[_key(name)].append(PlotRef(*ref))
+
+    def find(self, logical_name, sector_id=None, sector=None):
+        """``(PlotRef or None, error or None)``; the sector narrows down plots sharing a name."""
+        candidates = self.by_name.get(_key(logical_name), [])
+        if sector_id is not None:
+            candidates = [ref for ref in candidates if ref.sector_id == sector_id]
+        elif sector:
+            candidates = [ref for ref in candidates if _key(ref.sector) == _key(sector)]
+        if len(candidates) > 1:
+            return None, f"Several {self.model._meta.verbose_name_plural} are named '{logical_name}'; add a sector column."
+        return (candidates[0] if candidates else None), None
+
+
+class CsvImporter(ABC):
+    """
+    Stream rows from a CSV file, resolve names to ids and write them in batches.
+
+    ``parse`` turns a row into an item or errors; ``write`` stores a batch
+    in one transaction and returns ``(created, updated, errors)`` with errors
+    indexed into the batch. ``run`` returns the import report.
+    """
+
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE):
+        self.user = user
+        self.batch_size = batch_size
+        self.batch = []
+        self.report = {"rows": 0, "created": 0, "updated": 0, "rejected_count": 0, "rejected": []}
+
+    def run(self, rows):
+        started = time.monotonic()
+        for line, row in rows:
+            self.report["rows"] += 1
+            item, errors = self.parse(row)
+            if errors:
+                self.reject(line, errors)
+                continue
+            self.batch.append((line, item))
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+        self.flush()
+        elapsed = time.monotonic() - started
+        self.report["seconds"] = round(elapsed, 3)
+        self.report["rows_per_second"] = round(self.report["rows"] / elapsed) if elapsed else self.report["rows"]
+        return self.report
+
+    def flush(self):
+        if not self.batch:
+            return
+        lines = [line for line, _ in self.batch]
+        created, updated, errors = self.write([item for _, item in self.batch])
+        self.batch = []
+        self.report["created"] += created
+        self.report["updated"] += updated
+        for error in errors:
+            self.reject(lines[error["index"]], error["errors"])
+
+    def reject(self, line, errors):
+        self.report["rejected_count"] += 1
+        if len(self.report["rejected"]) < MAX_REPORTED_REJECTIONS:
+            self.report["rejected"].append({"line": line, "errors": errors})
+
+    @abstractmethod
+    def parse(self, row):
+        """``(item, errors)`` for one CSV row."""
+
+    @abstractmethod
+    def write(self, items):
+        """Store a batch; ``(created, updated, errors)``."""
+
+
+class PlotImporter(CsvImporter):
+    """
+    Pivots or fields: a row updates the plot with the same logical name (in its sector) or creates one.
+
+    Columns are those of the bulk endpoint, with ``sector`` (name) accepted
+    for ``sector_id`` and ``crops`` as ``name/subtype`` pairs separated by ``;``.
+    Rows without a sector are placed in the sector containing them.
+    """
+
+    def __init__(self, user, layer, batch_size=IMPORT_BATCH_SIZE):
+        super().__init__(user, batch_size)
+        self.serializer_class = PLOT_SERIALIZERS[layer]
+        self.model = self.serializer_class.Meta.model
+        self.columns = [
+            column for column in self.serializer_class.Meta.fields if column not in ("id", "sector_id", "crop_ids")
+        ]
+        self.crops = crop_lookup()
+        self.sectors = defaultdict(list)
+        for pk, name in WaterwaySector.objects.filter(region__company__owner=user).values_list("pk", "name"):
+            self.sectors[_key(name)].append(pk)
+        self.plots = PlotLookup(self.model, user)
+        self.pending = set()
+
+    def parse(self, row):
+        # A second row for a plot created earlier in this batch must see it as existing.
+        if _key(row.get("logical_name")) in self.pending:
+            self.flush()
+        errors = {}
+        item = {column: row[column] for column in self.columns if row.get(column)}
+
+        sector_id = None
+        if row.get("sector_id"):
+            try:
+                sector_id = int(row["sector_id"])
+            except ValueError:
+                errors["sector_id"] = ["A valid integer is required."]
+        elif row.get("sector"):
+            matches = self.sectors.get(_key(row["sector"]), [])
+            if len(matches) == 1:
+                sector_id = matches[0]
+            else:
+                errors["sector"] = [f"{'Several sectors are' if matches else 'No sector is'} named '{row['sector']}'."]
+        if sector_id is not None:
+            item["sector_id"] = sector_id
+
+        if row.get("crops"):
+            item["crop_ids"] = []
+            for crop in row["crops"].split(";"):
+                name, _, subtype = crop.partition("/")
+                crop_id = self.crops.get((_key(name), _key(subtype)))
+                if crop_id is None:
+                    errors.setdefault("crops", []).append(f"Unknown crop '{crop.strip()}'.")
+                else:
+                    item["crop_ids"].append(crop_id)
+
+        if row.get("logical_name") and not errors:
+            plot, error = self.plots.find(row["logical_name"], sector_id=sector_id)
+            if error:
+                errors["logical_name"] = [error]
+            elif plot is not None:
+                item["id"] = plot.pk
+            else:
+                self.pending.add(_key(row["logical_name"]))
+        return item, errors
+
+    def write(self, items):
+        self.pending = set()
+        created = updated = 0
+        errors = []
+        for update in (False, True):
+            positions = [position for position, item in enumerate(items) if ("id" in item) == update]
+            if not positions:
+                continue
+            result = BulkPlotWriter(self.serializer_class, self.user).write(
+                [items[position] for position in positions], update=update,
+            )
+            errors += [{"index": positions[error["index"]], "errors": error["errors"]} for error in result["errors"]]
+            if update:
+                updated += len(result["updated"])
+            else:
+                created += len(result["created"])
+                self.plots.load(self.model.objects.filter(pk__in=result["created"]))
+        return created, updated, errors
+
+
+class YieldImporter(CsvImporter):
+    """
+    Rotation entries keyed by plot, year and crop; missing rotations are created.
+
+    Columns follow the rotation export: ``year``, ``pivot`` or ``field``
+    (logical name), optional ``sector``, ``crop``, ``crop_subtype`` and the
+    entry values. Existing entries keep the values a row leaves empty.
+    """
+
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE):
+        super().__init__(user, batch_size)
+        self.crops = crop_lookup()
+        self.plots = {"pivot": PlotLookup(CropPivot, user), "field": PlotLookup(CropField, user)}
+        self.rotations = {}
+        rows = CropRotation.objects.filter(owner=user).values_list("pivot_id", "field_id", "year", "pk")
+        for pivot_id, field_id, year, pk in rows.iterator(chunk_size=IMPORT_BATCH_SIZE):
+            self.rotations[("pivot", pivot_id, year) if pivot_id else ("field", field_id, year)] = pk
+        self.report["rotations_created"] = 0
+
+    def parse(self, row):
+        errors = {}
+        try:
+            year = int(row.get("year") or "")
+        except ValueError:
+            year = None
+            errors["year"] = ["A valid integer is required."]
+
+        crop_id = self.crops.get((_key(row.get("crop")), _key(row.get("crop_subtype"))))
+        if crop_id is None:
+            errors["crop"] = [f"Unknown crop '{row.get('crop', '')}/{row.get('crop_subtype', '')}'."]
+
+        layers = [layer for layer in self.plots if row.get(layer)]
+        plot = None
+        if len(layers) != 1:
+            errors["non_field_errors"] = ["Give exactly one of pivot or field."]
+        else:
+            layer = layers[0]
+            plot, error = self.plots[layer].find(row[layer], sector=row.get("sector"))
+            if plot is None:
+                errors[layer] = [error or f"Unknown {layer} '{row[layer]}'."]
+
+        item = {column: row[column] for column in ENTRY_COLUMNS if row.get(column)}
+        if not errors:
+            item.update(plot=(layer, plot), year=year, crop_id=crop_id)
+        return item, errors
+
+    def write(self, items):
+        missing = {}
+        for item in items:
+            layer, plot = item["plot"]
+            key = (layer, plot.pk, item["year"])
+            if key not in self.rotations:
+                missing[key] = CropRotation(
+                    year=item["year"], sector_id=plot.sector_id, region_id=plot.region_id,
+                    company_id=plot.company_id, owner=self.user, **{f"{layer}_id": plot.pk},
+                )
+        with transaction.atomic():
+            # bulk_create skips CropRotation.save(), so the plot's sector chain is copied above.
+            CropRotation.objects.bulk_create(missing.values(), batch_size=IMPORT_BATCH_SIZE)
+            self.rotations.update({key: rotation.pk for key, rotation in missing.items()})
+            entries = [
+                {
+                    "rotation_id": self.rotations[(item["plot"][0], item["plot"][1].pk, item["year"])],
+                    **{column: value for column, value in item.items() if column not in ("plot", "year")},
+                }
+                for item in items
+            ]
+            result = upsert_rotation_entries(self.user, entries)
+        self.report["rotations_created"] += len(missing)
+        return result["created"], result["updated"], result["errors"]
+
+
+def importer_for(kind, user, batch_size=IMPORT_BATCH_SIZE):
+    if kind == "yields":
+        return YieldImporter(user, batch_size)
+    return PlotImporter(user, kind, batch_size)
+
+
+def report_lines(report):
+    """Human-readable summary of an import report, for the management commands."""
+    yield (
+        f"{report['rows']} rows in {report['seconds']}s ({report['rows_per_second']} rows/s): "
+        f"{report['created']} created, {report['updated']} updated, {report['rejected_count']} rejected"
+    )
+    if report.get("rotations_created"):
+        yield f"{report['rotations_created']} rotations created"
+    if report.get("created_by_layer"):
+        yield ", ".join(f"{layer}: {count} created" for layer, count in report["created_by_layer"].items())
+    for rejection in report["rejected"]:
+        problems = "; ".join(
+            f"{field}: {' '.join(str(message) for message in messages)}"
+            for field, messages in rejection["errors"].items()
+        )
+        where = f"line {rejection['line']}" if "line" in rejection else f"feature {rejection['feature']}"
+        yield f"  {where}: {problems}"
+    if report["rejected_count"] > len(report["rejected"]):
+        yield f"  ... and {report['rejected_count'] - len(report['rejected'])} more"
+
+
+class _JSONStream:
+    """Rolling text buffer over a stream, decoding one JSON value at a time with ``raw_decode``."""
+
+    def __init__(self, stream, read_size=GEOJSON_READ_SIZE):
+        self.text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+        self.read_size = read_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def read(self, size):
+        # Drop what was consumed, so the buffer holds at most the value being decoded and one read.
+        chunk = self.text.read(size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Next non-whitespace character, or "" at the end of the stream."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self.read(self.read_size)
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' in the GeoJSON file, found '{found or 'end of file'}'.")
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                end = None
+            # A value ending at the edge of the buffer may be a number cut short; read on to be sure.
+            if end is not None and (end < len(self.buffer) or self.eof):
+                self.pos = end
+                return value
+            if self.eof:
+                raise ValueError("The GeoJSON file is not valid JSON or is truncated.")
+            # Grow geometrically so a feature much larger than one read is not re-decoded many times.
+            self.read(max(self.read_size, len(self.buffer) - self.pos))
+
+
+def read_features(stream, read_size=GEOJSON_READ_SIZE):
+    """
+    Yield the features of a GeoJSON FeatureCollection from a binary stream, one at a time.
+
+    Only the feature being decoded (plus one read) is held in memory, so
+    the file size does not matter. Other top-level members are skipped.
+    """
+    reader = _JSONStream(stream, read_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "features":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.peek() == "]":
+                        reader.pos += 1
+                        break
+                    reader.expect(",")
+        else:
+            reader.value()
+        if reader.peek() == "}":
+            return
+        reader.expect(",")
+
+
+class SectorImportItemSerializer(serializers.ModelSerializer):
+    region_id = serializers.IntegerField()
+
+    class Meta:
+        model = WaterwaySector
+        fields = ["name", "shape", "color", "region_id", "total_water_requirement"]
+
+
+def write_sectors(user, items):
+    """Create sectors in one transaction; returns ``{"created": ids, "errors": [...]}`` like BulkPlotWriter."""
+    errors = []
+    valid = []
+    serializer = SectorImportItemSerializer()
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as exc:
+            errors.append({"index": index, "errors": serializers.as_serializer_error(exc)})
+    owned_regions = set(Region.objects.filter(
+        pk__in={data["region_id"] for _, data in valid}, company__owner=user
+    ).values_list("pk", flat=True))
+    sectors = []
+    for index, data in valid:
+        if data["region_id"] not in owned_regions:
+            errors.append({"index": index, "errors": {"region_id": ["Region does not exist or you do not own its company."]}})
+            continue
+        sector = WaterwaySector(**data)
+        # bulk_create skips save(), so fill the columns it would derive.
+        sector.update_bbox()
+        sector.update_shape_lod()
+        sector.update_area()
+        sectors.append(sector)
+    with transaction.atomic():
+        WaterwaySector.objects.bulk_create(sectors, batch_size=BULK_BATCH_SIZE)
+    if sectors:
+        # Later plots of the import may be placed in these sectors.
+        spatial.invalidate(user.pk)
+    return {"created": [sector.pk for sector in sectors], "errors": sorted(errors, key=lambda error: error["index"])}
+
+
+def feature_item(feature, number, polygon_layer="fields", region_id=None):
+    """
+    ``(layer, item)`` for one GeoJSON feature; raises ValueError for unusable ones.
+
+    Points become pivots and polygons ``polygon_layer`` (fields or sectors),
+    unless the feature's ``layer`` property (as written by /api/geojson/)
+    says otherwise. Properties matching model columns are kept; missing
+    names are numbered after the feature and missing areas derived from
+    the geometry.
+    """
+    if not isinstance(feature, dict):
+        raise ValueError("Not a GeoJSON feature.")
+    properties = feature.get("properties") or {}
+    wkt = geojson_to_wkt(feature.get("geometry"))
+    point = wkt.startswith("SRID=4326;POINT")
+    layer = properties.get("layer") or ("pivots" if point else polygon_layer)
+    if layer not in GEOJSON_LAYERS or point != (layer == "pivots"):
+        raise ValueError(f"A {'point' if point else 'polygon'} cannot be imported as {layer!r}.")
+
+    if layer == "sectors":
+        item = {key: properties[key] for key in ("name", "color", "region_id", "total_water_requirement") if properties.get(key) is not None}
+        item.setdefault("name", f"Sector {number}")
+        if region_id is not None:
+            item.setdefault("region_id", region_id)
+        item["shape"] = wkt
+        return layer, item
+
+    serializer_class = PLOT_SERIALIZERS[layer]
+    columns = [column for column in serializer_class.Meta.fields if column not in ("id", "crop_ids")]
+    item = {key: properties[key] for key in columns if properties.get(key) is not None}
+    # logical_name holds up to 10 characters.
+    item.setdefault("logical_name", str(properties.get("name") or f"{'P' if point else 'F'}{number}")[:10])
+    if point:
+        item["center"] = wkt
+        radius = float(item.get("radius_m") or CropPivot._meta.get_field("radius_m").default)
+        item.setdefault("area", round(math.pi * radius ** 2 / SQUARE_METERS_PER_HECTARE, 4))
+    else:
+        item["shape"] = wkt
+        item.setdefault("area", round(parse_geometry(wkt).geodesic_area() / SQUARE_METERS_PER_HECTARE, 4))
+    return layer, item
+
+
+def convert_features(features, first_number=1, polygon_layer="fields", region_id=None):
+    """
+    ``(items, rejected)`` for a batch of features; runs in a worker process of GeoJSONImporter.
+
+    ``items`` maps each layer to ``[(feature number, item)]``; only the
+    geometry work happens here, no queries.
+    """
+    items = {layer: [] for layer in GEOJSON_LAYERS}
+    rejected = []
+    for number, feature in enumerate(features, first_number):
+        try:
+            layer, item = feature_item(feature, number, polygon_layer, region_id)
+        except ValueError as exc:
+            rejected.append({"feature": number, "errors": {"geometry": [str(exc)]}})
+            continue
+        items[layer].append((number, item))
+    return items, rejected
+
+
+class GeoJSONImporter:
+    """
+    Stream features from a GeoJSON file and create them in batches of ``batch_size``.
+
+    With ``workers`` > 1 a process pool converts batches (the geometry
+    work) while this process writes converted batches in file order, each
+    layer in one transaction through BulkPlotWriter. Writing from one
+    process keeps sectors in place before later plots are assigned to them
+    and keeps the overlap checks seeing every earlier batch. At most
+    ``2 * workers`` batches are in flight, so memory stays flat.
+    """
+
+    def __init__(self, user, polygon_layer="fields", region_id=None, batch_size=IMPORT_BATCH_SIZE, workers=1):
+        self.user = user
+        self.options = {"polygon_layer": polygon_layer, "region_id": region_id}
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+        self.report = {
+            "rows": 0, "created": 0, "updated": 0, "created_by_layer": dict.fromkeys(GEOJSON_LAYERS, 0),
+            "rejected_count": 0, "rejected": [],
+        }
+
+    def run(self, features):
+        started = time.monotonic()
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        pending = []
+        try:
+            batch = []
+            for feature in features:
+                batch.append(feature)
+                if len(batch) >= self.batch_size:
+                    pending.append(self.submit(executor, batch))
+                    batch = []
+                    while len(pending) >= 2 * self.workers:
+                        self.write(pending.pop(0))
+            if batch:
+                pending.append(self.submit(executor, batch))
+            while pending:
+                self.write(pending.pop(0))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+            if self.report["created"]:
+                # Bulk writes bypass the model signals that keep these current.
+                bump_tenant_version(self.user.pk)
+                spatial.invalidate(self.user.pk)
+                tiles.clear_tiles(self.user.pk)
+        elapsed = time.monotonic() - started
+        self.report["seconds"] = round(elapsed, 3)
+        self.report["rows_per_second"] = round(self.report["rows"] / elapsed) if elapsed else self.report["rows"]
+        return self.report
+
+    def submit(self, executor, batch):
+        first_number = self.report["rows"] + 1
+        self.report["rows"] += len(batch)
+        if executor is None:
+            return convert_features(batch, first_number, **self.options)
+        return executor.submit(convert_features, batch, first_number, **self.options)
+
+    def write(self, converted):
+        items, rejected = converted if isinstance(converted, tuple) else converted.result()
+        # Sectors first, so plots of the same batch can be placed in them.
+        for layer in GEOJSON_LAYERS:
+            if not items[layer]:
+                continue
+            numbers = [number for number, _ in items[layer]]
+            batch = [item for _, item in items[layer]]
+            if layer == "sectors":
+                result = write_sectors(self.user, batch)
+            else:
+                result = BulkPlotWriter(PLOT_SERIALIZERS[layer], self.user).write(batch)
+            self.report["created_by_layer"][layer] += len(result["created"])
+            self.report["created"] += len(result["created"])
+            rejected += [{"feature": numbers[error["index"]], "errors": error["errors"]} for error in result["errors"]]
+        self.report["rejected_count"] += len(rejected)
+        room = MAX_REPORTED_REJECTIONS - len(self.report["rejected"])
+        self.report["rejected"] += sorted(rejected, key=lambda rejection: rejection["feature"])[:max(room, 0)]
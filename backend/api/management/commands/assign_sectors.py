@@ -0,0 +1,91 @@
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ... import rollups, spatial, tiles
+from ...caching import bump_tenant_version
+from ...models import CropRotation, WaterwaySector
+
+BATCH_SIZE = 2000
+PLOT_LAYERS = {"pivots": "pivot", "fields": "field"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Match a user's pivots and fields to the sector whose shape contains their center/centroid. "
+        "Reports plots in another sector, in several sectors or in none; --apply moves the first group."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--layer", choices=list(PLOT_LAYERS), help="Only check pivots or fields.")
+        parser.add_argument("--apply", action="store_true", help="Move plots to the one sector containing them.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        index = spatial.get_index(user.pk)
+        moved = 0
+        for layer in [options["layer"]] if options["layer"] else PLOT_LAYERS:
+            moves, ambiguous, orphans, unplaced, unchanged = self.match(index, layer, user)
+            self.stdout.write(self.style.MIGRATE_HEADING(layer))
+            self.stdout.write(f"  in their sector: {unchanged}")
+            self.stdout.write(f"  in another sector: {sum(len(pks) for pks in moves.values())}")
+            for pk, sector_ids in ambiguous:
+                self.stdout.write(f"  ambiguous: {pk} lies in sectors {', '.join(map(str, sector_ids))}")
+            if orphans:
+                self.stdout.write(f"  orphans (no sector contains them): {', '.join(map(str, orphans))}")
+            if unplaced:
+                self.stdout.write(f"  without a parseable geometry: {len(unplaced)}")
+            if options["apply"]:
+                moved += self.move(layer, moves)
+
+        if moved:
+            bump_tenant_version(user.pk)
+            spatial.invalidate(user.pk)
+            tiles.clear_tiles(user.pk)
+            rollups.rebuild(user.pk)
+            self.stdout.write(self.style.SUCCESS(f"Moved {moved} plots."))
+
+    def match(self, index, layer, user):
+        model, owner_lookup, columns = spatial.LAYERS[layer]
+        rows = model.objects.filter(**{owner_lookup: user}).values_list("pk", "sector_id", columns[0])
+        moves = defaultdict(list)
+        ambiguous, orphans, unplaced = [], [], []
+        unchanged = 0
+        for pk, sector_id, wkt in rows.iterator(chunk_size=BATCH_SIZE):
+            if spatial.plot_point(layer, pk, wkt) is None:
+                unplaced.append(pk)
+                continue
+            sector_ids = spatial.containing_sectors(index, layer, pk, wkt)
+            if not sector_ids:
+                orphans.append(pk)
+            elif len(sector_ids) > 1:
+                ambiguous.append((pk, sector_ids))
+            elif sector_ids[0] == sector_id:
+                unchanged += 1
+            else:
+                moves[sector_ids[0]].append(pk)
+        return moves, ambiguous, orphans, unplaced, unchanged
+
+    def move(self, layer, moves):
+        model = spatial.LAYERS[layer][0]
+        plot_fk = PLOT_LAYERS[layer]
+        sectors = WaterwaySector.objects.select_related("region").in_bulk(list(moves))
+        moved = 0
+        with transaction.atomic():
+            for sector_id, pks in moves.items():
+                sector = sectors[sector_id]
+                for start in range(0, len(pks), BATCH_SIZE):
+                    batch = pks[start:start + BATCH_SIZE]
+                    moved += model.objects.filter(pk__in=batch).update(sector_id=sector_id)
+                    # Rotations copy their plot's sector, region and company on save.
+                    CropRotation.objects.filter(**{f"{plot_fk}_id__in": batch}).update(
+                        sector_id=sector_id, region_id=sector.region_id, company_id=sector.region.company_id,
+                    )
+        return moved
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from ... import views
+
+# Endpoint name -> list view whose queryset is explained.
+ENDPOINTS = {
+    "companies": views.CompanyListCreate,
+    "regions": views.RegionListCreate,
+    "sectors": views.WaterwaySectorListCreate,
+    "pivots": views.CropPivotListCreate,
+    "fields": views.CropFieldListCreate,
+    "rotations": views.CropRotationListCreate,
+    "rotation-entries": views.CropRotationEntryListCreate,
+    "crops": views.CropListCreate,
+}
+
+
+class Command(BaseCommand):
+    help = "Print the database EXPLAIN plan of each list endpoint's first-page query for a user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User whose tenant scope the querysets are built for.")
+        parser.add_argument("endpoints", nargs="*",
+                            help=f"Endpoints to explain (default: all). One of: {', '.join(ENDPOINTS)}.")
+        parser.add_argument("--analyze", action="store_true",
+                            help="Run EXPLAIN ANALYZE (PostgreSQL only; executes the query).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        unknown = set(options["endpoints"]) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        explain_options = {"analyze": True} if options["analyze"] else {}
+        for name in options["endpoints"] or ENDPOINTS:
+            queryset = self.first_page_queryset(ENDPOINTS[name], user)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"/api/{name}/"))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write("")
+
+    def first_page_queryset(self, view_class, user):
+        request = Request(APIRequestFactory().get("/"))
+        request.user = user
+        view = view_class(request=request, format_kwarg=None, kwargs={}, args=())
+        paginator = view.paginator
+        queryset = view.filter_queryset(view.get_queryset()).order_by(*paginator.get_ordering(reverse=False))
+        return queryset[:paginator.page_size + 1]
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...export import EXPORT_FORMATS, export_rows, stream_export
+
+
+class Command(BaseCommand):
+    help = "Write a user's rotations with their entries, one row per entry, as CSV or newline-delimited JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", dest="fmt", choices=list(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        chunks = stream_export(export_rows(user), options["fmt"])
+        if not options["output"]:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
+            return
+        with open(options["output"], "w", newline="", encoding="utf-8") as out:
+            for chunk in chunks:
+                out.write(chunk)
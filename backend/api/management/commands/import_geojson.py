@@ -0,0 +1,40 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importers import IMPORT_BATCH_SIZE, GeoJSONImporter, read_features, report_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a user's pivots (from points) and fields or sectors (from polygons) from a GeoJSON "
+        "FeatureCollection. The file is parsed as a stream and features are written in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="GeoJSON file holding a FeatureCollection.")
+        parser.add_argument("--polygons", choices=["fields", "sectors"], default="fields",
+                            help="Layer for polygons without a 'layer' property (default: fields).")
+        parser.add_argument("--region", type=int, help="Region id for sectors without a 'region_id' property.")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Processes converting geometries (default: one per CPU; 1 converts in-process).")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        importer = GeoJSONImporter(
+            user, options["polygons"], options["region"], options["batch_size"], options["workers"],
+        )
+        try:
+            with open(options["path"], "rb") as stream:
+                report = importer.run(read_features(stream))
+        except ValueError as exc:
+            raise CommandError(f"{exc} ({importer.report['rows']} features read before the error.)")
+        for line in report_lines(report):
+            self.stdout.write(line)
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importers import IMPORT_BATCH_SIZE, PLOT_SERIALIZERS, PlotImporter, csv_rows, report_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update a user's pivots or fields from a CSV file. Rows are matched to existing plots "
+        "by logical name (and sector), validated and written in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="CSV file with a header row.")
+        parser.add_argument("--layer", choices=list(PLOT_SERIALIZERS), required=True)
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        importer = PlotImporter(user, options["layer"], options["batch_size"])
+        with open(options["path"], "rb") as stream:
+            report = importer.run(csv_rows(stream))
+        for line in report_lines(report):
+            self.stdout.write(line)
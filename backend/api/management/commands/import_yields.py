@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importers import IMPORT_BATCH_SIZE, YieldImporter, csv_rows, report_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert or update a user's rotation entries from a CSV file in the rotation export's columns "
+        "(year, pivot or field, sector, crop, crop_subtype, yields). Missing rotations are created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="CSV file with a header row.")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['username']}' does not exist.")
+
+        importer = YieldImporter(user, options["batch_size"])
+        with open(options["path"], "rb") as stream:
+            report = importer.run(csv_rows(stream))
+        for line in report_lines(report):
+            self.stdout.write(line)
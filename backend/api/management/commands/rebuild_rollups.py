@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import rollups
+from ...caching import bump_tenant_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the dashboard rollups (per-sector plot totals, per-sector/year/crop yields) "
+        "from plots and rotation entries, and report the rows that had drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", nargs="?", help="Only rebuild this user's rollups (default: every owner).")
+
+    def handle(self, *args, **options):
+        if options["username"]:
+            try:
+                owners = [User.objects.get(username=options["username"])]
+            except User.DoesNotExist:
+                raise CommandError(f"User '{options['username']}' does not exist.")
+        else:
+            owners = User.objects.filter(owned_companies__isnull=False).distinct().order_by("pk")
+
+        total = 0
+        for owner in owners:
+            drift = rollups.rebuild(owner.pk)
+            if drift:
+                bump_tenant_version(owner.pk)
+                self.stdout.write(f"{owner.username}: {drift} rows corrected")
+            total += drift
+        self.stdout.write(self.style.SUCCESS(f"Rollups rebuilt, {total} rows corrected."))
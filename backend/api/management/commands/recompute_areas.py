@@ -0,0 +1,86 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from ... import rollups, tiles
+from ...bulk import BULK_BATCH_SIZE
+from ...caching import bump_tenant_version
+from ...geojson import LAYERS
+from ...geometry import SQUARE_METERS_PER_HECTARE, parse_geometry
+
+BATCH_SIZE = 2000
+LAYER_NAMES = ("sectors", "fields")
+
+
+def compute_areas(rows):
+    """``[(pk, tenant_id, old_area, wkt)]`` -> ``[(pk, tenant_id, area_ha)]`` for rows whose area changed."""
+    changed = []
+    for pk, tenant_id, old_area, wkt in rows:
+        geometry = parse_geometry(wkt)
+        if geometry is None or geometry.kind not in ("POLYGON", "MULTIPOLYGON"):
+            continue
+        area = geometry.geodesic_area() / SQUARE_METERS_PER_HECTARE
+        if area != old_area:
+            changed.append((pk, tenant_id, area))
+    return changed
+
+
+class Command(BaseCommand):
+    help = "Recompute sector area_ha and field area (hectares) from their WKT shapes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Processes computing areas (default: one per CPU; 1 computes in-process).")
+
+    def handle(self, *args, **options):
+        workers = max(1, options["workers"])
+        owners = set()
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for name in LAYER_NAMES:
+                model, owner_lookup = LAYERS[name][:2]
+                updated = self.recompute(model, owner_lookup, options["batch_size"], executor, workers, owners)
+                self.stdout.write(f"{name}: {updated} updated")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Cached responses, aggregates, rollups and tiles of the affected tenants carry the old areas.
+        for owner_id in owners:
+            bump_tenant_version(owner_id)
+            tiles.clear_tiles(owner_id)
+            rollups.rebuild(owner_id)
+
+    def recompute(self, model, owner_lookup, batch_size, executor, workers, owners):
+        field = model.AREA_FIELD
+        rows = (
+            model.objects.exclude(shape__isnull=True).exclude(shape="")
+            .annotate(tenant_id=F(owner_lookup))
+            .values_list("pk", "tenant_id", field, "shape")
+        )
+        updated = 0
+        pending = []
+        last_pk = 0
+        while True:
+            # The main process reads keyset batches and writes results; workers only do the geometry.
+            batch = list(rows.filter(pk__gt=last_pk).order_by("pk")[:batch_size])
+            if batch:
+                last_pk = batch[-1][0]
+                if executor is None:
+                    pending.append(compute_areas(batch))
+                else:
+                    pending.append(executor.submit(compute_areas, batch))
+            # Keep a bounded number of batches in flight so memory stays flat.
+            while pending and (len(pending) >= 2 * workers or not batch):
+                result = pending.pop(0)
+                changed = result if executor is None else result.result()
+                model.objects.bulk_update(
+                    [model(pk=pk, **{field: area}) for pk, _, area in changed], [field], batch_size=BULK_BATCH_SIZE
+                )
+                owners.update(tenant_id for _, tenant_id, _ in changed)
+                updated += len(changed)
+            if not batch:
+                return updated
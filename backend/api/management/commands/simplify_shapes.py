@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from ... import tiles
+from ...caching import bump_tenant_version
+from ...geometry import simplified_levels
+from ...geojson import LAYERS
+
+BATCH_SIZE = 2000
+LAYER_NAMES = ("sectors", "fields")
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored zoom-level simplifications (shape_lod) of sector and field shapes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--missing", action="store_true",
+                            help="Only fill rows with a shape but no simplification yet.")
+
+    def handle(self, *args, **options):
+        owners = set()
+        for name in LAYER_NAMES:
+            model, owner_lookup = LAYERS[name][:2]
+            queryset = model.objects.exclude(shape__isnull=True).exclude(shape="")
+            if options["missing"]:
+                queryset = queryset.filter(shape_lod={})
+            queryset = queryset.annotate(tenant_id=F(owner_lookup)).only("pk", "shape", "shape_lod")
+
+            updated = 0
+            last_pk = 0
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk).order_by("pk")[:options["batch_size"]])
+                if not batch:
+                    break
+                changed = []
+                for row in batch:
+                    levels = simplified_levels(row.shape)
+                    if levels != row.shape_lod:
+                        row.shape_lod = levels
+                        changed.append(row)
+                        owners.add(row.tenant_id)
+                model.objects.bulk_update(changed, ["shape_lod"])
+                updated += len(changed)
+                last_pk = batch[-1].pk
+            self.stdout.write(f"{name}: {updated} updated")
+
+        # Cached list responses and tiles of the affected tenants may hold the old levels.
+        for owner_id in owners:
+            bump_tenant_version(owner_id)
+            tiles.clear_tiles(owner_id)
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def _batches(queryset):
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1].pk
+
+
+def backfill_owner(apps, schema_editor):
+    CropRotation = apps.get_model('api', 'CropRotation')
+    CropRotationEntry = apps.get_model('api', 'CropRotationEntry')
+
+    rotations = CropRotation.objects.only('pk', 'owner').annotate(
+        pivot_owner=models.F('pivot__sector__region__company__owner'),
+        field_owner=models.F('field__sector__region__company__owner'),
+    )
+    for batch in _batches(rotations):
+        for rotation in batch:
+            rotation.owner_id = rotation.pivot_owner or rotation.field_owner
+        CropRotation.objects.bulk_update(batch, ['owner'])
+
+    entries = CropRotationEntry.objects.only('pk', 'owner').annotate(rotation_owner=models.F('rotation__owner'))
+    for batch in _batches(entries):
+        for entry in batch:
+            entry.owner_id = entry.rotation_owner
+        CropRotationEntry.objects.bulk_update(batch, ['owner'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_alter_croprotation_company_alter_croprotation_region_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='croprotation',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='owned_rotations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='croprotationentry',
+            name='owner',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='owned_rotation_entries', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_owner, migrations.RunPython.noop),
+    ]
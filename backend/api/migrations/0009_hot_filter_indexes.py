@@ -0,0 +1,71 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_croprotation_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cropfield',
+            index=models.Index(fields=['sector', 'id'], name='field_sector_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cropfield',
+            index=models.Index(fields=['sector'], include=('area',), name='field_sector_area_cov'),
+        ),
+        migrations.AddIndex(
+            model_name='cropfield',
+            index=models.Index(fields=['seeding_date'], name='field_seeding_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cropfield',
+            index=models.Index(fields=['harvest_date'], name='field_harvest_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croppivot',
+            index=models.Index(fields=['sector', 'id'], name='pivot_sector_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croppivot',
+            index=models.Index(fields=['sector'], include=('area',), name='pivot_sector_area_cov'),
+        ),
+        migrations.AddIndex(
+            model_name='croppivot',
+            index=models.Index(fields=['seeding_date'], name='pivot_seeding_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croppivot',
+            index=models.Index(fields=['harvest_date'], name='pivot_harvest_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croprotation',
+            index=models.Index(fields=['owner', '-year', 'id'], name='rotation_owner_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croprotation',
+            index=models.Index(fields=['company', 'year'], name='rotation_company_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croprotationentry',
+            index=models.Index(fields=['owner', 'id'], name='entry_owner_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croprotationentry',
+            index=models.Index(fields=['crop', 'rotation'], name='entry_crop_rotation_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croprotationentry',
+            index=models.Index(fields=['seeding_date'], name='entry_seeding_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croprotationentry',
+            index=models.Index(fields=['harvest_date'], name='entry_harvest_date_idx'),
+        ),
+    ]
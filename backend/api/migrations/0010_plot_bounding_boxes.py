@@ -0,0 +1,163 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:30
+
+import math
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+BBOX_FIELDS = ['min_lon', 'min_lat', 'max_lon', 'max_lat']
+METERS_PER_DEGREE = 111_320.0
+_PREFIX = re.compile(r'^\s*(?:SRID=\d+;)?\s*([A-Za-z]+)', re.IGNORECASE)
+
+
+# Frozen copies of the geometry helpers as of this migration, so later changes to
+# api.geometry do not change what it computes on a fresh database.
+def _positions(wkt):
+    """``(kind, [(x, y), ...])`` of a WKT string, or None if it cannot be read."""
+    match = _PREFIX.match(wkt or '')
+    if not match:
+        return None
+    positions = []
+    try:
+        for text in re.split(r'[(),]', wkt[match.end():]):
+            values = text.split()
+            if values and values[0].upper() != 'EMPTY':
+                positions.append((float(values[0]), float(values[1])))
+    except (ValueError, IndexError):
+        return None
+    return (match.group(1).upper(), positions) if positions else None
+
+
+def wkt_bbox(wkt):
+    parsed = _positions(wkt)
+    if parsed is None:
+        return None
+    xs, ys = [x for x, _ in parsed[1]], [y for _, y in parsed[1]]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def circle_bbox(center_wkt, radius_m):
+    parsed = _positions(center_wkt)
+    if parsed is None or parsed[0] != 'POINT':
+        return None
+    lon, lat = parsed[1][0]
+    radius_m = radius_m or 0
+    dlat = radius_m / METERS_PER_DEGREE
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lon - dlon, lat - dlat, lon + dlon, lat + dlat
+
+
+def _backfill(model, columns, compute):
+    last_pk = 0
+    while True:
+        batch = list(model.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', *columns)[:BATCH_SIZE])
+        if not batch:
+            return
+        for row in batch:
+            bbox = compute(row) or (None, None, None, None)
+            row.min_lon, row.min_lat, row.max_lon, row.max_lat = bbox
+        model.objects.bulk_update(batch, BBOX_FIELDS)
+        last_pk = batch[-1].pk
+
+
+def backfill_bboxes(apps, schema_editor):
+    _backfill(apps.get_model('api', 'WaterwaySector'), ['shape'], lambda row: wkt_bbox(row.shape))
+    _backfill(apps.get_model('api', 'CropField'), ['shape'], lambda row: wkt_bbox(row.shape))
+    _backfill(apps.get_model('api', 'CropPivot'), ['center', 'radius_m'],
+              lambda row: circle_bbox(row.center, row.radius_m))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropfield',
+            name='max_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cropfield',
+            name='max_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cropfield',
+            name='min_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='cropfield',
+            name='min_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='croppivot',
+            name='max_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='croppivot',
+            name='max_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='croppivot',
+            name='min_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='croppivot',
+            name='min_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='waterwaysector',
+            name='max_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='waterwaysector',
+            name='max_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='waterwaysector',
+            name='min_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='waterwaysector',
+            name='min_lon',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cropfield',
+            index=models.Index(fields=['min_lon', 'min_lat'], name='field_bbox_min_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cropfield',
+            index=models.Index(fields=['max_lon', 'max_lat'], name='field_bbox_max_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croppivot',
+            index=models.Index(fields=['min_lon', 'min_lat'], name='pivot_bbox_min_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='croppivot',
+            index=models.Index(fields=['max_lon', 'max_lat'], name='pivot_bbox_max_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waterwaysector',
+            index=models.Index(fields=['min_lon', 'min_lat'], name='sector_bbox_min_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waterwaysector',
+            index=models.Index(fields=['max_lon', 'max_lat'], name='sector_bbox_max_idx'),
+        ),
+        migrations.RunPython(backfill_bboxes, migrations.RunPython.noop),
+    ]
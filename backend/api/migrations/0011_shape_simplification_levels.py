@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_plot_bounding_boxes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cropfield',
+            name='shape_lod',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='waterwaysector',
+            name='shape_lod',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
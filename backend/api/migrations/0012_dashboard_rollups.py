@@ -0,0 +1,76 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+BATCH_SIZE = 2000
+
+
+def backfill_rollups(apps, schema_editor):
+    SectorPlotRollup = apps.get_model('api', 'SectorPlotRollup')
+    SectorYieldRollup = apps.get_model('api', 'SectorYieldRollup')
+    totals = {}
+    for name, prefix in (('CropPivot', 'pivot'), ('CropField', 'field')):
+        rows = apps.get_model('api', name).objects.values('sector_id').annotate(count=Count('id'), area=Sum('area'))
+        for row in rows.order_by():
+            values = totals.setdefault(row['sector_id'], {})
+            values[f'{prefix}_count'] = row['count']
+            values[f'{prefix}_area'] = row['area'] or 0.0
+    SectorPlotRollup.objects.bulk_create(
+        [SectorPlotRollup(sector_id=sector_id, **values) for sector_id, values in totals.items()],
+        batch_size=BATCH_SIZE,
+    )
+
+    entries = apps.get_model('api', 'CropRotationEntry').objects.filter(
+        rotation__owner__isnull=False, rotation__sector__isnull=False,
+    ).values('rotation__sector_id', 'rotation__year', 'crop_id').annotate(
+        entries=Count('id'), actuals=Count('actual_yield_tons'),
+        actual=Sum('actual_yield_tons'), expected=Sum('expected_yield_tons'),
+    )
+    SectorYieldRollup.objects.bulk_create([
+        SectorYieldRollup(
+            sector_id=row['rotation__sector_id'], year=row['rotation__year'], crop_id=row['crop_id'],
+            entry_count=row['entries'], actual_count=row['actuals'],
+            actual_yield_tons=row['actual'] or 0.0, expected_yield_tons=row['expected'] or 0.0,
+        )
+        for row in entries.order_by()
+    ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_shape_simplification_levels'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectorPlotRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pivot_count', models.IntegerField(default=0)),
+                ('pivot_area', models.FloatField(default=0)),
+                ('field_count', models.IntegerField(default=0)),
+                ('field_area', models.FloatField(default=0)),
+                ('sector', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='plot_rollup', to='api.waterwaysector')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SectorYieldRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('entry_count', models.IntegerField(default=0)),
+                ('actual_count', models.IntegerField(default=0)),
+                ('actual_yield_tons', models.FloatField(default=0)),
+                ('expected_yield_tons', models.FloatField(default=0)),
+                ('crop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.crop')),
+                ('sector', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='yield_rollups', to='api.waterwaysector')),
+            ],
+            options={
+                'unique_together': {('sector', 'year', 'crop')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_dashboard_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantVersion',
+            fields=[
+                ('tenant', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 09:43
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_tenant_versions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='croppivot',
+            name='radius_m',
+            field=models.FloatField(default=100.0, validators=[django.core.validators.MinValueValidator(1.0), django.core.validators.MaxValueValidator(5000.0)]),
+        ),
+    ]
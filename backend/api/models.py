@@ -1,6 +1,123 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from math import pi
+from .geometry import circle_bbox, simplified_levels, wkt_area_ha, wkt_bbox
+
+
+def _related_aggregate(model, fk, aggregate, default):
+    # Correlated subquery, so several aggregates on one row never multiply each other's joins.
+    rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+    return Coalesce(Subquery(rows.annotate(value=aggregate).values('value')), Value(default))
+
+
+class CompanyQuerySet(models.QuerySet):
+    def with_stats(self):
+        return self.annotate(region_count=_related_aggregate(Region, 'company', Count('pk'), 0))
+
+
+class RegionQuerySet(models.QuerySet):
+    def with_stats(self):
+        return self.annotate(sector_count=_related_aggregate(WaterwaySector, 'region', Count('pk'), 0))
+
+
+class WaterwaySectorQuerySet(models.QuerySet):
+    def with_stats(self):
+        return self.annotate(
+            plantation_count=(
+                _related_aggregate(CropPivot, 'sector', Count('pk'), 0)
+                + _related_aggregate(CropField, 'sector', Count('pk'), 0)
+            ),
+            total_plantation_area=(
+                _related_aggregate(CropPivot, 'sector', Sum('area'), 0.0)
+                + _related_aggregate(CropField, 'sector', Sum('area'), 0.0)
+            ),
+        )
+
+class BoundingBox(models.Model):
+    """
+    Lon/lat extent parsed from the WKT geometry on save, so viewport queries can use plain indexes.
+
+    Concrete models implement ``compute_bbox``.
+    """
+    min_lon = models.FloatField(null=True, blank=True, editable=False)
+    min_lat = models.FloatField(null=True, blank=True, editable=False)
+    max_lon = models.FloatField(null=True, blank=True, editable=False)
+    max_lat = models.FloatField(null=True, blank=True, editable=False)
+
+    BBOX_FIELDS = ['min_lon', 'min_lat', 'max_lon', 'max_lat']
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored extent so a moved geometry can invalidate where it used to be.
+        if set(cls.BBOX_FIELDS) <= set(field_names):
+            instance.loaded_bbox = instance.bbox
+        return instance
+
+    @property
+    def bbox(self):
+        return tuple(getattr(self, field) for field in self.BBOX_FIELDS)
+
+    def compute_bbox(self):
+        """``(min_lon, min_lat, max_lon, max_lat)`` of the row's geometry, or None without one."""
+        raise NotImplementedError
+
+    def update_bbox(self):
+        self.min_lon, self.min_lat, self.max_lon, self.max_lat = self.compute_bbox() or (None, None, None, None)
+
+    def save(self, *args, **kwargs):
+        self.update_bbox()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *self.BBOX_FIELDS}
+        super().save(*args, **kwargs)
+
+
+class SimplifiedShape(models.Model):
+    """Douglas-Peucker simplifications of ``shape`` per zoom level, computed on save (see geometry.simplified_levels)."""
+    shape_lod = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def update_shape_lod(self):
+        self.shape_lod = simplified_levels(self.shape)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'shape' in update_fields:
+            self.update_shape_lod()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'shape_lod'}
+        super().save(*args, **kwargs)
+
+
+class ShapeArea(models.Model):
+    """Geodesic area of ``shape`` in hectares, written to ``AREA_FIELD`` on save; rows without a polygon keep theirs."""
+    AREA_FIELD = None
+
+    class Meta:
+        abstract = True
+
+    def update_area(self):
+        area = wkt_area_ha(self.shape, self._meta.label, self.pk)
+        if area is not None:
+            setattr(self, self.AREA_FIELD, area)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'shape' in update_fields:
+            self.update_area()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, self.AREA_FIELD}
+        super().save(*args, **kwargs)
+
 
 class Crop(models.Model):
     name = models.CharField(max_length=100)
@@ -21,13 +138,11 @@ class Company(models.Model):
     center = models.CharField(max_length=1000, null=True, blank=True)
     color = models.CharField(max_length=7, default="#0000FF")
 
+    objects = CompanyQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
-    @property
-    def region_count(self):
-        return self.regions.count()
-
 
 class Region(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='regions')
@@ -35,15 +150,13 @@ class Region(models.Model):
     center = models.CharField(max_length=1000, null=True, blank=True)
     color = models.CharField(max_length=7, default="#0000FF")
 
+    objects = RegionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} ({self.company.name})"
 
-    @property
-    def sector_count(self):
-        return self.sectors.count()
-
 
-class WaterwaySector(models.Model):
+class WaterwaySector(BoundingBox, SimplifiedShape, ShapeArea):
     region = models.ForeignKey(Region, on_delete=models.CASCADE, related_name='sectors')
     name = models.CharField(max_length=100)
     area_ha = models.FloatField(null=True, blank=True)
@@ -51,19 +164,24 @@ class WaterwaySector(models.Model):
     shape = models.TextField(null=True, blank=True)
     color = models.CharField(max_length=7, default="#0000FF")
 
+    objects = WaterwaySectorQuerySet.as_manager()
+
+    AREA_FIELD = 'area_ha'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['min_lon', 'min_lat'], name='sector_bbox_min_idx'),
+            models.Index(fields=['max_lon', 'max_lat'], name='sector_bbox_max_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name} ({self.region.name})"
 
-    @property
-    def total_plantation_area(self):
-        return sum(p.area for p in self.pivots.all()) + sum(f.area for f in self.fields.all())
-
-    @property
-    def plantation_count(self):
-        return self.pivots.count() + self.fields.count()
+    def compute_bbox(self):
+        return wkt_bbox(self.shape, self._meta.label, self.pk)
 
 
-class CropPivot(models.Model):
+class CropPivot(BoundingBox):
     sector = models.ForeignKey(WaterwaySector, on_delete=models.CASCADE, related_name='pivots')
     logical_name = models.CharField(max_length=10)
     area = models.FloatField()
@@ -71,14 +189,29 @@ class CropPivot(models.Model):
     seeding_date = models.DateField(null=True, blank=True)
     harvest_date = models.DateField(null=True, blank=True)
     center = models.CharField(max_length=1000, null=True, blank=True)
-    radius_m = models.FloatField(default=100.0)
+    # Bounded so one pivot cannot blow up the spatial index and tile cache (the largest center pivots span ~800 m).
+    radius_m = models.FloatField(default=100.0, validators=[MinValueValidator(1.0), MaxValueValidator(5000.0)])
     color = models.CharField(max_length=7, default="#008000")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sector', 'id'], name='pivot_sector_id_idx'),
+            # Covers the per-sector Count/Sum('area') subqueries with an index-only scan (Postgres).
+            models.Index(fields=['sector'], include=['area'], name='pivot_sector_area_cov'),
+            models.Index(fields=['seeding_date'], name='pivot_seeding_date_idx'),
+            models.Index(fields=['harvest_date'], name='pivot_harvest_date_idx'),
+            models.Index(fields=['min_lon', 'min_lat'], name='pivot_bbox_min_idx'),
+            models.Index(fields=['max_lon', 'max_lat'], name='pivot_bbox_max_idx'),
+        ]
+
     def __str__(self):
         return f"{self.logical_name} – {self.sector.name}"
 
+    def compute_bbox(self):
+        return circle_bbox(self.center, self.radius_m)
+
 
-class CropField(models.Model):
+class CropField(BoundingBox, SimplifiedShape, ShapeArea):
     sector = models.ForeignKey(WaterwaySector, on_delete=models.CASCADE, related_name='fields')
     logical_name = models.CharField(max_length=10)
     area = models.FloatField()
@@ -88,9 +221,24 @@ class CropField(models.Model):
     shape = models.TextField(null=True, blank=True)
     color = models.CharField(max_length=7, default="#000080")
 
+    AREA_FIELD = 'area'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sector', 'id'], name='field_sector_id_idx'),
+            models.Index(fields=['sector'], include=['area'], name='field_sector_area_cov'),
+            models.Index(fields=['seeding_date'], name='field_seeding_date_idx'),
+            models.Index(fields=['harvest_date'], name='field_harvest_date_idx'),
+            models.Index(fields=['min_lon', 'min_lat'], name='field_bbox_min_idx'),
+            models.Index(fields=['max_lon', 'max_lat'], name='field_bbox_max_idx'),
+        ]
+
     def __str__(self):
         return f"{self.logical_name} – {self.sector.name}"
 
+    def compute_bbox(self):
+        return wkt_bbox(self.shape, self._meta.label, self.pk)
+
 
 
 class CropRotation(models.Model):
@@ -99,12 +247,18 @@ class CropRotation(models.Model):
     sector = models.ForeignKey(WaterwaySector, on_delete=models.SET_NULL, null=True, related_name="sector_rotations")
     region = models.ForeignKey(Region, on_delete=models.SET_NULL, null=True, related_name="region_rotations")
     company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, related_name="company_rotations")
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="owned_rotations")
     year = models.PositiveIntegerField()
     notes = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ['-year']
         unique_together = ('pivot', 'field', 'year')
+        indexes = [
+            # Matches the list endpoint: owner = ? ORDER BY year DESC, id.
+            models.Index(fields=['owner', '-year', 'id'], name='rotation_owner_year_idx'),
+            models.Index(fields=['company', 'year'], name='rotation_company_year_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.pivot:
@@ -115,7 +269,10 @@ class CropRotation(models.Model):
             self.sector = self.field.sector
             self.region = self.field.sector.region
             self.company = self.field.sector.region.company
+        # Tenant key used to scope rotation and entry queries without walking the plot chain.
+        self.owner_id = self.company.owner_id if (self.pivot or self.field) else None
         super().save(*args, **kwargs)
+        self.entries.exclude(owner_id=self.owner_id).update(owner_id=self.owner_id)
 
     def __str__(self):
         name = self.pivot.logical_name if self.pivot else self.field.logical_name if self.field else "Unknown"
@@ -128,9 +285,61 @@ class CropRotationEntry(models.Model):
     harvest_date = models.DateField(null=True, blank=True)
     actual_yield_tons = models.FloatField(null=True, blank=True)
     expected_yield_tons = models.FloatField(null=True, blank=True)
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="owned_rotation_entries")
 
     class Meta:
+        # unique_together already provides the (rotation, crop) index.
         unique_together = ('rotation', 'crop')
+        indexes = [
+            models.Index(fields=['owner', 'id'], name='entry_owner_id_idx'),
+            models.Index(fields=['crop', 'rotation'], name='entry_crop_rotation_idx'),
+            models.Index(fields=['seeding_date'], name='entry_seeding_date_idx'),
+            models.Index(fields=['harvest_date'], name='entry_harvest_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.owner_id = self.rotation.owner_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.crop.name} ({self.rotation.year})"
+
+
+class SectorPlotRollup(models.Model):
+    """Pivot and field counts and hectares of one sector, kept current by api.rollups."""
+    sector = models.OneToOneField(WaterwaySector, on_delete=models.CASCADE, related_name='plot_rollup')
+    pivot_count = models.IntegerField(default=0)
+    pivot_area = models.FloatField(default=0)
+    field_count = models.IntegerField(default=0)
+    field_area = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.sector.name}: {self.pivot_count} pivots, {self.field_count} fields"
+
+
+class SectorYieldRollup(models.Model):
+    """Entry count and yield totals of one sector, year and crop, kept current by api.rollups."""
+    sector = models.ForeignKey(WaterwaySector, on_delete=models.CASCADE, related_name='yield_rollups')
+    year = models.PositiveIntegerField()
+    crop = models.ForeignKey(Crop, on_delete=models.CASCADE)
+    entry_count = models.IntegerField(default=0)
+    # Entries with an actual yield, the divisor of the mean.
+    actual_count = models.IntegerField(default=0)
+    actual_yield_tons = models.FloatField(default=0)
+    expected_yield_tons = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('sector', 'year', 'crop')
+
+    def __str__(self):
+        return f"{self.sector.name} {self.year}: {self.crop}"
+
+
+class TenantVersion(models.Model):
+    """Version stamp of a tenant's data (see api.caching), moved in the transaction of each write."""
+    # A user id, "global" for the shared crops, or "<user id>:<index>" for derived data.
+    tenant = models.CharField(max_length=64, primary_key=True)
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.tenant}: {self.version}"
@@ -0,0 +1,187 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on the full ordering tuple.
+
+    The cursor carries the ordering values of the boundary row, and the next
+    page is fetched with a lexicographic ``WHERE (a, b) > (x, y)`` filter
+    instead of an OFFSET, so page N costs the same as page 1. ``ordering``
+    must end with a unique column (normally ``id``) to make it total.
+    """
+    ordering = ('id',)
+    page_size = api_settings.PAGE_SIZE or 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        values, reverse = self.decode_cursor(request)
+
+        ordering = self.get_ordering(reverse)
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(ordering, values))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.next_values = self.previous_values = None
+        if self.page:
+            first, last = self.page[0], self.page[-1]
+            if reverse:
+                # Walking backwards, the cursor row itself follows this page.
+                self.next_values = self.row_values(last)
+                if has_more:
+                    self.previous_values = self.row_values(first)
+            else:
+                if has_more:
+                    self.next_values = self.row_values(last)
+                if values is not None:
+                    self.previous_values = self.row_values(first)
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': f'Number of results to return per page (max {self.max_page_size}).',
+                'schema': {'type': 'integer'},
+            },
+        ]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, reverse):
+        if not reverse:
+            return list(self.ordering)
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def seek_filter(self, ordering, values):
+        # (a > x) OR (a = x AND b > y) OR ..., with the comparison flipped for descending columns.
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def ordering_fields(self):
+        fields = []
+        for field in self.ordering:
+            model, parts = self.model, field.lstrip('-').split('__')
+            for part in parts[:-1]:
+                model = model._meta.get_field(part).related_model
+            fields.append(model._meta.get_field(parts[-1]))
+        return fields
+
+    def row_values(self, row):
+        values = []
+        for field in self.ordering:
+            value = row
+            for part in field.lstrip('-').split('__'):
+                value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values, reverse = payload['v'], bool(payload.get('r'))
+        except (binascii.Error, ValueError, KeyError, TypeError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # The cursor is client input: values must fit their columns before they reach the seek filter.
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        fields = self.ordering_fields()
+        try:
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+            for field, value in zip(fields, values):
+                field.run_validators(value)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_cursor(self, values, reverse):
+        payload = {'v': values}
+        if reverse:
+            payload['r'] = 1
+        raw = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return self.encode_cursor(self.next_values, reverse=False)
+
+    def get_previous_link(self):
+        if self.previous_values is None:
+            return None
+        return self.encode_cursor(self.previous_values, reverse=True)
+
+
+class CropRotationPagination(KeysetPagination):
+    ordering = ('-year', 'id')
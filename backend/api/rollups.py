@@ -0,0 +1,302 @@
+import math
+from collections import defaultdict
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import *
+
+PLOT_PREFIXES = {CropPivot: "pivot", CropField: "field"}
+PLOT_FIELDS = ("pivot_count", "pivot_area", "field_count", "field_area")
+YIELD_KEY = ("sector_id", "year", "crop_id")
+YIELD_FIELDS = ("entry_count", "actual_count", "actual_yield_tons", "expected_yield_tons")
+# Rows left without plots / entries are deleted rather than kept at zero.
+EMPTY_ROWS = {
+    SectorPlotRollup: Q(pivot_count__lte=0, field_count__lte=0),
+    SectorYieldRollup: Q(entry_count__lte=0),
+}
+COUNT_FIELDS = {"pivot_count", "field_count", "entry_count"}
+
+
+def plot_contribution(model, sector_id, area):
+    """``(rollup model, key, values)`` one pivot or field adds to its sector's row."""
+    if sector_id is None:
+        return None
+    prefix = PLOT_PREFIXES[model]
+    return SectorPlotRollup, (("sector_id", sector_id),), {f"{prefix}_count": 1, f"{prefix}_area": area or 0.0}
+
+
+def entry_contribution(sector_id, year, owner_id, crop_id, actual, expected):
+    """What one rotation entry adds to its (sector, year, crop) row."""
+    # Rotations orphaned by a plot deletion lose their owner and leave the totals.
+    if sector_id is None or owner_id is None:
+        return None
+    return SectorYieldRollup, (("sector_id", sector_id), ("year", year), ("crop_id", crop_id)), {
+        "entry_count": 1,
+        "actual_count": int(actual is not None),
+        "actual_yield_tons": actual or 0.0,
+        "expected_yield_tons": expected or 0.0,
+    }
+
+
+def contribution(instance):
+    """The rollup contribution of a pivot, field or entry as it is in memory."""
+    if isinstance(instance, (CropPivot, CropField)):
+        return plot_contribution(type(instance), instance.sector_id, instance.area)
+    try:
+        rotation = instance.rotation
+    except ObjectDoesNotExist:
+        return None
+    return entry_contribution(
+        rotation.sector_id, rotation.year, rotation.owner_id,
+        instance.crop_id, instance.actual_yield_tons, instance.expected_yield_tons,
+    )
+
+
+def stored_contribution(instance):
+    """The contribution of the row ``instance`` will overwrite, read before it is saved."""
+    if instance._state.adding or instance.pk is None:
+        return None
+    rows = type(instance).objects.filter(pk=instance.pk)
+    if isinstance(instance, (CropPivot, CropField)):
+        row = rows.values_list("sector_id", "area").first()
+        return plot_contribution(type(instance), *row) if row else None
+    row = rows.values_list(
+        "rotation__sector_id", "rotation__year", "rotation__owner_id",
+        "crop_id", "actual_yield_tons", "expected_yield_tons",
+    ).first()
+    return entry_contribution(*row) if row else None
+
+
+class RollupDeltas:
+    """
+    Net changes to rollup rows, summed in memory and written with one UPDATE per row.
+
+    Adding a plot's old contribution with ``sign=-1`` and its new one with
+    ``sign=1`` cancels out when nothing the rollups count has changed, so
+    such saves write nothing.
+    """
+
+    def __init__(self):
+        self.changes = defaultdict(lambda: defaultdict(int))
+
+    def add(self, contribution, sign=1):
+        if contribution is not None:
+            model, key, values = contribution
+            row = self.changes[(model, key)]
+            for field, value in values.items():
+                row[field] += sign * value
+
+    def apply(self):
+        for (model, key), values in self.changes.items():
+            deltas = {field: value for field, value in values.items() if value}
+            if deltas:
+                _apply(model, dict(key), deltas)
+        self.changes.clear()
+
+
+def _apply(model, key, deltas):
+    rows = model.objects.filter(**key)
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if rows.update(**changes):
+        if any(deltas.get(field, 0) < 0 for field in COUNT_FIELDS):
+            rows.filter(EMPTY_ROWS[model]).delete()
+        return
+    if any(delta < 0 for delta in deltas.values()):
+        # Subtracting from a row that is gone (deleted in the same cascade, or drift
+        # that rebuild_rollups will fix); never create negative totals.
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Another writer created the row after our UPDATE found nothing.
+        rows.update(**changes)
+
+
+def record_change(instance, deleted=False):
+    """Move a saved or deleted pivot, field or entry from its stored contribution to its new one."""
+    deltas = RollupDeltas()
+    if deleted:
+        deltas.add(contribution(instance), -1)
+    else:
+        # Set by the pre_save handler.
+        deltas.add(getattr(instance, "rollup_loaded", None), -1)
+        deltas.add(contribution(instance))
+    deltas.apply()
+
+
+def stored_rotation_key(rotation):
+    """``(sector_id, year, owner_id)`` of a rotation as stored, or None for a new one."""
+    if rotation._state.adding or rotation.pk is None:
+        return None
+    return CropRotation.objects.filter(pk=rotation.pk).values_list("sector_id", "year", "owner_id").first()
+
+
+def _entry_sums(entries, *group_by):
+    rows = entries.values(*group_by).annotate(
+        rollup_entries=Count("id"),
+        rollup_actual_count=Count("actual_yield_tons"),
+        rollup_actual=Sum("actual_yield_tons"),
+        rollup_expected=Sum("expected_yield_tons"),
+    ).order_by()
+    for row in rows:
+        yield [row[column] for column in group_by], {
+            "entry_count": row["rollup_entries"],
+            "actual_count": row["rollup_actual_count"],
+            "actual_yield_tons": row["rollup_actual"] or 0.0,
+            "expected_yield_tons": row["rollup_expected"] or 0.0,
+        }
+
+
+def move_rotation(rotation, old):
+    """
+    Re-key a rotation's entries after its sector, year or owner changed.
+
+    ``old`` is ``(sector_id, year, owner_id)`` as stored before the save.
+    """
+    new = (rotation.sector_id, rotation.year, rotation.owner_id)
+    if old is None or old == new:
+        return
+    deltas = RollupDeltas()
+    for (crop_id,), values in _entry_sums(rotation.entries.all(), "crop_id"):
+        for (sector_id, year, owner_id), sign in ((old, -1), (new, 1)):
+            if sector_id is not None and owner_id is not None:
+                deltas.add((SectorYieldRollup, (("sector_id", sector_id), ("year", year), ("crop_id", crop_id)), values), sign)
+    deltas.apply()
+
+
+def detach_rotations(rotations):
+    """Take the entries of rotations about to be orphaned out of the totals."""
+    deltas = RollupDeltas()
+    entries = CropRotationEntry.objects.filter(rotation__in=rotations, rotation__owner__isnull=False)
+    for key, values in _entry_sums(entries, "rotation__sector_id", "rotation__year", "crop_id"):
+        if key[0] is not None:
+            deltas.add((SectorYieldRollup, tuple(zip(YIELD_KEY, key)), values), -1)
+    deltas.apply()
+
+
+def _plot_totals(sector_filter):
+    totals = {}
+    for model, prefix in PLOT_PREFIXES.items():
+        rows = model.objects.filter(**sector_filter).values("sector_id").annotate(
+            rollup_count=Count("id"), rollup_area=Sum("area"),
+        ).order_by()
+        for row in rows:
+            values = totals.setdefault((row["sector_id"],), dict.fromkeys(PLOT_FIELDS, 0))
+            values[f"{prefix}_count"] = row["rollup_count"]
+            values[f"{prefix}_area"] = row["rollup_area"] or 0.0
+    return totals
+
+
+def _yield_totals(entry_filter):
+    entries = CropRotationEntry.objects.filter(
+        rotation__owner__isnull=False, rotation__sector__isnull=False, **entry_filter
+    )
+    return {
+        tuple(key): values
+        for key, values in _entry_sums(entries, "rotation__sector_id", "rotation__year", "crop_id")
+    }
+
+
+def _reconcile(model, rows, totals, key_fields, value_fields):
+    """Make the rollup ``rows`` equal ``totals`` ({key: values}); returns how many rows were wrong."""
+    existing = {tuple(getattr(row, field) for field in key_fields): row for row in rows}
+    stale = [row.pk for key, row in existing.items() if key not in totals]
+    changed, missing = [], []
+    for key, values in totals.items():
+        row = existing.get(key)
+        if row is None:
+            missing.append(model(**dict(zip(key_fields, key)), **values))
+        elif any(not math.isclose(getattr(row, field), values[field], rel_tol=1e-9, abs_tol=1e-9)
+                 for field in value_fields):
+            for field in value_fields:
+                setattr(row, field, values[field])
+            changed.append(row)
+    with transaction.atomic():
+        model.objects.filter(pk__in=stale).delete()
+        model.objects.bulk_update(changed, value_fields, batch_size=500)
+        model.objects.bulk_create(missing, batch_size=500)
+    return len(stale) + len(changed) + len(missing)
+
+
+def rebuild(owner_id):
+    """
+    Recompute one tenant's rollups from its plots and entries.
+
+    Writes that bypass the signals (queryset updates, bulk_update in
+    management commands) leave the delta-maintained rows behind; this puts
+    them back. Returns the number of rollup rows that were wrong.
+    """
+    sector_filter = {"sector__region__company__owner_id": owner_id}
+    drift = _reconcile(
+        SectorPlotRollup, SectorPlotRollup.objects.filter(**sector_filter),
+        _plot_totals(sector_filter), ("sector_id",), PLOT_FIELDS,
+    )
+    drift += _reconcile(
+        SectorYieldRollup, SectorYieldRollup.objects.filter(**sector_filter),
+        _yield_totals({"rotation__owner_id": owner_id}), YIELD_KEY, YIELD_FIELDS,
+    )
+    return drift
+
+
+def _totals_row(row=None):
+    row = row or {}
+    return {
+        "pivot_count": row.get("pivots") or 0,
+        "pivot_area": row.get("pivot_area") or 0.0,
+        "field_count": row.get("fields") or 0,
+        "field_area": row.get("field_area") or 0.0,
+        "years": [],
+    }
+
+
+def _year_rows(user, group):
+    rows = SectorYieldRollup.objects.filter(sector__region__company__owner=user).values(group, "year").annotate(
+        entries=Sum("entry_count"), actual_count=Sum("actual_count"), crops=Count("crop", distinct=True),
+        actual=Sum("actual_yield_tons"), expected=Sum("expected_yield_tons"),
+    ).order_by(group, "year")
+    for row in rows:
+        yield row[group], {
+            "year": row["year"],
+            "entry_count": row["entries"],
+            "crop_count": row["crops"],
+            "actual_yield_tons": row["actual"],
+            "expected_yield_tons": row["expected"],
+            "actual_yield_avg": row["actual"] / row["actual_count"] if row["actual_count"] else None,
+        }
+
+
+def dashboard(user):
+    """
+    Per-company and per-region plot totals and yield by year, read from the rollups.
+
+    A fixed number of queries over rollup rows (one per sector, or per sector,
+    year and crop), however many plots and entries the tenant has.
+    """
+    plot_sums = dict(pivots=Sum("pivot_count"), pivot_area=Sum("pivot_area"),
+                     fields=Sum("field_count"), field_area=Sum("field_area"))
+    plots = SectorPlotRollup.objects.filter(sector__region__company__owner=user)
+    by_region = {row["sector__region"]: row for row in plots.values("sector__region").annotate(**plot_sums).order_by()}
+    by_company = {
+        row["sector__region__company"]: row
+        for row in plots.values("sector__region__company").annotate(**plot_sums).order_by()
+    }
+
+    # Companies come first so those without regions yet are listed too.
+    companies = {
+        company["id"]: {**company, **_totals_row(by_company.get(company["id"])), "regions": []}
+        for company in Company.objects.filter(owner=user).order_by("name").values("id", "name")
+    }
+    regions = Region.objects.filter(company__owner=user).order_by("name").values("id", "name", "company_id")
+    for region in regions:
+        companies[region["company_id"]]["regions"].append({
+            "id": region["id"], "name": region["name"], **_totals_row(by_region.get(region["id"])),
+        })
+    regions_by_id = {region["id"]: region for company in companies.values() for region in company["regions"]}
+    for region_id, year in _year_rows(user, "sector__region"):
+        regions_by_id[region_id]["years"].append(year)
+    for company_id, year in _year_rows(user, "sector__region__company"):
+        companies[company_id]["years"].append(year)
+    return {"companies": list(companies.values())}
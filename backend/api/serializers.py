@@ -3,6 +3,63 @@ from .models import *
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.core.exceptions import PermissionDenied
+from django.conf import settings
+from . import spatial
+from .conflicts import ConflictChecker, conflict_messages, plot_values
+from .geometry import cached_geometry, select_lod
+
+def validate_wkt(serializer, value, kinds, message):
+    """Reject WKT that does not parse to one of ``kinds``; the parse is cached for the save that follows."""
+    if not value:
+        return value
+    pk = serializer.instance.pk if serializer.instance is not None else None
+    geometry = cached_geometry(serializer.Meta.model._meta.label, pk, value)
+    if geometry is None or geometry.kind not in kinds:
+        raise serializers.ValidationError(message)
+    return value
+
+
+class SimplifiedShapeMixin:
+    """Return the stored simplification of ``shape`` for the ``zoom`` in the serializer context."""
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        zoom = self.context.get("zoom")
+        if zoom is not None:
+            data["shape"] = select_lod(data["shape"], instance.shape_lod, zoom)
+        return data
+
+
+class SectorAssignmentMixin:
+    """On create without ``sector_id``, use the tenant's sector whose shape contains the plot's center/centroid."""
+    plot_layer = None
+    geometry_columns = ()
+
+    def validate(self, data):
+        data = super().validate(data)
+        if self.instance is None and "sector" not in data:
+            index = spatial.get_index(self.context["request"].user.pk)
+            sector_id, error = spatial.assign_sector(index, self.plot_layer, data.get(self.geometry_columns[0]))
+            if error:
+                raise serializers.ValidationError({"sector_id": [error]})
+            data["sector"] = WaterwaySector.objects.get(pk=sector_id)
+        return data
+
+
+class PlotConflictMixin:
+    """Reject plots that overlap another plot or leave their sector, when PLOT_CONFLICT_CHECK is on."""
+
+    def validate(self, data):
+        data = super().validate(data)
+        if not settings.PLOT_CONFLICT_CHECK:
+            return data
+        values = plot_values(self.Meta.model, self.geometry_columns, data, self.instance)
+        sector = data.get("sector") or self.instance.sector
+        key = self.instance.pk if self.instance is not None else None
+        problems = ConflictChecker(self.context["request"].user.pk).conflicts(self.plot_layer, key, values, sector.pk)
+        if problems:
+            raise serializers.ValidationError(conflict_messages(problems))
+        return data
 
 # JWT Token Serializer
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -32,7 +89,7 @@ class UserSerializer(serializers.ModelSerializer):
 # Company Serializer
 class CompanySerializer(serializers.ModelSerializer):
     owner = serializers.ReadOnlyField(source='owner.username')
-    region_count = serializers.ReadOnlyField()
+    region_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Company
@@ -53,7 +110,7 @@ class RegionSerializer(serializers.ModelSerializer):
     company_id = serializers.PrimaryKeyRelatedField(
         queryset=Company.objects.all(), source='company'
     )
-    sector_count = serializers.ReadOnlyField()
+    sector_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Region
@@ -65,13 +122,13 @@ class RegionSerializer(serializers.ModelSerializer):
         return company
 
 # Waterway Sector Serializer
-class WaterwaySectorSerializer(serializers.ModelSerializer):
+class WaterwaySectorSerializer(SimplifiedShapeMixin, serializers.ModelSerializer):
     region = serializers.ReadOnlyField(source='region.name')
     region_id = serializers.PrimaryKeyRelatedField(
         queryset=Region.objects.all(), source='region'
     )
-    plantation_count = serializers.ReadOnlyField()
-    total_plantation_area = serializers.ReadOnlyField()
+    plantation_count = serializers.IntegerField(read_only=True)
+    total_plantation_area = serializers.FloatField(read_only=True)
 
     class Meta:
         model = WaterwaySector
@@ -85,6 +142,9 @@ class WaterwaySectorSerializer(serializers.ModelSerializer):
             raise PermissionDenied("You do not own the company of this region.")
         return region
 
+    def validate_shape(self, value):
+        return validate_wkt(self, value, ("POLYGON", "MULTIPOLYGON"), "Shape must be a WKT POLYGON or MULTIPOLYGON.")
+
 # Crop Serializer
 class CropSerializer(serializers.ModelSerializer):
     class Meta:
@@ -92,10 +152,12 @@ class CropSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "subtype", "best_season"]
 
 # CropPivot Serializer
-class CropPivotSerializer(serializers.ModelSerializer):
+class CropPivotSerializer(PlotConflictMixin, SectorAssignmentMixin, serializers.ModelSerializer):
+    plot_layer = "pivots"
+    geometry_columns = ("center", "radius_m")
     sector = serializers.ReadOnlyField(source='sector.name')
     sector_id = serializers.PrimaryKeyRelatedField(
-        queryset=WaterwaySector.objects.all(), source='sector'
+        queryset=WaterwaySector.objects.select_related('region__company'), source='sector', required=False
     )
     crops = CropSerializer(many=True, read_only=True)
     crop_ids = serializers.PrimaryKeyRelatedField(
@@ -115,11 +177,16 @@ class CropPivotSerializer(serializers.ModelSerializer):
             raise PermissionDenied("You do not own this sector's company.")
         return sector
 
+    def validate_center(self, value):
+        return validate_wkt(self, value, ("POINT",), "Center must be a WKT POINT.")
+
 # CropField Serializer
-class CropFieldSerializer(serializers.ModelSerializer):
+class CropFieldSerializer(PlotConflictMixin, SectorAssignmentMixin, SimplifiedShapeMixin, serializers.ModelSerializer):
+    plot_layer = "fields"
+    geometry_columns = ("shape",)
     sector = serializers.ReadOnlyField(source='sector.name')
     sector_id = serializers.PrimaryKeyRelatedField(
-        queryset=WaterwaySector.objects.all(), source='sector'
+        queryset=WaterwaySector.objects.select_related('region__company'), source='sector', required=False
     )
     crops = CropSerializer(many=True, read_only=True)
     crop_ids = serializers.PrimaryKeyRelatedField(
@@ -139,6 +206,9 @@ class CropFieldSerializer(serializers.ModelSerializer):
             raise PermissionDenied("You do not own this sector's company.")
         return sector
 
+    def validate_shape(self, value):
+        return validate_wkt(self, value, ("POLYGON", "MULTIPOLYGON"), "Shape must be a WKT POLYGON or MULTIPOLYGON.")
+
 # CropRotationEntry (Nested in Rotation)
 class CropRotationEntrySerializer(serializers.ModelSerializer):
     crop = CropSerializer(read_only=True)
@@ -158,15 +228,8 @@ class CropRotationEntrySerializer(serializers.ModelSerializer):
         ]
 
     def validate_rotation(self, rotation):
-        request = self.context["request"]
-        user = request.user
-
-        if rotation.pivot and rotation.pivot.sector.region.company.owner != user:
-            raise PermissionDenied("You do not own this rotation's pivot's company.")
-
-        if rotation.field and rotation.field.sector.region.company.owner != user:
-            raise PermissionDenied("You do not own this rotation's field's company.")
-
+        if rotation.owner_id != self.context["request"].user.pk:
+            raise PermissionDenied("You do not own this rotation's company.")
         return rotation
 
 
@@ -197,3 +260,11 @@ class CropRotationSerializer(serializers.ModelSerializer):
         if field and field.sector.region.company.owner != self.context["request"].user:
             raise PermissionDenied("You do not own the field's company.")
         return field
+
+
+# Query parameters of the yield analytics endpoint
+class YieldAnalyticsFilterSerializer(serializers.Serializer):
+    # Bounded so oversized values are a 400 rather than an integer overflow in the database driver.
+    year_from = serializers.IntegerField(min_value=0, max_value=9999, required=False, allow_null=True)
+    year_to = serializers.IntegerField(min_value=0, max_value=9999, required=False, allow_null=True)
+    crop = serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1, required=False, allow_null=True)
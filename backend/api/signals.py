@@ -0,0 +1,108 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import rollups, spatial, tiles
+from .caching import GLOBAL_TENANT, bump_tenant_version, tenant_owner_id
+from .models import *
+
+TENANT_MODELS = (Company, Region, WaterwaySector, CropPivot, CropField, CropRotation, CropRotationEntry)
+
+
+@receiver(pre_delete, sender=CropPivot)
+@receiver(pre_delete, sender=CropField)
+def detach_plot_rotations(sender, instance, **kwargs):
+    # The plot FK on rotations is SET_NULL; drop the tenant key as well so orphaned
+    # rotations stay hidden, as they were when scoping walked the plot chain.
+    plot = 'pivot' if sender is CropPivot else 'field'
+    rotations = CropRotation.objects.filter(**{plot: instance})
+    rollups.detach_rotations(rotations)
+    CropRotationEntry.objects.filter(rotation__in=rotations).update(owner=None)
+    rotations.update(owner=None)
+
+
+def invalidate_tenant(sender, instance, **kwargs):
+    bump_tenant_version(tenant_owner_id(instance))
+
+
+def invalidate_crops(sender, instance, **kwargs):
+    bump_tenant_version(GLOBAL_TENANT)
+
+
+def invalidate_plot_crops(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        bump_tenant_version(tenant_owner_id(instance))
+    elif pk_set:
+        # crop.croppivot_set.add(...): the plots named in pk_set carry the tenant.
+        owners = model.objects.filter(pk__in=pk_set).values_list('sector__region__company__owner', flat=True)
+        for owner_id in set(owners):
+            bump_tenant_version(owner_id)
+    else:
+        bump_tenant_version(GLOBAL_TENANT)
+
+
+for model in TENANT_MODELS:
+    post_save.connect(invalidate_tenant, sender=model, dispatch_uid=f"invalidate-{model.__name__}-save")
+    post_delete.connect(invalidate_tenant, sender=model, dispatch_uid=f"invalidate-{model.__name__}-delete")
+
+for through in (CropPivot.crops.through, CropField.crops.through):
+    m2m_changed.connect(invalidate_plot_crops, sender=through, dispatch_uid=f"invalidate-{through.__name__}")
+
+post_save.connect(invalidate_crops, sender=Crop, dispatch_uid="invalidate-Crop-save")
+post_delete.connect(invalidate_crops, sender=Crop, dispatch_uid="invalidate-Crop-delete")
+
+
+def refresh_spatial_index(sender, instance, signal, **kwargs):
+    spatial.refresh_instance(instance, deleted=signal is post_delete)
+
+
+for model in (WaterwaySector, CropField, CropPivot):
+    post_save.connect(refresh_spatial_index, sender=model, dispatch_uid=f"spatial-{model.__name__}-save")
+    post_delete.connect(refresh_spatial_index, sender=model, dispatch_uid=f"spatial-{model.__name__}-delete")
+
+
+def invalidate_plot_tiles(sender, instance, **kwargs):
+    owner_id = tenant_owner_id(instance)
+    for bbox in {getattr(instance, 'loaded_bbox', None), instance.bbox}:
+        tiles.invalidate_tiles(owner_id, bbox)
+    instance.loaded_bbox = instance.bbox
+
+
+def clear_tenant_tiles(sender, instance, **kwargs):
+    owner_id = tenant_owner_id(instance)
+    if owner_id is not None:
+        tiles.clear_tiles(owner_id)
+
+
+for model in (WaterwaySector, CropPivot, CropField):
+    post_save.connect(invalidate_plot_tiles, sender=model, dispatch_uid=f"tiles-{model.__name__}-save")
+    post_delete.connect(invalidate_plot_tiles, sender=model, dispatch_uid=f"tiles-{model.__name__}-delete")
+
+for model in (Company, Region):
+    post_delete.connect(clear_tenant_tiles, sender=model, dispatch_uid=f"tiles-{model.__name__}-delete")
+
+
+def remember_rollup_contribution(sender, instance, **kwargs):
+    instance.rollup_loaded = rollups.stored_contribution(instance)
+
+
+def update_rollups(sender, instance, signal, **kwargs):
+    rollups.record_change(instance, deleted=signal is post_delete)
+
+
+def remember_rotation_key(sender, instance, **kwargs):
+    instance.rollup_key = rollups.stored_rotation_key(instance)
+
+
+def move_rotation_rollups(sender, instance, **kwargs):
+    rollups.move_rotation(instance, getattr(instance, 'rollup_key', None))
+
+
+for model in (CropPivot, CropField, CropRotationEntry):
+    pre_save.connect(remember_rollup_contribution, sender=model, dispatch_uid=f"rollups-{model.__name__}-pre-save")
+    post_save.connect(update_rollups, sender=model, dispatch_uid=f"rollups-{model.__name__}-save")
+    post_delete.connect(update_rollups, sender=model, dispatch_uid=f"rollups-{model.__name__}-delete")
+
+pre_save.connect(remember_rotation_key, sender=CropRotation, dispatch_uid="rollups-CropRotation-pre-save")
+post_save.connect(move_rotation_rollups, sender=CropRotation, dispatch_uid="rollups-CropRotation-save")
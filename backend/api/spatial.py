@@ -0,0 +1,349 @@
+import heapq
+import math
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+
+from .caching import bump_tenant_version, get_tenant_version, tenant_owner_id
+from .geometry import bboxes_intersect, cached_geometry, point_in_polygons, polygons_intersect
+from .models import *
+
+# layer -> (model, owner lookup, geometry columns). Polygon layers index their rings,
+# pivots their (lon, lat, radius_m) circle.
+LAYERS = {
+    "sectors": (WaterwaySector, "region__company__owner", ("shape",)),
+    "fields": (CropField, "sector__region__company__owner", ("shape",)),
+    "pivots": (CropPivot, "sector__region__company__owner", ("center", "radius_m")),
+}
+POLYGON_LAYERS = ("sectors", "fields")
+
+
+class GridIndex:
+    """
+    Uniform-grid spatial hash over bounding boxes with exact polygon predicates.
+
+    Every item is registered in each cell its bbox touches, so a point
+    lookup reads one cell and a bbox lookup reads only the covered cells;
+    exact point-in-polygon / intersection tests run on those candidates only.
+    Items spanning more than ``MAX_ITEM_CELLS`` cells are kept in a list
+    scanned on every lookup instead, so one huge bbox cannot fill memory.
+    """
+    MAX_ITEM_CELLS = 4096
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = defaultdict(set)
+        self.items = {}
+        self.oversized = set()
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell_range(self, bbox):
+        size = self.cell_size
+        return (
+            range(math.floor(bbox[0] / size), math.floor(bbox[2] / size) + 1),
+            range(math.floor(bbox[1] / size), math.floor(bbox[3] / size) + 1),
+        )
+
+    def insert(self, key, bbox, shape):
+        self.remove(key)
+        self.items[key] = (bbox, shape)
+        xs, ys = self._cell_range(bbox)
+        if len(xs) * len(ys) > self.MAX_ITEM_CELLS:
+            self.oversized.add(key)
+            return
+        for x in xs:
+            for y in ys:
+                self.cells[(x, y)].add(key)
+
+    def remove(self, key):
+        entry = self.items.pop(key, None)
+        if entry is None:
+            return
+        if key in self.oversized:
+            self.oversized.discard(key)
+            return
+        xs, ys = self._cell_range(entry[0])
+        for x in xs:
+            for y in ys:
+                cell = self.cells.get((x, y))
+                if cell is not None:
+                    cell.discard(key)
+                    if not cell:
+                        del self.cells[(x, y)]
+
+    def candidates(self, bbox):
+        xs, ys = self._cell_range(bbox)
+        if len(xs) * len(ys) > len(self.items):
+            # Query wider than the data: a straight scan beats walking empty cells.
+            keys = self.items.keys()
+        else:
+            keys = set(self.oversized)
+            for x in xs:
+                for y in ys:
+                    keys |= self.cells.get((x, y), set())
+        return [key for key in keys if bboxes_intersect(self.items[key][0], bbox)]
+
+    def query_bbox(self, bbox):
+        return sorted(self.candidates(bbox))
+
+    def query_point(self, x, y):
+        return sorted(
+            key for key in self.candidates((x, y, x, y))
+            if point_in_polygons(x, y, self.items[key][1])
+        )
+
+    def query_polygons(self, polygons):
+        points = [point for rings in polygons for ring in rings for point in ring]
+        if not points:
+            return []
+        xs, ys = zip(*points)
+        bbox = (min(xs), min(ys), max(xs), max(ys))
+        return sorted(
+            key for key in self.candidates(bbox)
+            if polygons_intersect(polygons, self.items[key][1])
+        )
+
+
+EARTH_MEAN_RADIUS_M = 6_371_008.8
+
+
+def _unit_vector(lon, lat):
+    lon, lat = math.radians(lon), math.radians(lat)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+class PointKDTree:
+    """
+    KD-tree over points on the sphere, for k-nearest and radius queries.
+
+    Points are stored as 3D unit vectors, where straight-line (chord)
+    distance grows monotonically with great-circle distance, so the usual
+    axis-aligned pruning is exact and results are haversine distances.
+    The balanced tree is rebuilt only when enough edits piled up: new or
+    moved points wait in a small side table and removed ones are tombstoned.
+    """
+
+    def __init__(self, points=None):
+        self.build(points or {})
+
+    def __len__(self):
+        return len(self.keys) - len(self.tombstones) + len(self.side)
+
+    def build(self, points):
+        self.keys = list(points)
+        self.xyz = [points[key] for key in self.keys]
+        self.positions = {key: i for i, key in enumerate(self.keys)}
+        self.side = {}
+        self.tombstones = set()
+        # order[lo:hi] is a subtree whose root is its middle element, split on axis depth % 3.
+        self.order = list(range(len(self.keys)))
+        stack = [(0, len(self.order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo < 2:
+                continue
+            axis = depth % 3
+            self.order[lo:hi] = sorted(self.order[lo:hi], key=lambda i: self.xyz[i][axis])
+            middle = (lo + hi) // 2
+            stack += [(lo, middle, depth + 1), (middle + 1, hi, depth + 1)]
+
+    def put(self, key, lon, lat):
+        if key in self.positions:
+            self.tombstones.add(key)
+        self.side[key] = _unit_vector(lon, lat)
+        self._maybe_rebuild()
+
+    def remove(self, key):
+        self.side.pop(key, None)
+        if key in self.positions:
+            self.tombstones.add(key)
+        self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        if len(self.side) + len(self.tombstones) > 64 + len(self.keys) // 8:
+            points = {key: self.xyz[i] for key, i in self.positions.items() if key not in self.tombstones}
+            points.update(self.side)
+            self.build(points)
+
+    def nearest(self, lon, lat, k, max_m=None):
+        """Up to ``k`` ``(distance_m, key)`` pairs, nearest first, optionally within ``max_m`` metres."""
+        query = _unit_vector(lon, lat)
+        bound = math.inf
+        if max_m is not None:
+            bound = (2 * math.sin(min(max_m / EARTH_MEAN_RADIUS_M, math.pi) / 2)) ** 2
+        heap = []  # (-squared chord, key): the worst kept candidate is on top
+
+        def worst():
+            return bound if len(heap) < k else min(bound, -heap[0][0])
+
+        def consider(key, point):
+            distance = (point[0] - query[0]) ** 2 + (point[1] - query[1]) ** 2 + (point[2] - query[2]) ** 2
+            if distance <= worst():
+                heapq.heappush(heap, (-distance, key))
+                if len(heap) > k:
+                    heapq.heappop(heap)
+
+        for key, point in self.side.items():
+            consider(key, point)
+        stack = [(0, len(self.order), 0, 0.0)]
+        while stack:
+            lo, hi, depth, gap = stack.pop()
+            if lo >= hi or gap > worst():
+                continue
+            middle = (lo + hi) // 2
+            i = self.order[middle]
+            if self.keys[i] not in self.tombstones:
+                consider(self.keys[i], self.xyz[i])
+            diff = query[depth % 3] - self.xyz[i][depth % 3]
+            near, far = ((lo, middle), (middle + 1, hi)) if diff < 0 else ((middle + 1, hi), (lo, middle))
+            # The far side is pushed first so the near side is searched first and tightens worst().
+            stack.append((*far, depth + 1, diff * diff))
+            stack.append((*near, depth + 1, 0.0))
+        return sorted(
+            (2 * EARTH_MEAN_RADIUS_M * math.asin(min(1.0, math.sqrt(-distance) / 2)), key) for distance, key in heap
+        )
+
+
+class TenantSpatialIndex:
+    def __init__(self, owner_id, version):
+        self.owner_id = owner_id
+        self.version = version
+        self.layers = {layer: GridIndex(settings.SPATIAL_INDEX_CELL_DEGREES) for layer in LAYERS}
+        self._pivot_tree = None
+
+    @property
+    def pivot_tree(self):
+        """KD-tree of pivot centers, built from the already parsed pivot layer on first use."""
+        if self._pivot_tree is None:
+            self._pivot_tree = PointKDTree({
+                pk: _unit_vector(circle[0], circle[1]) for pk, (_, circle) in self.layers["pivots"].items.items()
+            })
+        return self._pivot_tree
+
+    def load(self):
+        for layer, (model, owner_lookup, columns) in LAYERS.items():
+            rows = model.objects.filter(**{owner_lookup: self.owner_id, "min_lon__isnull": False}).values_list(
+                "pk", "min_lon", "min_lat", "max_lon", "max_lat", *columns
+            )
+            for pk, *values in rows.iterator(chunk_size=2000):
+                self.put(layer, pk, values[4:], values[:4])
+        return self
+
+    def put(self, layer, pk, values, bbox):
+        shape = index_shape(layer, pk, values)
+        if not shape or None in bbox:
+            self.remove(layer, pk)
+            return
+        self.layers[layer].insert(pk, tuple(bbox), shape)
+        if layer == "pivots" and self._pivot_tree is not None:
+            self._pivot_tree.put(pk, shape[0], shape[1])
+
+    def remove(self, layer, pk):
+        self.layers[layer].remove(pk)
+        if layer == "pivots" and self._pivot_tree is not None:
+            self._pivot_tree.remove(pk)
+
+
+def index_shape(layer, pk, values):
+    """What the index stores for a row: polygons, or a ``(lon, lat, radius_m)`` circle for pivots."""
+    geometry = cached_geometry(LAYERS[layer][0]._meta.label, pk, values[0])
+    if geometry is None:
+        return None
+    if layer == "pivots":
+        if geometry.kind != "POINT":
+            return None
+        return geometry.coords[0], geometry.coords[1], values[1] or 0.0
+    return geometry.polygons()
+
+
+def plot_point(layer, pk, wkt):
+    """The point a plot is located by: a pivot's center, a field's centroid; None if unparseable."""
+    geometry = cached_geometry(LAYERS[layer][0]._meta.label, pk, wkt)
+    if geometry is None:
+        return None
+    if layer == "pivots":
+        return (geometry.coords[0], geometry.coords[1]) if geometry.kind == "POINT" else None
+    return geometry.centroid if geometry.kind in ("POLYGON", "MULTIPOLYGON") else None
+
+
+def containing_sectors(index, layer, pk, wkt):
+    """Ids of the tenant's sectors whose shape contains the plot's point (see ``plot_point``)."""
+    point = plot_point(layer, pk, wkt)
+    if point is None:
+        return []
+    return index.layers["sectors"].query_point(*point)
+
+
+def assign_sector(index, layer, wkt):
+    """``(sector_id, None)`` for the one sector containing the plot, else ``(None, error message)``."""
+    sector_ids = containing_sectors(index, layer, None, wkt)
+    if len(sector_ids) == 1:
+        return sector_ids[0], None
+    if not sector_ids:
+        return None, "No sector contains this plot; pass sector_id."
+    return None, f"Several sectors contain this plot ({', '.join(map(str, sector_ids))}); pass sector_id."
+
+
+_lock = threading.RLock()
+_indexes = OrderedDict()
+
+
+def _version_tenant(owner_id):
+    return f"{owner_id}:spatial"
+
+
+def get_index(owner_id):
+    """
+    Return the tenant's index, rebuilding it when its version is stale.
+
+    Writes in this process patch the cached index in place (see
+    ``refresh_instance``); a version moved by another process forces a rebuild.
+    """
+    version = get_tenant_version(_version_tenant(owner_id))
+    with _lock:
+        index = _indexes.get(owner_id)
+        if index is None or index.version != version:
+            index = TenantSpatialIndex(owner_id, version).load()
+            _indexes[owner_id] = index
+        _indexes.move_to_end(owner_id)
+        while len(_indexes) > settings.SPATIAL_INDEX_MAX_TENANTS:
+            _indexes.popitem(last=False)
+        return index
+
+
+def nearest_pivots(owner_id, lon, lat, k, max_m=None):
+    """``(distance_m, pivot_id)`` of the tenant's ``k`` nearest pivots to a point."""
+    index = get_index(owner_id)
+    with _lock:
+        return index.pivot_tree.nearest(lon, lat, k, max_m)
+
+
+def invalidate(owner_id):
+    """Force a rebuild on next use, e.g. after bulk writes that bypass model signals."""
+    with _lock:
+        _indexes.pop(owner_id, None)
+    bump_tenant_version(_version_tenant(owner_id))
+
+
+def refresh_instance(instance, deleted=False):
+    """Apply one saved or deleted sector, field or pivot to its tenant's cached index."""
+    layer = next(name for name, (model, _, _) in LAYERS.items() if isinstance(instance, model))
+    owner_id = tenant_owner_id(instance)
+    if owner_id is None:
+        return
+    with _lock:
+        index = _indexes.get(owner_id)
+        current = index is not None and index.version == get_tenant_version(_version_tenant(owner_id))
+        if current:
+            if deleted:
+                index.remove(layer, instance.pk)
+            else:
+                index.put(layer, instance.pk, [getattr(instance, column) for column in LAYERS[layer][2]], instance.bbox)
+        version = bump_tenant_version(_version_tenant(owner_id))
+        if current:
+            index.version = version
+        else:
+            _indexes.pop(owner_id, None)
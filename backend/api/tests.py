@@ -1,3 +1,1089 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import *
+
+TILE_CACHE_DIR = os.path.join(tempfile.gettempdir(), f"api-tests-tiles-{os.getpid()}")
+
+
+@override_settings(TILE_CACHE_DIR=TILE_CACHE_DIR)
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(TILE_CACHE_DIR, exist_ok=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TILE_CACHE_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="owner", password="pwd")
+        cls.crops = [Crop.objects.create(name="Wheat", subtype=f"W{i}") for i in range(3)]
+        cls.company = Company.objects.create(owner=cls.user, name="Test Co")
+        cls.region = Region.objects.create(company=cls.company, name="North")
+        cls.sector = WaterwaySector.objects.create(region=cls.region, name="Sector 1")
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_pivots(self, count, sector=None):
+        pivots = []
+        for i in range(count):
+            pivot = CropPivot.objects.create(
+                sector=sector or self.sector, logical_name=f"P{i:02d}", area=10,
+                center=f"SRID=4326;POINT({47 + i / 100} 39.8)",
+            )
+            pivot.crops.set(self.crops[:2])
+            pivots.append(pivot)
+        return pivots
+
+    def make_fields(self, count, sector=None):
+        fields = []
+        for i in range(count):
+            field = CropField.objects.create(
+                sector=sector or self.sector, logical_name=f"F{i:02d}", area=5,
+            )
+            field.crops.set(self.crops[1:])
+            fields.append(field)
+        return fields
+
+
+class PlotQueryCountTests(ApiTestCase):
+    def test_pivot_list_query_count_is_constant(self):
+        self.make_pivots(20)
+        # The version stamps, pivots joined with their sector, plus one prefetch for crops.
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/pivots/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 20)
+        self.assertEqual(response.data["results"][0]["sector"], "Sector 1")
+        self.assertEqual(len(response.data["results"][0]["crops"]), 2)
+
+    def test_field_list_query_count_is_constant(self):
+        self.make_fields(20)
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/fields/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 20)
+
+    def test_pivot_detail_query_count(self):
+        pivot = self.make_pivots(1)[0]
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/pivots/{pivot.pk}/")
+        self.assertEqual(response.status_code, 200)
+
+
+class AnnotatedStatsTests(ApiTestCase):
+    def test_sector_stats_come_from_annotations(self):
+        other = WaterwaySector.objects.create(region=self.region, name="Sector 2")
+        self.make_pivots(3)
+        self.make_fields(2)
+        self.make_pivots(1, sector=other)
+        # The version stamps, then one query for the sectors with their stats.
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/sectors/")
+        stats = {row["name"]: row for row in response.data["results"]}
+        self.assertEqual(stats["Sector 1"]["plantation_count"], 5)
+        self.assertEqual(stats["Sector 1"]["total_plantation_area"], 40.0)
+        self.assertEqual(stats["Sector 2"]["plantation_count"], 1)
+
+    def test_company_and_region_counts(self):
+        Region.objects.create(company=self.company, name="South")
+        response = self.client.get("/api/companies/")
+        self.assertEqual(response.data["results"][0]["region_count"], 2)
+        response = self.client.get("/api/regions/")
+        self.assertEqual({r["name"]: r["sector_count"] for r in response.data["results"]}, {"North": 1, "South": 0})
+
+    def test_create_returns_stats(self):
+        response = self.client.post("/api/regions/", {"name": "East", "company_id": self.company.pk})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["sector_count"], 0)
+
+
+class KeysetPaginationTests(ApiTestCase):
+    def collect(self, url):
+        rows = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data["results"])
+            url = response.data["next"]
+        return rows
+
+    def test_pages_cover_every_row_once(self):
+        pivots = self.make_pivots(7)
+        rows = self.collect("/api/pivots/?page_size=3")
+        self.assertEqual([row["id"] for row in rows], [p.pk for p in pivots])
+
+    def test_rotations_follow_year_then_id(self):
+        pivots = self.make_pivots(3)
+        for year in (2021, 2023, 2022):
+            for pivot in pivots:
+                CropRotation.objects.create(pivot=pivot, year=year)
+        rows = self.collect("/api/rotations/?page_size=2")
+        expected = list(CropRotation.objects.order_by("-year", "id").values_list("id", flat=True))
+        self.assertEqual([row["id"] for row in rows], expected)
+
+    def test_previous_link_walks_back(self):
+        self.make_pivots(5)
+        first = self.client.get("/api/pivots/?page_size=2").data
+        second = self.client.get(first["next"]).data
+        back = self.client.get(second["previous"]).data
+        self.assertEqual(back["results"], first["results"])
+        self.assertIsNotNone(back["next"])
+
+    def test_page_size_is_capped(self):
+        self.make_pivots(3)
+        response = self.client.get("/api/pivots/?page_size=100000")
+        self.assertEqual(len(response.data["results"]), 3)
+
+    def test_invalid_cursor(self):
+        response = self.client.get("/api/pivots/?cursor=not-a-cursor")
+        self.assertEqual(response.status_code, 404)
+
+    def test_forged_cursor_values_are_rejected(self):
+        import base64
+        import json
+        self.make_pivots(2)
+        for values in (["abc"], [None], [[1]], [10 ** 30]):
+            cursor = base64.urlsafe_b64encode(json.dumps({"v": values}).encode()).decode()
+            response = self.client.get(f"/api/pivots/?cursor={cursor}")
+            self.assertEqual(response.status_code, 404, values)
+        cursor = base64.urlsafe_b64encode(json.dumps({"v": ["2024", "1"]}).encode()).decode()
+        self.assertEqual(self.client.get(f"/api/rotations/?cursor={cursor}").status_code, 200)
+
+
+class RotationOwnerTests(ApiTestCase):
+    def test_owner_is_copied_to_rotations_and_entries(self):
+        pivot = self.make_pivots(1)[0]
+        rotation = CropRotation.objects.create(pivot=pivot, year=2024)
+        entry = CropRotationEntry.objects.create(rotation=rotation, crop=self.crops[0])
+        self.assertEqual(rotation.owner_id, self.user.pk)
+        self.assertEqual(entry.owner_id, self.user.pk)
+
+    def test_rotations_are_scoped_by_owner(self):
+        other_user = User.objects.create_user(username="other", password="pwd")
+        other_company = Company.objects.create(owner=other_user, name="Other Co")
+        other_sector = WaterwaySector.objects.create(
+            region=Region.objects.create(company=other_company, name="R"), name="S"
+        )
+        mine = CropRotation.objects.create(field=self.make_fields(1)[0], year=2024)
+        CropRotation.objects.create(pivot=self.make_pivots(1, sector=other_sector)[0], year=2024)
+        response = self.client.get("/api/rotations/")
+        self.assertEqual([row["id"] for row in response.data["results"]], [mine.pk])
+
+    def test_deleting_plot_hides_its_rotations(self):
+        pivot = self.make_pivots(1)[0]
+        rotation = CropRotation.objects.create(pivot=pivot, year=2024)
+        CropRotationEntry.objects.create(rotation=rotation, crop=self.crops[0])
+        pivot.delete()
+        self.assertEqual(self.client.get("/api/rotations/").data["results"], [])
+        self.assertEqual(self.client.get("/api/rotation-entries/").data["results"], [])
+
+
+class ResponseCacheTests(ApiTestCase):
+    def test_repeat_list_is_served_from_cache(self):
+        self.make_pivots(2)
+        self.client.get("/api/pivots/")
+        # Only the version stamps are read.
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/pivots/")
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_writes_invalidate_only_the_owner(self):
+        other_user = User.objects.create_user(username="other", password="pwd")
+        other_client = APIClient()
+        other_client.force_authenticate(other_user)
+        pivot = self.make_pivots(1)[0]
+        self.client.get("/api/pivots/")
+        other_client.get("/api/companies/")
+
+        pivot.crops.clear()
+        response = self.client.get("/api/pivots/")
+        self.assertEqual(response.data["results"][0]["crops"], [])
+        with self.assertNumQueries(1):
+            other_client.get("/api/companies/")
+
+    def test_stats_are_staff_only(self):
+        self.client.get("/api/companies/")
+        self.client.get("/api/companies/")
+        self.assertEqual(self.client.get("/api/cache/stats/").status_code, 403)
+        self.user.is_staff = True
+        stats = self.client.get("/api/cache/stats/").data
+        self.assertEqual(stats["companies"], {"hits": 1, "misses": 1})
+
+
+class ConditionalGetTests(ApiTestCase):
+    def test_matching_etag_short_circuits(self):
+        pivot = self.make_pivots(1)[0]
+        response = self.client.get(f"/api/pivots/{pivot.pk}/")
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+        # Only the version stamps are read.
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/api/pivots/{pivot.pk}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_etag(self):
+        self.make_pivots(1)
+        etag = self.client.get("/api/rotations/")["ETag"]
+        CropRotation.objects.create(pivot=CropPivot.objects.get(), year=2024)
+        response = self.client.get("/api/rotations/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_versions_are_shared_through_the_database(self):
+        etag = self.client.get("/api/companies/")["ETag"]
+        # Another worker process shares the database but not this process's cache.
+        cache.clear()
+        self.assertEqual(self.client.get("/api/companies/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Company.objects.create(owner=self.user, name="Other Co")
+        cache.clear()
+        self.assertEqual(self.client.get("/api/companies/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since_alone_is_not_trusted(self):
+        response = self.client.get("/api/companies/")
+        # A write in the same second leaves Last-Modified unchanged.
+        Company.objects.create(owner=self.user, name="Other Co")
+        response = self.client.get("/api/companies/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        self.assertTrue(response.has_header("Last-Modified"))
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_geojson_layers_revalidate(self):
+        self.make_pivots(1)
+        self.assertRevalidates("/api/geojson/?layers=pivots")
+
+    def test_vector_tiles_revalidate(self):
+        self.make_pivots(1)
+        self.assertRevalidates("/api/tiles/0/0/0.mvt")
+
+
+    def test_conflict_report_revalidate(self):
+        self.make_pivots(1)
+        self.assertRevalidates("/api/spatial/conflicts/")
+
+    def test_plot_clusters_revalidate(self):
+        self.make_pivots(1)
+        self.assertRevalidates("/api/clusters/?zoom=10")
+
+    def test_yield_analytics_revalidate(self):
+        self.make_pivots(1)
+        self.assertRevalidates("/api/analytics/yields/?group_by=crop")
+
+    def test_dashboard_revalidates(self):
+        self.make_pivots(1)
+        self.assertRevalidates("/api/dashboard/")
+
+    def test_rotation_export_revalidates(self):
+        self.make_pivots(1)
+        self.assertRevalidates("/api/export/rotations.csv")
+
+class PlotBulkTests(ApiTestCase):
+    def test_bulk_create_reports_item_errors(self):
+        other_company = Company.objects.create(owner=User.objects.create_user(username="o"), name="O")
+        foreign = WaterwaySector.objects.create(region=Region.objects.create(company=other_company, name="R"), name="S")
+        items = [
+            {"logical_name": f"P{i}", "area": 3, "sector_id": self.sector.pk, "crop_ids": [c.pk for c in self.crops]}
+            for i in range(50)
+        ]
+        items += [{"logical_name": "X", "area": 1, "sector_id": foreign.pk}, {"logical_name": "Y"}]
+        self.make_pivots(1)
+        # Sectors, crops, one insert, one through-table insert, one rollup update per sector,
+        # the tenant, spatial and tile version stamps, plus the transaction savepoint pair.
+        with self.assertNumQueries(10):
+            response = self.client.post("/api/pivots/bulk/", items, format="json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.data["created"]), 50)
+        self.assertEqual([error["index"] for error in response.data["errors"]], [50, 51])
+        self.assertEqual(CropPivot.crops.through.objects.count(), 152)
+        self.assertEqual(SectorPlotRollup.objects.get(sector=self.sector).pivot_count, 51)
+
+    def test_bulk_update(self):
+        fields = self.make_fields(2)
+        items = [{"id": fields[0].pk, "area": 9, "crop_ids": []}, {"id": fields[1].pk, "logical_name": "F-new"}]
+        response = self.client.patch("/api/fields/bulk/", items, format="json")
+        self.assertEqual(response.status_code, 200)
+        fields[0].refresh_from_db()
+        self.assertEqual(fields[0].area, 9)
+        self.assertEqual(fields[0].crops.count(), 0)
+        self.assertEqual(CropField.objects.get(pk=fields[1].pk).logical_name, "F-new")
+
+
+class RotationEntryUpsertTests(ApiTestCase):
+    def test_upsert_creates_and_updates(self):
+        rotation = CropRotation.objects.create(pivot=self.make_pivots(1)[0], year=2024)
+        CropRotationEntry.objects.create(rotation=rotation, crop=self.crops[0], expected_yield_tons=4)
+        items = [
+            {"rotation_id": rotation.pk, "crop_id": self.crops[0].pk, "actual_yield_tons": 5},
+            {"rotation_id": rotation.pk, "crop_id": self.crops[1].pk, "actual_yield_tons": 7},
+            {"rotation_id": rotation.pk, "crop_id": self.crops[1].pk, "actual_yield_tons": 8},
+            {"rotation_id": rotation.pk + 100, "crop_id": self.crops[2].pk},
+        ]
+        response = self.client.post("/api/rotation-entries/upsert/", items, format="json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data["created"], response.data["updated"]), (1, 1))
+        self.assertEqual([error["index"] for error in response.data["errors"]], [2, 3])
+
+        updated = CropRotationEntry.objects.get(rotation=rotation, crop=self.crops[0])
+        self.assertEqual((updated.actual_yield_tons, updated.expected_yield_tons), (5, 4))
+        created = CropRotationEntry.objects.get(rotation=rotation, crop=self.crops[1])
+        self.assertEqual(created.owner_id, self.user.pk)
+
+
+class GeoJSONTests(ApiTestCase):
+    def test_wkt_to_geojson(self):
+        from .geometry import wkt_to_geojson
+        self.assertEqual(wkt_to_geojson("SRID=4326;POINT(47.5 39.8)"), {"type": "Point", "coordinates": [47.5, 39.8]})
+        polygon = wkt_to_geojson("POLYGON((0 0, 1 0, 1 1, 0 0), (0.2 0.2, 0.4 0.2, 0.4 0.4, 0.2 0.2))")
+        self.assertEqual(polygon["type"], "Polygon")
+        self.assertEqual(len(polygon["coordinates"]), 2)
+        self.assertEqual(polygon["coordinates"][0][1], [1.0, 0.0])
+        self.assertIsNone(wkt_to_geojson("POLYGON EMPTY"))
+        self.assertIsNone(wkt_to_geojson("not wkt"))
+
+    def test_stream_filters_layers(self):
+        import json
+        self.make_pivots(3)
+        self.make_fields(1)
+        self.sector.shape = "SRID=4326;POLYGON((47 39, 48 39, 48 40, 47 39))"
+        self.sector.save()
+        response = self.client.get("/api/geojson/?layers=pivots,sectors")
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+        collection = json.loads(b"".join(response.streaming_content))
+        layers = [feature["properties"]["layer"] for feature in collection["features"]]
+        self.assertEqual(layers, ["pivots"] * 3 + ["sectors"])
+        self.assertEqual(self.client.get("/api/geojson/?layers=roads").status_code, 400)
+
+
+class BoundingBoxTests(ApiTestCase):
+    def test_bbox_columns_follow_geometry(self):
+        field = CropField.objects.create(
+            sector=self.sector, logical_name="F", area=1,
+            shape="SRID=4326;POLYGON((47 39, 47.2 39, 47.2 39.1, 47 39))",
+        )
+        self.assertEqual((field.min_lon, field.min_lat, field.max_lon, field.max_lat), (47, 39, 47.2, 39.1))
+        pivot = self.make_pivots(1)[0]
+        self.assertLess(pivot.min_lon, 47)
+        self.assertGreater(pivot.max_lat, 39.8)
+
+    def test_viewport_filter(self):
+        self.make_pivots(5)  # centers at lon 47.00 .. 47.04
+        response = self.client.get("/api/pivots/?bbox=47.015,39.7,47.05,39.9")
+        self.assertEqual([row["logical_name"] for row in response.data["results"]], ["P02", "P03", "P04"])
+        self.assertEqual(self.client.get("/api/pivots/?bbox=1,2,3").status_code, 400)
+
+
+class VectorTileTests(ApiTestCase):
+    def test_geometry_encoding(self):
+        from .tiles import _ring_area, encode_rings, tile_polygon
+        # Example polygon from the vector tile specification.
+        self.assertEqual(encode_rings([[(3, 6), (8, 12), (20, 34)]]), [9, 6, 12, 18, 10, 12, 24, 44, 15])
+        # Clipped to the buffered tile and wound clockwise (positive area with y down).
+        rings = tile_polygon([[[(-1000, -1000), (-1000, 5000), (5000, 5000), (5000, -1000)]]], lambda x, y: (x, y))
+        self.assertEqual(len(rings), 1)
+        self.assertEqual(set(rings[0]), {(-64, -64), (4160, -64), (4160, 4160), (-64, 4160)})
+        self.assertGreater(_ring_area(rings[0]), 0)
+
+    def test_tiles_are_cached_and_invalidated_by_extent(self):
+        from pathlib import Path
+        from django.conf import settings
+        from .tiles import tile_range
+        pivot = self.make_pivots(1)[0]  # center 47.00, 39.8
+        xs, ys = tile_range((47, 39.8, 47, 39.8), 12)
+        url = f"/api/tiles/12/{xs[0]}/{ys[0]}.mvt"
+        response = self.client.get(url)
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertIn(b"pivots", response.content)
+        self.assertNotIn(b"fields", response.content)
+        path = Path(settings.TILE_CACHE_DIR) / str(self.user.pk) / "12" / str(xs[0]) / f"{ys[0]}.mvt"
+        self.assertTrue(path.exists())
+
+        CropField.objects.create(sector=self.sector, logical_name="Far", area=1,
+                                 shape="SRID=4326;POLYGON((10 10, 10.1 10, 10.1 10.1, 10 10))")
+        self.assertTrue(path.exists())
+        pivot = CropPivot.objects.get(pk=pivot.pk)
+        pivot.center = "SRID=4326;POINT(20 20)"
+        with self.captureOnCommitCallbacks(execute=True):
+            pivot.save()
+        self.assertFalse(path.exists())
+        self.assertNotIn(b"pivots", self.client.get(url).content)
+        self.assertEqual(self.client.get("/api/tiles/2/4/0.mvt").status_code, 404)
+
+    def test_tile_rendered_across_an_invalidation_is_not_stored(self):
+        from pathlib import Path
+        from unittest import mock
+        from django.conf import settings
+        from . import tiles
+        render = tiles.render_tile
+
+        def render_during_write(user, z, x, y):
+            tile = render(user, z, x, y)
+            tiles.invalidate_tiles(user.pk, (-180, -85, 180, 85))
+            return tile
+
+        with mock.patch.object(tiles, "render_tile", render_during_write):
+            self.assertEqual(self.client.get("/api/tiles/0/0/0.mvt").status_code, 200)
+        tile_dir = Path(settings.TILE_CACHE_DIR) / str(self.user.pk) / "0" / "0"
+        self.assertEqual(list(tile_dir.iterdir()), [])
+        self.client.get("/api/tiles/0/0/0.mvt")
+        self.assertEqual([path.name for path in tile_dir.iterdir()], ["0.mvt"])
+
+
+class SimplificationTests(ApiTestCase):
+    def circle(self, vertices=200):
+        import math
+        points = [(47 + 0.01 * math.cos(2 * math.pi * i / vertices), 39 + 0.01 * math.sin(2 * math.pi * i / vertices))
+                  for i in range(vertices)]
+        return "SRID=4326;POLYGON((" + ", ".join(f"{x} {y}" for x, y in points + points[:1]) + "))"
+
+    def test_levels_stored_on_save_and_selected_by_zoom(self):
+        import json
+        field = CropField.objects.create(sector=self.sector, logical_name="F", area=1, shape=self.circle())
+        self.assertEqual(set(field.shape_lod), {"6", "9", "12", "15"})
+        full = self.client.get("/api/fields/").data["results"][0]["shape"]
+        coarse = self.client.get("/api/fields/?zoom=5").data["results"][0]["shape"]
+        self.assertEqual(full, field.shape)
+        self.assertEqual(coarse, field.shape_lod["6"])
+        self.assertLess(len(coarse), len(full) / 10)
+        self.assertEqual(self.client.get("/api/fields/?zoom=20").data["results"][0]["shape"], full)
+        self.assertEqual(self.client.get("/api/fields/?zoom=high").status_code, 400)
+
+        response = self.client.get("/api/geojson/?layers=fields&zoom=8")
+        feature = json.loads(b"".join(response.streaming_content))["features"][0]
+        self.assertLess(len(feature["geometry"]["coordinates"][0]), 200)
+
+    def test_bulk_writes_and_backfill_command(self):
+        from django.core.management import call_command
+        response = self.client.post("/api/fields/bulk/", [
+            {"logical_name": "B", "area": 1, "sector_id": self.sector.pk, "shape": self.circle()}
+        ], format="json")
+        field = CropField.objects.get(pk=response.data["created"][0])
+        self.assertIn("6", field.shape_lod)
+        CropField.objects.update(shape_lod={})
+        call_command("simplify_shapes", "--missing", stdout=open("/dev/null", "w"))
+        field.refresh_from_db()
+        self.assertIn("6", field.shape_lod)
+
+
+class AreaTests(ApiTestCase):
+    square = "SRID=4326;POLYGON((47 39, 47.01 39, 47.01 39.01, 47 39.01, 47 39))"
+
+    def test_area_derived_from_shape_on_save(self):
+        field = CropField.objects.create(sector=self.sector, logical_name="F", area=123, shape=self.square)
+        self.assertAlmostEqual(field.area, 96.3, delta=0.1)  # 0.01 deg squared at 39N
+        no_shape = CropField.objects.create(sector=self.sector, logical_name="G", area=7)
+        self.assertEqual(no_shape.area, 7)
+        self.sector.shape = self.square
+        self.sector.save(update_fields=["shape"])
+        self.sector.refresh_from_db()
+        self.assertAlmostEqual(self.sector.area_ha, field.area)
+
+        response = self.client.patch(f"/api/fields/{field.pk}/", {"area": 1}, format="json")
+        self.assertAlmostEqual(response.data["area"], field.area)
+
+    def test_recompute_areas_command(self):
+        from django.core.management import call_command
+        field = CropField.objects.create(sector=self.sector, logical_name="F", area=1, shape=self.square)
+        expected = field.area
+        CropField.objects.update(area=123)
+        call_command("recompute_areas", "--workers", "1", stdout=open("/dev/null", "w"))
+        field.refresh_from_db()
+        self.assertAlmostEqual(field.area, expected)
+
+    def test_recompute_areas_in_worker_processes(self):
+        import io
+        from django.core.management import call_command
+        fields = [CropField.objects.create(sector=self.sector, logical_name=f"F{i}", area=1, shape=self.square)
+                  for i in range(5)]
+        expected = fields[0].area
+        CropField.objects.update(area=123)
+        out = io.StringIO()
+        call_command("recompute_areas", "--workers", "2", "--batch-size", "1", stdout=out)
+        self.assertIn("fields: 5 updated", out.getvalue())
+        self.assertEqual({round(area, 6) for area in CropField.objects.values_list("area", flat=True)}, {round(expected, 6)})
+
+
+class ConflictTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sector.shape = "SRID=4326;POLYGON((47 39, 47.1 39, 47.1 39.1, 47 39.1, 47 39))"
+        self.sector.save()
+
+    def square(self, x, y, size=0.01):
+        return f"SRID=4326;POLYGON(({x} {y}, {x + size} {y}, {x + size} {y + size}, {x} {y + size}, {x} {y}))"
+
+    def pivot(self, lon, lat, radius_m=100):
+        return CropPivot.objects.create(sector=self.sector, logical_name="P", area=1,
+                                        center=f"SRID=4326;POINT({lon} {lat})", radius_m=radius_m)
+
+    def field(self, wkt):
+        return CropField.objects.create(sector=self.sector, logical_name="F", area=1, shape=wkt)
+
+    def test_report(self):
+        a, b = self.pivot(47.01, 39.05), self.pivot(47.0115, 39.05)  # ~130 m apart, radii 100 m
+        self.pivot(47.05, 39.05)
+        outside_pivot = self.pivot(47.1, 39.05)  # center on the sector edge
+        f1, f2 = self.field(self.square(47.02, 39.02)), self.field(self.square(47.025, 39.02))
+        self.field(self.square(47.035, 39.02))  # only shares an edge with f2
+        outside_field = self.field(self.square(47.095, 39.02))
+
+        report = self.client.get("/api/spatial/conflicts/").data
+        self.assertEqual(
+            [(row["layer"], row["id"], row["other_id"]) for row in report["overlaps"]],
+            [("pivots", a.pk, b.pk), ("fields", f1.pk, f2.pk)],
+        )
+        self.assertAlmostEqual(report["overlaps"][0]["depth_m"], 70, delta=2)
+        self.assertEqual(
+            [(row["layer"], row["id"]) for row in report["outside_sector"]],
+            [("pivots", outside_pivot.pk), ("fields", outside_field.pk)],
+        )
+
+    def test_write_time_check(self):
+        existing = self.pivot(47.01, 39.05)
+        payload = {"logical_name": "N", "area": 1, "sector_id": self.sector.pk, "radius_m": 100, "crop_ids": [],
+                   "center": "SRID=4326;POINT(47.0115 39.05)"}
+        response = self.client.post("/api/pivots/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        with override_settings(PLOT_CONFLICT_CHECK=True):
+            response = self.client.post("/api/pivots/", payload, format="json")
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(f"Overlaps plot {existing.pk}.", response.data["non_field_errors"])
+            # Shrinking the existing pivot is checked against the one created above (~130 m away).
+            self.assertEqual(self.client.patch(f"/api/pivots/{existing.pk}/", {"radius_m": 50}).status_code, 400)
+            self.assertEqual(self.client.patch(f"/api/pivots/{existing.pk}/", {"radius_m": 20}).status_code, 200)
+
+            response = self.client.post("/api/fields/bulk/", [
+                {"logical_name": "A", "area": 1, "sector_id": self.sector.pk, "shape": self.square(47.02, 39.02)},
+                {"logical_name": "B", "area": 1, "sector_id": self.sector.pk, "shape": self.square(47.025, 39.02)},
+                {"logical_name": "C", "area": 1, "sector_id": self.sector.pk, "shape": self.square(47.03, 39.02)},
+            ], format="json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len(response.data["created"]), 2)
+        self.assertEqual(response.data["errors"], [
+            {"index": 1, "errors": {"non_field_errors": ["Overlaps item 0 of this request."]}}
+        ])
+
+    def test_write_time_check_closes_unclosed_rings(self):
+        self.sector.shape = "SRID=4326;POLYGON((47 39, 47.1 39, 47.1 39.1, 47 39.1, 47.05 39.05, 47 39))"
+        self.sector.save()
+        # Only the implicit closing edge (47.04 39.01)-(47.04 39.09) crosses the sector's notch.
+        payload = {"logical_name": "F", "area": 1, "sector_id": self.sector.pk, "crop_ids": [],
+                   "shape": "SRID=4326;POLYGON((47.04 39.09, 47.08 39.09, 47.08 39.01, 47.04 39.01))"}
+        with override_settings(PLOT_CONFLICT_CHECK=True):
+            response = self.client.post("/api/fields/", payload, format="json")
+        self.assertEqual(response.status_code, 400, response.data)
+        self.assertIn(f"Not inside sector {self.sector.pk}.", response.data["non_field_errors"])
+
+
+class SectorAssignmentTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sector.shape = "SRID=4326;POLYGON((47 39, 47.1 39, 47.1 39.1, 47 39.1, 47 39))"
+        self.sector.save()
+        self.east = WaterwaySector.objects.create(
+            region=self.region, name="East", shape="SRID=4326;POLYGON((47.1 39, 47.2 39, 47.2 39.1, 47.1 39.1, 47.1 39))"
+        )
+
+    def test_create_without_sector(self):
+        payload = {"logical_name": "P", "area": 1, "crop_ids": [], "center": "SRID=4326;POINT(47.15 39.05)"}
+        response = self.client.post("/api/pivots/", payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data["sector_id"], self.east.pk)
+        payload["center"] = "SRID=4326;POINT(48 39.05)"
+        response = self.client.post("/api/pivots/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("No sector contains this plot", response.data["sector_id"][0])
+
+        WaterwaySector.objects.create(
+            region=self.region, name="Overlay", shape="SRID=4326;POLYGON((47 39, 47.05 39, 47.05 39.05, 47 39))"
+        )
+        square = "SRID=4326;POLYGON(({x} 39.01, {y} 39.01, {y} 39.02, {x} 39.02, {x} 39.01))"
+        response = self.client.post("/api/fields/bulk/", [
+            {"logical_name": "A", "area": 1, "shape": square.format(x=47.06, y=47.07)},
+            {"logical_name": "B", "area": 1, "shape": square.format(x=47.03, y=47.04)},
+        ], format="json")
+        self.assertEqual(CropField.objects.get(pk=response.data["created"][0]).sector_id, self.sector.pk)
+        self.assertEqual(response.data["errors"][0]["index"], 1)
+        self.assertIn("Several sectors", response.data["errors"][0]["errors"]["sector_id"][0])
+
+    def test_command_reports_and_moves(self):
+        from io import StringIO
+        from django.core.management import call_command
+        misplaced = CropPivot.objects.create(sector=self.sector, logical_name="M", area=1,
+                                             center="SRID=4326;POINT(47.15 39.05)")
+        orphan = CropPivot.objects.create(sector=self.sector, logical_name="O", area=1,
+                                          center="SRID=4326;POINT(48 39.05)")
+        rotation = CropRotation.objects.create(pivot=misplaced, year=2024)
+        out = StringIO()
+        call_command("assign_sectors", "owner", "--layer", "pivots", "--apply", stdout=out)
+        self.assertIn(f"orphans (no sector contains them): {orphan.pk}", out.getvalue())
+        misplaced.refresh_from_db()
+        rotation.refresh_from_db()
+        self.assertEqual((misplaced.sector_id, rotation.sector_id), (self.east.pk, self.east.pk))
+
+
+class NearestPivotTests(ApiTestCase):
+    def test_nearest_follows_writes(self):
+        pivots = self.make_pivots(5)  # lon 47.00 .. 47.04 at lat 39.8, ~855 m apart
+        response = self.client.get("/api/pivots/nearest/?lat=39.8&lon=47.009&k=2")
+        self.assertEqual([row["id"] for row in response.data["results"]], [pivots[1].pk, pivots[0].pk])
+        self.assertAlmostEqual(response.data["results"][0]["distance_m"], 85.5, delta=1)
+
+        pivots[1].delete()
+        moved = pivots[4]
+        moved.center = "SRID=4326;POINT(47.012 39.8)"
+        moved.save()
+        response = self.client.get("/api/pivots/nearest/?lat=39.8&lon=47.009&max_m=800")
+        self.assertEqual([row["id"] for row in response.data["results"]], [moved.pk, pivots[0].pk])
+        self.assertEqual(self.client.get("/api/pivots/nearest/?lat=39.8&k=0").status_code, 400)
+
+
+class ClusterTests(ApiTestCase):
+    def test_clusters_by_zoom_and_invalidation(self):
+        pivots = self.make_pivots(4)  # 0.01 deg apart; crops[:2] each
+        pivots[0].crops.set(self.crops[2:])
+        response = self.client.get("/api/clusters/?zoom=8")
+        cluster, = response.data["clusters"]
+        self.assertEqual((cluster["count"], cluster["pivots"], cluster["area"]), (4, 4, 40))
+        self.assertEqual(cluster["dominant_crop"]["id"], self.crops[0].pk)
+        self.assertEqual(len(self.client.get("/api/clusters/?zoom=16").data["clusters"]), 4)
+        self.assertEqual(self.client.get("/api/clusters/?zoom=16&bbox=47.015,39,48,40").data["clusters"][0]["count"], 1)
+
+        with self.assertNumQueries(1):
+            self.client.get("/api/clusters/?zoom=8&bbox=40,30,50,45")
+        self.make_pivots(1)
+        self.assertEqual(self.client.get("/api/clusters/?zoom=8").data["clusters"][0]["count"], 5)
+        self.assertEqual(self.client.get("/api/clusters/").status_code, 400)
+
+
+class YieldAnalyticsTests(ApiTestCase):
+    def test_grouped_sums_percentiles_and_gap(self):
+        pivots = self.make_pivots(6)
+        rotation = CropRotation.objects.create(pivot=pivots[0], year=2023)
+        for crop, actual in ((self.crops[0], 5), (self.crops[1], None)):
+            CropRotationEntry.objects.create(rotation=rotation, crop=crop, actual_yield_tons=actual, expected_yield_tons=3)
+        for i, actual in enumerate([1, 2, 3, 4, 10]):
+            rotation = CropRotation.objects.create(pivot=pivots[i + 1], year=2024)
+            CropRotationEntry.objects.create(
+                rotation=rotation, crop=self.crops[i % 2], actual_yield_tons=actual, expected_yield_tons=3,
+            )
+
+        # The version stamps, one GROUP BY query plus one windowed query per percentile.
+        with self.assertNumQueries(4):
+            response = self.client.get("/api/analytics/yields/?percentiles=50,90&year_from=2024")
+        row, = response.data["results"]
+        self.assertEqual((row["year"], row["entries"], row["actual_sum"], row["expected_sum"]), (2024, 5, 20, 15))
+        self.assertEqual((row["gap"], row["gap_pct"], row["actual_avg"]), (5, 33.33, 4))
+        self.assertEqual(row["percentiles"], {"p50": 3, "p90": 10})
+
+        rows = self.client.get("/api/analytics/yields/?group_by=year,crop").data["results"]
+        self.assertEqual([(r["year"], r["crop_id"], r["actual_count"]) for r in rows],
+                         [(2023, self.crops[0].pk, 1), (2023, self.crops[1].pk, 0),
+                          (2024, self.crops[0].pk, 3), (2024, self.crops[1].pk, 2)])
+        self.assertEqual(rows[2]["percentiles"], {"p25": 1, "p50": 3, "p75": 10})
+        self.assertEqual(rows[1]["percentiles"], {})
+        self.assertEqual((rows[0]["crop_name"], rows[0]["crop_subtype"]), ("Wheat", "W0"))
+
+        company, = self.client.get("/api/analytics/yields/?group_by=company").data["results"]
+        self.assertEqual((company["company"], company["entries"]), ("Test Co", 7))
+        self.assertEqual(self.client.get("/api/analytics/yields/?group_by=farm").status_code, 400)
+        self.assertEqual(self.client.get("/api/analytics/yields/?percentiles=0").status_code, 400)
+        for query in ("crop=abc", f"crop={10 ** 30}", f"year_from={10 ** 30}", "year_to=-1"):
+            response = self.client.get(f"/api/analytics/yields/?{query}")
+            self.assertEqual(response.status_code, 400, query)
+            self.assertEqual(list(response.data), [query.split("=")[0]])
+        self.assertEqual(self.client.get("/api/analytics/yields/?crop=&year_from=").status_code, 200)
+
+
+class RollupTests(ApiTestCase):
+    def assertNoDrift(self):
+        from .rollups import rebuild
+        self.assertEqual(rebuild(self.user.pk), 0)
+
+    def test_signals_keep_rollups_current(self):
+        pivots = self.make_pivots(3)
+        self.make_fields(2)
+        rollup = SectorPlotRollup.objects.get(sector=self.sector)
+        self.assertEqual((rollup.pivot_count, rollup.pivot_area, rollup.field_count, rollup.field_area), (3, 30, 2, 10))
+
+        other_sector = WaterwaySector.objects.create(region=self.region, name="Sector 2")
+        pivots[0].sector = other_sector
+        pivots[0].area = 4
+        pivots[0].save()
+        self.assertEqual(SectorPlotRollup.objects.get(sector=other_sector).pivot_area, 4)
+        rotation = CropRotation.objects.create(pivot=pivots[1], year=2024)
+        entry = CropRotationEntry.objects.create(rotation=rotation, crop=self.crops[0], actual_yield_tons=6)
+        CropRotationEntry.objects.create(rotation=rotation, crop=self.crops[1], expected_yield_tons=2)
+        entry.actual_yield_tons = 8
+        entry.save()
+        self.assertEqual(SectorYieldRollup.objects.get(crop=self.crops[0]).actual_yield_tons, 8)
+
+        rotation.year = 2025
+        rotation.save()
+        self.assertEqual(set(SectorYieldRollup.objects.values_list("year", flat=True)), {2025})
+        self.assertNoDrift()
+
+        # Deleting the plot orphans its rotation, which leaves the yield totals.
+        pivots[1].delete()
+        self.assertFalse(SectorYieldRollup.objects.exists())
+        self.assertEqual(SectorPlotRollup.objects.get(sector=self.sector).pivot_count, 1)
+        pivots[0].delete()
+        self.assertFalse(SectorPlotRollup.objects.filter(sector=other_sector).exists())
+        self.assertNoDrift()
+
+    def test_bulk_writes_and_rebuild(self):
+        items = [{"sector_id": self.sector.pk, "logical_name": f"B{i}", "area": 2, "crop_ids": []} for i in range(3)]
+        created = self.client.post("/api/pivots/bulk/", items, format="json").data["created"]
+        self.client.patch("/api/pivots/bulk/", [{"id": created[0], "area": 5}], format="json")
+        self.assertEqual(SectorPlotRollup.objects.get().pivot_area, 9)
+
+        rotation = CropRotation.objects.create(pivot=CropPivot.objects.get(pk=created[0]), year=2024)
+        entries = [{"rotation_id": rotation.pk, "crop_id": crop.pk, "actual_yield_tons": 3} for crop in self.crops]
+        self.client.post("/api/rotation-entries/upsert/", entries, format="json")
+        self.client.post("/api/rotation-entries/upsert/", entries[:1] + [{**entries[1], "expected_yield_tons": 4}],
+                         format="json")
+        self.assertEqual(
+            sorted(SectorYieldRollup.objects.values_list("entry_count", "actual_yield_tons", "expected_yield_tons")),
+            [(1, 3, 0), (1, 3, 0), (1, 3, 4)],
+        )
+        self.assertNoDrift()
+
+        SectorPlotRollup.objects.update(pivot_count=0)
+        SectorYieldRollup.objects.filter(crop=self.crops[0]).delete()
+        from .rollups import rebuild
+        self.assertEqual(rebuild(self.user.pk), 2)
+        self.assertEqual(SectorPlotRollup.objects.get().pivot_count, 3)
+
+    def test_dashboard_reads_rollups(self):
+        self.make_pivots(2)
+        self.make_fields(1)
+        region = Region.objects.create(company=self.company, name="South")
+        sector = WaterwaySector.objects.create(region=region, name="Sector 2")
+        rotation = CropRotation.objects.create(pivot=self.make_pivots(1, sector=sector)[0], year=2024)
+        for crop in self.crops[:2]:
+            CropRotationEntry.objects.create(rotation=rotation, crop=crop, actual_yield_tons=5, expected_yield_tons=4)
+
+        with self.assertNumQueries(7):
+            response = self.client.get("/api/dashboard/")
+        company, = response.data["companies"]
+        self.assertEqual((company["pivot_count"], company["field_count"], company["pivot_area"]), (3, 1, 30))
+        self.assertEqual(company["years"], [{
+            "year": 2024, "entry_count": 2, "crop_count": 2,
+            "actual_yield_tons": 10, "expected_yield_tons": 8, "actual_yield_avg": 5,
+        }])
+        north, south = company["regions"]
+        self.assertEqual((north["pivot_count"], north["field_count"], north["years"]), (2, 1, []))
+        self.assertEqual((south["name"], south["pivot_count"], south["years"][0]["crop_count"]), ("South", 1, 2))
+
+    def test_dashboard_lists_companies_without_regions(self):
+        Company.objects.create(owner=self.user, name="A New Co")
+        companies = self.client.get("/api/dashboard/").data["companies"]
+        self.assertEqual([(company["name"], len(company["regions"])) for company in companies], [("A New Co", 0), ("Test Co", 1)])
+        self.assertEqual((companies[0]["pivot_count"], companies[0]["years"]), (0, []))
+
+
+class ExportTests(ApiTestCase):
+    def test_streams_one_row_per_entry(self):
+        import csv
+        import io
+        import json
+        from django.core.management import call_command
+
+        pivot, = self.make_pivots(1)
+        rotation = CropRotation.objects.create(pivot=pivot, year=2024)
+        for crop in self.crops[:2]:
+            CropRotationEntry.objects.create(rotation=rotation, crop=crop, actual_yield_tons=2.5)
+        CropRotation.objects.create(field=self.make_fields(1)[0], year=2023)
+
+        response = self.client.get("/api/export/rotations.csv")
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+        self.assertEqual([(row["year"], row["crop_subtype"]) for row in rows], [("2024", "W0"), ("2024", "W1"), ("2023", "")])
+        self.assertEqual((rows[0]["company"], rows[0]["sector"], rows[0]["pivot"]), ("Test Co", "Sector 1", "P00"))
+        self.assertEqual((rows[2]["field"], rows[2]["entry_id"]), ("F00", ""))
+
+        lines = b"".join(self.client.get("/api/export/rotations.ndjson").streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["actual_yield_tons"] for line in lines], [2.5, 2.5, None])
+        self.assertEqual(self.client.get("/api/export/rotations.xml").status_code, 404)
+
+        out = io.StringIO()
+        call_command("export_rotations", "owner", "--format", "ndjson", stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), lines)
+
+
+class CsvImportTests(ApiTestCase):
+    def upload(self, kind, text):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return self.client.post(f"/api/import/{kind}/", {"file": SimpleUploadedFile(f"{kind}.csv", text.encode())})
+
+    def test_plots_are_created_then_updated_by_name(self):
+        text = (
+            "logical_name,sector,area,crops,center\n"
+            "P1,Sector 1,10,Wheat/W0;wheat/w1,SRID=4326;POINT(47 39.8)\n"
+            "P2,Sector 1,12,,\n"
+            "P3,Nowhere,1,,\n"
+            "P4,Sector 1,2,Rice/R,\n"
+            "P1,Sector 1,11,,\n"
+        )
+        response = self.upload("pivots", text)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.data["created"], response.data["updated"]), (2, 1))
+        self.assertEqual([rejection["line"] for rejection in response.data["rejected"]], [4, 5])
+        self.assertIn("rows_per_second", response.data)
+        pivot = CropPivot.objects.get(logical_name="P1")
+        self.assertEqual((pivot.area, pivot.crops.count()), (11, 2))
+
+        response = self.upload("pivots", "logical_name,area\nP2,20\n")
+        self.assertEqual((response.status_code, response.data["updated"]), (200, 1))
+        self.assertEqual(CropPivot.objects.get(logical_name="P2").area, 20)
+        self.assertEqual(self.upload("sectors", "name\nS\n").status_code, 404)
+
+    def test_yields_create_rotations_and_upsert_entries(self):
+        import io
+        from django.core.management import call_command
+
+        self.make_pivots(1)
+        text = (
+            "year,pivot,field,sector,crop,crop_subtype,actual_yield_tons,expected_yield_tons\n"
+            "2024,P00,,Sector 1,Wheat,W0,5,4\n"
+            "2024,P00,,,Wheat,W1,,3\n"
+            "2024,P99,,,Wheat,W0,1,1\n"
+            "x,P00,,,Wheat,W2,1,1\n"
+        )
+        response = self.upload("yields", text)
+        self.assertEqual((response.data["created"], response.data["rotations_created"]), (2, 1))
+        self.assertEqual([sorted(rejection["errors"]) for rejection in response.data["rejected"]], [["pivot"], ["year"]])
+        rotation = CropRotation.objects.get()
+        self.assertEqual((rotation.sector_id, rotation.company_id, rotation.owner_id), (self.sector.pk, self.company.pk, self.user.pk))
+
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as csv_file:
+            csv_file.write("year,pivot,crop,crop_subtype,actual_yield_tons\n2024,P00,Wheat,W1,7\n")
+            csv_file.flush()
+            out = io.StringIO()
+            call_command("import_yields", "owner", csv_file.name, stdout=out)
+        self.assertIn("0 created, 1 updated, 0 rejected", out.getvalue())
+        entry = CropRotationEntry.objects.get(crop=self.crops[1])
+        self.assertEqual((entry.actual_yield_tons, entry.expected_yield_tons), (7, 3))
+        self.assertEqual(SectorYieldRollup.objects.get(crop=self.crops[1]).actual_yield_tons, 7)
+
+
+class GeoJSONImportTests(ApiTestCase):
+    def square(self, x, y, size):
+        return {"type": "Polygon", "coordinates": [[[x, y], [x + size, y], [x + size, y + size], [x, y + size]]]}
+
+    def test_features_are_read_incrementally(self):
+        import io
+        import json
+        from .importers import read_features
+
+        features = [{"type": "Feature", "properties": {"n": i, "name": "x" * 50}, "geometry": None} for i in range(20)]
+        text = json.dumps({"type": "FeatureCollection", "name": "demo", "features": features, "crs": {"a": [1, 2]}}, indent=1)
+        self.assertEqual(list(read_features(io.BytesIO(text.encode()), read_size=7)), features)
+        self.assertEqual(list(read_features(io.BytesIO(b'{"features": []}'))), [])
+        with self.assertRaises(ValueError):
+            list(read_features(io.BytesIO(text[:-40].encode()), read_size=7))
+
+    def test_points_and_polygons_become_plots_and_sectors(self):
+        import io
+        import json
+        from django.core.management import call_command
+
+        features = [
+            {"type": "Feature", "properties": {"layer": "sectors", "name": "Imported", "region_id": self.region.pk},
+             "geometry": self.square(48, 40, 0.1)},
+            {"type": "Feature", "properties": {"logical_name": "IP1", "radius_m": 200}, "geometry": {"type": "Point", "coordinates": [48.02, 40.02]}},
+            {"type": "Feature", "properties": {}, "geometry": self.square(48.05, 40.05, 0.01)},
+            {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": [[48, 40], [48.1, 40.1]]}},
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".geojson") as geojson_file:
+            json.dump({"type": "FeatureCollection", "features": features}, geojson_file)
+            geojson_file.flush()
+            out = io.StringIO()
+            call_command("import_geojson", "owner", geojson_file.name, "--batch-size", "3", "--workers", "1", stdout=out)
+
+        self.assertIn("sectors: 1 created, pivots: 1 created, fields: 1 created", out.getvalue())
+        self.assertIn("feature 4: geometry:", out.getvalue())
+        sector = WaterwaySector.objects.get(name="Imported")
+        pivot = CropPivot.objects.get(logical_name="IP1")
+        field = CropField.objects.get(logical_name="F3")
+        self.assertEqual((pivot.sector_id, field.sector_id), (sector.pk, sector.pk))
+        self.assertAlmostEqual(pivot.area, 12.5664, places=3)
+        self.assertGreater(field.area, 0)
+        self.assertEqual(SectorPlotRollup.objects.get(sector=sector).pivot_count, 1)
+
+    def test_worker_processes_keep_file_order(self):
+        import io
+        import json
+        import re
+        from django.core.management import call_command
+
+        def point(lon, **properties):
+            return {"type": "Feature", "properties": {"sector_id": self.sector.pk, **properties},
+                    "geometry": {"type": "Point", "coordinates": [lon, 39.8]}}
+
+        features = [
+            point(47.0),
+            {"type": "Feature", "properties": {}, "geometry": {"type": "LineString", "coordinates": [[47, 39], [48, 40]]}},
+            point(47.1),
+            point(47.2, color="#12345678"),
+            {"type": "Feature", "properties": {"sector_id": self.sector.pk}, "geometry": self.square(47.3, 39.8, 0.01)},
+            point(47.4),
+            {"type": "Feature", "properties": {}, "geometry": {"type": "Point", "coordinates": ["x", 39.8]}},
+            point(47.5),
+        ]
+        with tempfile.NamedTemporaryFile("w", suffix=".geojson") as geojson_file:
+            json.dump({"type": "FeatureCollection", "features": features}, geojson_file)
+            geojson_file.flush()
+            out = io.StringIO()
+            call_command("import_geojson", "owner", geojson_file.name, "--batch-size", "2", "--workers", "2", stdout=out)
+
+        self.assertIn("8 rows", out.getvalue())
+        self.assertIn("sectors: 0 created, pivots: 4 created, fields: 1 created", out.getvalue())
+        self.assertEqual(re.findall(r"feature (\d+):", out.getvalue()), ["2", "4", "7"])
+        self.assertEqual(list(CropPivot.objects.order_by("pk").values_list("logical_name", flat=True)), ["P1", "P3", "P6", "P8"])
+
+
+class SpatialIndexTests(ApiTestCase):
+    def square(self, x, y, size=0.01):
+        return f"SRID=4326;POLYGON(({x} {y}, {x + size} {y}, {x + size} {y + size}, {x} {y + size}, {x} {y}))"
+
+    def test_index_predicates(self):
+        from .spatial import get_index
+        fields = [
+            CropField.objects.create(sector=self.sector, logical_name=f"F{i}", area=1, shape=self.square(47 + i * 0.02, 39))
+            for i in range(3)
+        ]
+        index = get_index(self.user.pk).layers["fields"]
+        self.assertEqual(index.query_point(47.025, 39.005), [fields[1].pk])
+        self.assertEqual(index.query_point(47.015, 39.005), [])
+        self.assertEqual(index.query_bbox((47.005, 38.9, 47.021, 39.1)), [fields[0].pk, fields[1].pk])
+        drawn = [[[(47.009, 39.009), (47.05, 39.009), (47.05, 39.02), (47.009, 39.009)]]]
+        self.assertEqual(index.query_polygons(drawn), [f.pk for f in fields])
+
+    def test_index_follows_writes_incrementally(self):
+        from . import spatial
+        field = CropField.objects.create(sector=self.sector, logical_name="F", area=1, shape=self.square(47, 39))
+        index = spatial.get_index(self.user.pk)
+        field.shape = self.square(48, 39)
+        field.save()
+        self.assertIs(spatial.get_index(self.user.pk), index)
+        self.assertEqual(index.layers["fields"].query_point(48.005, 39.005), [field.pk])
+        field.delete()
+        self.assertEqual(len(spatial.get_index(self.user.pk).layers["fields"]), 0)
+
+    def test_query_endpoint(self):
+        self.sector.shape = self.square(47, 39, size=1)
+        self.sector.save()
+        response = self.client.get("/api/spatial/query/?layer=sectors&point=47.5,39.5")
+        self.assertEqual(response.data["ids"], [self.sector.pk])
+
+    def test_non_finite_and_out_of_range_coordinates_are_rejected(self):
+        for query in ("bbox=-inf,-90,inf,90", "bbox=0,0,200,10", "bbox=nan,0,1,1", "point=nan,0", "point=inf,0",
+                      "point=0,91", "wkt=POLYGON((0 0, inf 0, 1 1, 0 0))"):
+            response = self.client.get(f"/api/spatial/query/?layer=fields&{query}")
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(self.client.get("/api/geojson/?bbox=-inf,-90,inf,90").status_code, 400)
+
+    def test_pivot_radius_is_bounded(self):
+        payload = {"logical_name": "P", "area": 1, "sector_id": self.sector.pk, "crop_ids": [],
+                   "center": "SRID=4326;POINT(47 39)", "radius_m": 1e6}
+        response = self.client.post("/api/pivots/", payload, format="json")
+        self.assertEqual((response.status_code, list(response.data)), (400, ["radius_m"]))
+        self.assertEqual(self.client.post("/api/pivots/", {**payload, "radius_m": 0}, format="json").status_code, 400)
+        response = self.client.post("/api/pivots/bulk/", [payload, {**payload, "radius_m": 300}], format="json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["errors"][0]["index"], 0)
+
+    def test_oversized_items_are_scanned_not_gridded(self):
+        from .spatial import GridIndex
+        index = GridIndex(0.01)
+        index.insert(1, (0, 0, 90, 60), [[[(0, 0), (90, 0), (90, 60), (0, 60)]]])
+        index.insert(2, (1, 1, 1.005, 1.005), [[[(1, 1), (1.005, 1), (1.005, 1.005), (1, 1.005)]]])
+        self.assertEqual((index.oversized, len(index.cells)), ({1}, 1))
+        self.assertEqual(index.query_point(1.002, 1.002), [1, 2])
+        self.assertEqual(index.query_point(50, 50), [1])
+        index.remove(1)
+        self.assertEqual((index.oversized, index.query_point(50, 50)), (set(), []))
+
+    def test_unclosed_rings_keep_their_closing_edge(self):
+        from .geometry import polygons_intersect
+        # Only the implicit edge from (0 10) back to (0 0) crosses the strip.
+        square = [[[(0, 0), (10, 0), (10, 10), (0, 10)]]]
+        strip = [[[(-1, 4), (1, 4), (1, 5), (-1, 5), (-1, 4)]]]
+        self.assertTrue(polygons_intersect(square, strip))
+        self.assertTrue(polygons_intersect(strip, square))
+
+
+class GeometryTests(TestCase):
+    def test_parsed_geometry(self):
+        from .geometry import parse_geometry
+        square = parse_geometry("SRID=4326;POLYGON((0 0, 4 0, 4 4, 0 4, 0 0), (1 1, 2 1, 2 2, 1 2, 1 1))")
+        self.assertEqual(square.coords.typecode, "d")
+        self.assertEqual(square.bbox, (0, 0, 4, 4))
+        self.assertEqual(square.planar_area(), 15)
+        self.assertAlmostEqual(square.centroid[0], (16 * 2 - 1.5) / 15)
+        multi = parse_geometry("MULTIPOLYGON(((0 0, 1 0, 1 1, 0 0)), ((5 5, 6 5, 6 6, 5 5)))")
+        self.assertEqual(len(multi.to_geojson()["coordinates"]), 2)
+        self.assertEqual(parse_geometry("MULTIPOINT((1 2), (3 4))").to_geojson()["coordinates"], [[1, 2], [3, 4]])
+        self.assertIsNone(parse_geometry("POLYGON((0 0, 1 x))"))
+
+    def test_cache_evicts_by_size(self):
+        from .geometry import GeometryCache
+        cache = GeometryCache(max_bytes=1000)
+        wkt = "POLYGON((" + ", ".join(f"{i} {i}" for i in range(20)) + "))"
+        first = cache.get_or_parse(("api.CropField", 1, hash(wkt)), wkt)
+        self.assertIs(cache.get_or_parse(("api.CropField", 1, hash(wkt)), wkt), first)
+        for pk in range(2, 6):
+            cache.get_or_parse(("api.CropField", pk, hash(wkt)), wkt)
+        self.assertLessEqual(cache.size, 1000)
+        self.assertEqual(cache.hits, 1)
+
+    def test_ring_simplification(self):
+        from .geometry import parse_geometry, simplify_ring
+        ring = [(0, 0), (1, 0.001), (2, 0), (2, 2), (0, 2), (0, 0)]
+        self.assertEqual(simplify_ring(ring, 0.01), [(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)])
+        tiny = [(0, 0), (0.001, 0), (0.001, 0.001), (0, 0)]
+        self.assertIsNone(simplify_ring(tiny, 0.01))
+        self.assertEqual(len(simplify_ring(tiny, 0.01, keep=True)), 4)
+        holed = parse_geometry("POLYGON((0 0, 4 0, 4 4, 0 4, 0 0), (1 1, 1.001 1, 1.001 1.001, 1 1))")
+        self.assertEqual(holed.simplify(0.01).to_wkt(), "POLYGON((0 0, 4 0, 4 4, 0 4, 0 0))")
+
+    def test_overlap_predicates(self):
+        from .geometry import circle_within, polygons_overlap, polygons_within
+        square = [[[(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)]]]
+        neighbour = [[[(2, 0), (4, 0), (4, 2), (2, 2), (2, 0)]]]
+        self.assertFalse(polygons_overlap(square, neighbour))
+        self.assertTrue(polygons_overlap(square, square))
+        self.assertTrue(polygons_overlap(square, [[[(1, 1), (3, 1), (3, 3), (1, 1)]]]))
+        self.assertTrue(polygons_within([[[(0, 0), (1, 0), (1, 1), (0, 0)]]], square))
+        self.assertFalse(polygons_within(neighbour, square))
+        # As the field form sends it: the closing edge (4 1)-(4 9) is the only one leaving the notched sector.
+        notched = [[[(0, 0), (10, 0), (10, 10), (0, 10), (5, 5), (0, 0)]]]
+        self.assertFalse(polygons_within([[[(4, 9), (8, 9), (8, 1), (4, 1)]]], notched))
+        self.assertTrue(polygons_within([[[(6, 9), (8, 9), (8, 1), (6, 1)]]], notched))
+        self.assertTrue(polygons_overlap([[[(1, 1), (3, 1), (3, 3), (1, 3)]]], square))
+        sector = [[[(47, 39), (47.1, 39), (47.1, 39.1), (47, 39.1), (47, 39)]]]
+        self.assertTrue(circle_within((47.05, 39.05, 100), sector))
+        self.assertFalse(circle_within((47.0005, 39.05, 100), sector))
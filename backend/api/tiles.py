@@ -0,0 +1,344 @@
+import functools
+import math
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+from .caching import bump_tenant_version, get_tenant_version
+from .filters import filter_bbox
+from .geojson import LAYERS, layer_queryset, layer_rows
+from .geometry import cached_geometry
+
+EXTENT = 4096
+BUFFER = 64
+MAX_ZOOM = 24
+
+_MOVE_TO, _LINE_TO, _CLOSE_PATH = 1, 2, 7
+_POINT, _POLYGON = 1, 3
+
+
+# -- Tile math ---------------------------------------------------------------
+
+def tile_bounds(z, x, y, buffer=0):
+    """Lon/lat bbox of a tile, grown by ``buffer`` tile-extent units on every side."""
+    n = 2 ** z
+    pad = buffer / EXTENT
+
+    def lon(tx):
+        return tx / n * 360.0 - 180.0
+
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+
+    return lon(x - pad), lat(y + 1 + pad), lon(x + 1 + pad), lat(y - pad)
+
+
+def tile_range(bbox, z):
+    """Inclusive x and y tile index ranges covering a lon/lat bbox at zoom ``z``."""
+    n = 2 ** z
+    min_lon, min_lat, max_lon, max_lat = bbox
+
+    def tx(lon):
+        return min(n - 1, max(0, int((lon + 180.0) / 360.0 * n)))
+
+    def ty(lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)))
+
+    return range(tx(min_lon), tx(max_lon) + 1), range(ty(max_lat), ty(min_lat) + 1)
+
+
+class TileProjection:
+    """Projects lon/lat to integer tile coordinates (0..EXTENT) for one tile."""
+
+    def __init__(self, z, x, y):
+        self.scale = 2 ** z
+        self.x = x
+        self.y = y
+
+    def __call__(self, lon, lat):
+        lat = max(min(lat, 85.0511), -85.0511)
+        mx = (lon + 180.0) / 360.0 * self.scale
+        my = (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * self.scale
+        return round((mx - self.x) * EXTENT), round((my - self.y) * EXTENT)
+
+
+# -- Clipping and quantization -----------------------------------------------
+
+def _clip_ring(ring, low, high):
+    """Sutherland-Hodgman clip of a ring against the square [low, high]^2."""
+    edges = (
+        (lambda p: p[0] >= low, lambda a, b: (low, a[1] + (b[1] - a[1]) * (low - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[0] <= high, lambda a, b: (high, a[1] + (b[1] - a[1]) * (high - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[1] >= low, lambda a, b: (a[0] + (b[0] - a[0]) * (low - a[1]) / (b[1] - a[1]), low)),
+        (lambda p: p[1] <= high, lambda a, b: (a[0] + (b[0] - a[0]) * (high - a[1]) / (b[1] - a[1]), high)),
+    )
+    for inside, intersect in edges:
+        if not ring:
+            break
+        clipped = []
+        previous = ring[-1]
+        for point in ring:
+            if inside(point):
+                if not inside(previous):
+                    clipped.append(intersect(previous, point))
+                clipped.append(point)
+            elif inside(previous):
+                clipped.append(intersect(previous, point))
+            previous = point
+        ring = clipped
+    return ring
+
+
+def _ring_area(ring):
+    return sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _quantize(ring):
+    points = []
+    for x, y in ring:
+        point = (round(x), round(y))
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def tile_polygon(polygons, project):
+    """Project, clip and quantize polygons; returns rings wound as the MVT spec requires."""
+    rings = []
+    for polygon in polygons:
+        for index, ring in enumerate(polygon):
+            ring = _quantize(_clip_ring([project(lon, lat) for lon, lat in ring], -BUFFER, EXTENT + BUFFER))
+            if len(ring) < 3:
+                if index == 0:
+                    break  # the exterior vanished at this zoom, drop its holes too
+                continue
+            area = _ring_area(ring)
+            if area == 0:
+                continue
+            # Exterior rings have positive area in tile space (y down), interior rings negative.
+            if (area > 0) != (index == 0):
+                ring.reverse()
+            rings.append(ring)
+    return rings
+
+
+# -- Protobuf encoding -------------------------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, wire_type, payload):
+    key = _varint((number << 3) | wire_type)
+    if wire_type == 2:
+        return key + _varint(len(payload)) + payload
+    return key + payload
+
+
+def _packed(number, values):
+    return _field(number, 2, b"".join(_varint(value) for value in values))
+
+
+def _command(command, count):
+    return (command & 0x7) | (count << 3)
+
+
+def encode_points(points):
+    geometry = [_command(_MOVE_TO, len(points))]
+    cx = cy = 0
+    for x, y in points:
+        geometry += [_zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+    return geometry
+
+
+def encode_rings(rings):
+    geometry = []
+    cx = cy = 0
+    for ring in rings:
+        x, y = ring[0]
+        geometry += [_command(_MOVE_TO, 1), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        geometry.append(_command(_LINE_TO, len(ring) - 1))
+        for x, y in ring[1:]:
+            geometry += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+        geometry.append(_command(_CLOSE_PATH, 1))
+    return geometry
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0, _varint(int(value)))
+    if isinstance(value, int):
+        return _field(6, 0, _varint(_zigzag(value)))
+    if isinstance(value, float):
+        return _field(3, 1, struct.pack("<d", value))
+    return _field(1, 2, str(value).encode())
+
+
+class LayerEncoder:
+    """Accumulates features of one MVT layer, de-duplicating property keys and values."""
+
+    def __init__(self, name):
+        self.name = name
+        self.keys = {}
+        self.values = {}
+        self.features = []
+
+    def _index(self, table, item):
+        if item not in table:
+            table[item] = len(table)
+        return table[item]
+
+    def add(self, feature_id, geom_type, geometry, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if not isinstance(value, (bool, int, float, str)):
+                value = str(value)
+            tags += [self._index(self.keys, key), self._index(self.values, (type(value), value))]
+        self.features.append(
+            _field(1, 0, _varint(feature_id)) + _packed(2, tags)
+            + _field(3, 0, _varint(geom_type)) + _packed(4, geometry)
+        )
+
+    def encode(self):
+        body = _field(15, 0, _varint(2)) + _field(1, 2, self.name.encode())
+        body += b"".join(_field(2, 2, feature) for feature in self.features)
+        body += b"".join(_field(3, 2, key.encode()) for key in self.keys)
+        body += b"".join(_field(4, 2, _encode_value(value)) for _, value in self.values)
+        body += _field(5, 0, _varint(EXTENT))
+        return _field(3, 2, body)
+
+
+def render_tile(user, z, x, y):
+    """Encode the user's sectors, pivots and fields intersecting tile z/x/y as an MVT."""
+    project = TileProjection(z, x, y)
+    bounds = tile_bounds(z, x, y, buffer=BUFFER)
+    tile = b""
+    for layer, (model, *_) in LAYERS.items():
+        encoder = LayerEncoder(layer)
+        # A level simplified for z + 1 stays within half a screen pixel of a 512px tile.
+        for wkt, properties in layer_rows(layer, filter_bbox(layer_queryset(layer, user), bounds), zoom=z + 1):
+            geometry = cached_geometry(model._meta.label, properties["id"], wkt)
+            if geometry is None:
+                continue
+            if geometry.kind == "POINT":
+                point = project(geometry.coords[0], geometry.coords[1])
+                if not all(-BUFFER <= value <= EXTENT + BUFFER for value in point):
+                    continue
+                encoder.add(properties["id"], _POINT, encode_points([point]), properties)
+            else:
+                rings = tile_polygon(geometry.polygons(), project)
+                if rings:
+                    encoder.add(properties["id"], _POLYGON, encode_rings(rings), properties)
+        if encoder.features:
+            tile += encoder.encode()
+    return tile
+
+
+# -- Disk cache --------------------------------------------------------------
+
+def _tenant_dir(owner_id):
+    return Path(settings.TILE_CACHE_DIR) / str(owner_id)
+
+
+def _version_tenant(owner_id):
+    return f"{owner_id}:tiles"
+
+
+def get_tile(user, z, x, y):
+    """
+    Serve a tile from the disk cache, rendering and storing it on a miss.
+
+    Invalidation moves the tenant's tile version before deleting files, so
+    a tile whose render overlapped an invalidation is served but not kept.
+    """
+    path = _tenant_dir(user.pk) / str(z) / str(x) / f"{y}.mvt"
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    version = get_tenant_version(_version_tenant(user.pk))
+    tile = render_tile(user, z, x, y)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as temporary:
+        temporary.write(tile)
+    if get_tenant_version(_version_tenant(user.pk)) != version:
+        os.remove(temporary.name)
+        return tile
+    os.replace(temporary.name, path)
+    # An invalidation between the check and the replace may have missed this file.
+    if get_tenant_version(_version_tenant(user.pk)) != version:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return tile
+
+
+def _int_entries(directory):
+    try:
+        return [(int(entry.name.split(".")[0]), entry) for entry in os.scandir(directory)
+                if entry.name.split(".")[0].isdigit()]
+    except FileNotFoundError:
+        return []
+
+
+def invalidate_tiles(owner_id, bbox):
+    """
+    Delete the tenant's cached tiles touching ``bbox`` (lon/lat).
+
+    The tile version moves with the write's transaction and the files go
+    once it commits, so a tile rendered from the old rows in between is
+    deleted as well. Only zoom and column directories that already exist
+    are visited, so the cost follows the number of cached tiles, not the
+    tiles a bbox spans.
+    """
+    if owner_id is None or bbox is None or None in bbox:
+        return
+    bump_tenant_version(_version_tenant(owner_id))
+    transaction.on_commit(functools.partial(_delete_tiles, owner_id, bbox))
+
+
+def _delete_tiles(owner_id, bbox):
+    for z, zoom_dir in _int_entries(_tenant_dir(owner_id)):
+        # Tiles are drawn with a buffer, so neighbouring tiles can show the feature as well.
+        pad = 360.0 / 2 ** z * BUFFER / EXTENT
+        xs, ys = tile_range((bbox[0] - pad, bbox[1] - pad, bbox[2] + pad, bbox[3] + pad), z)
+        for x, column_dir in _int_entries(zoom_dir.path):
+            if x not in xs:
+                continue
+            for y, tile_file in _int_entries(column_dir.path):
+                if y in ys:
+                    try:
+                        os.remove(tile_file.path)
+                    except FileNotFoundError:
+                        pass
+
+
+def clear_tiles(owner_id):
+    bump_tenant_version(_version_tenant(owner_id))
+    transaction.on_commit(functools.partial(shutil.rmtree, _tenant_dir(owner_id), ignore_errors=True))
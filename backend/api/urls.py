@@ -17,10 +17,13 @@ urlpatterns = [
     # Crop Pivots
     path("pivots/", views.CropPivotListCreate.as_view(), name="pivot-list"),
     path("pivots/<int:pk>/", views.CropPivotDetail.as_view(), name="pivot-detail"),
+    path("pivots/nearest/", views.CropPivotNearest.as_view(), name="pivot-nearest"),
+    path("pivots/bulk/", views.CropPivotBulk.as_view(), name="pivot-bulk"),
 
     # Crop Fields
     path("fields/", views.CropFieldListCreate.as_view(), name="field-list"),
     path("fields/<int:pk>/", views.CropFieldDetail.as_view(), name="field-detail"),
+    path("fields/bulk/", views.CropFieldBulk.as_view(), name="field-bulk"),
 
     # Crop Rotations
     path("rotations/", views.CropRotationListCreate.as_view(), name="rotation-list"),
@@ -29,7 +32,22 @@ urlpatterns = [
     # Crop Rotation Entries
     path("rotation-entries/", views.CropRotationEntryListCreate.as_view(), name="rotation-entry-list"),
     path("rotation-entries/<int:pk>/", views.CropRotationEntryDetail.as_view(), name="rotation-entry-detail"),
+    path("rotation-entries/upsert/", views.CropRotationEntryUpsert.as_view(), name="rotation-entry-upsert"),
 
     # Crops
     path("crops/", views.CropListCreate.as_view(), name="crop-list"),
+
+    # Map layers
+    path("geojson/", views.GeoJSONLayers.as_view(), name="geojson-layers"),
+    path("tiles/<int:z>/<int:x>/<int:y>.mvt", views.VectorTile.as_view(), name="vector-tile"),
+    path("clusters/", views.PlotClusters.as_view(), name="plot-clusters"),
+    path("analytics/yields/", views.YieldAnalytics.as_view(), name="yield-analytics"),
+    path("dashboard/", views.Dashboard.as_view(), name="dashboard"),
+    path("export/rotations.<str:fmt>", views.RotationExport.as_view(), name="rotation-export"),
+    path("import/<str:kind>/", views.CsvImport.as_view(), name="csv-import"),
+    path("spatial/query/", views.SpatialQuery.as_view(), name="spatial-query"),
+    path("spatial/conflicts/", views.ConflictReport.as_view(), name="spatial-conflicts"),
+
+    # Response cache hit/miss counters (staff only)
+    path("cache/stats/", views.CacheStats.as_view(), name="cache-stats"),
 ]
@@ -1,8 +1,25 @@
-from rest_framework import generics
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework import generics, status
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from .models import *
 from .serializers import *
+from .pagination import CropRotationPagination
+from .caching import ConditionalGetMixin, TenantCachedListMixin, cache_stats, data_version, request_data_versions
+from .filters import BBoxFilter, ZoomFilter, bbox_from_request, filter_bbox, zoom_from_request
+from . import spatial, tiles
+from .geometry import parse_geometry, parse_point
+from .geojson import layer_queryset, parse_layers, stream_feature_collection
+from .analytics import parse_group_by, parse_percentiles, yield_analytics
+from .clusters import CLUSTER_LAYERS, tenant_clusters
+from .rollups import dashboard
+from .export import EXPORT_FORMATS, export_rows, stream_export
+from .importers import IMPORT_KINDS, csv_rows, importer_for
+from .conflicts import conflict_report
+from .bulk import BulkPlotWriter, CropFieldBulkItemSerializer, CropPivotBulkItemSerializer, upsert_rotation_entries
 from rest_framework_simplejwt.views import TokenObtainPairView
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
@@ -13,134 +30,432 @@ class CreateUserView(generics.CreateAPIView):
     permission_classes = [AllowAny]
 
 
-class CompanyListCreate(generics.ListCreateAPIView):
+class AnnotatedCreateMixin:
+    """Re-read created rows through get_queryset() so annotated stats are present in the response."""
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+
+class ZoomContextMixin:
+    """Pass ``?zoom=`` to the serializer, which then returns the matching simplified shape."""
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), "zoom": zoom_from_request(self.request)}
+
+
+class CompanyListCreate(ConditionalGetMixin, TenantCachedListMixin, AnnotatedCreateMixin, generics.ListCreateAPIView):
+    cache_endpoint = "companies"
     serializer_class = CompanySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Company.objects.filter(owner=self.request.user)
+        return Company.objects.filter(owner=self.request.user).select_related('owner').with_stats()
 
-    def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
-
-class CompanyDetail(generics.RetrieveUpdateDestroyAPIView):
+class CompanyDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CompanySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Company.objects.filter(owner=self.request.user)
+        return Company.objects.filter(owner=self.request.user).select_related('owner').with_stats()
 
 
-class RegionListCreate(generics.ListCreateAPIView):
+class RegionListCreate(ConditionalGetMixin, TenantCachedListMixin, AnnotatedCreateMixin, generics.ListCreateAPIView):
+    cache_endpoint = "regions"
     serializer_class = RegionSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         # User can see only regions under companies they own
-        return Region.objects.filter(company__owner=self.request.user)
+        return Region.objects.filter(company__owner=self.request.user).select_related('company').with_stats()
 
-class RegionDetail(generics.RetrieveUpdateDestroyAPIView):
+class RegionDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = RegionSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Region.objects.filter(company__owner=self.request.user)
+        return Region.objects.filter(company__owner=self.request.user).select_related('company').with_stats()
 
 
-class WaterwaySectorListCreate(generics.ListCreateAPIView):
+class WaterwaySectorListCreate(ConditionalGetMixin, TenantCachedListMixin, ZoomContextMixin, AnnotatedCreateMixin, generics.ListCreateAPIView):
+    cache_endpoint = "sectors"
     serializer_class = WaterwaySectorSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [BBoxFilter, ZoomFilter]
 
     def get_queryset(self):
-        return WaterwaySector.objects.filter(region__company__owner=self.request.user)
+        return WaterwaySector.objects.filter(
+            region__company__owner=self.request.user
+        ).select_related('region').with_stats()
 
-class WaterwaySectorDetail(generics.RetrieveUpdateDestroyAPIView):
+class WaterwaySectorDetail(ConditionalGetMixin, ZoomContextMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = WaterwaySectorSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [ZoomFilter]
 
     def get_queryset(self):
-        return WaterwaySector.objects.filter(region__company__owner=self.request.user)
+        return WaterwaySector.objects.filter(
+            region__company__owner=self.request.user
+        ).select_related('region').with_stats()
 
 
-class CropPivotListCreate(generics.ListCreateAPIView):
+class CropPivotListCreate(ConditionalGetMixin, TenantCachedListMixin, generics.ListCreateAPIView):
+    cache_endpoint = "pivots"
     serializer_class = CropPivotSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [BBoxFilter]
 
     def get_queryset(self):
-        return CropPivot.objects.filter(sector__region__company__owner=self.request.user)
+        return CropPivot.objects.filter(
+            sector__region__company__owner=self.request.user
+        ).select_related('sector').prefetch_related('crops')
 
-class CropPivotDetail(generics.RetrieveUpdateDestroyAPIView):
+class CropPivotDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CropPivotSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return CropPivot.objects.filter(sector__region__company__owner=self.request.user)
+        return CropPivot.objects.filter(
+            sector__region__company__owner=self.request.user
+        ).select_related('sector').prefetch_related('crops')
 
 
-class CropFieldListCreate(generics.ListCreateAPIView):
+class CropFieldListCreate(ConditionalGetMixin, TenantCachedListMixin, ZoomContextMixin, generics.ListCreateAPIView):
+    cache_endpoint = "fields"
     serializer_class = CropFieldSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [BBoxFilter, ZoomFilter]
 
     def get_queryset(self):
-        return CropField.objects.filter(sector__region__company__owner=self.request.user)
+        return CropField.objects.filter(
+            sector__region__company__owner=self.request.user
+        ).select_related('sector').prefetch_related('crops')
 
-class CropFieldDetail(generics.RetrieveUpdateDestroyAPIView):
+class CropFieldDetail(ConditionalGetMixin, ZoomContextMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CropFieldSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [ZoomFilter]
 
     def get_queryset(self):
-        return CropField.objects.filter(sector__region__company__owner=self.request.user)
+        return CropField.objects.filter(
+            sector__region__company__owner=self.request.user
+        ).select_related('sector').prefetch_related('crops')
 
 
+class CropPivotNearest(APIView):
+    """The user's pivots nearest to ``?lat=&lon=``: at most ``k`` (default 10), optionally within ``max_m`` metres."""
+    permission_classes = [IsAuthenticated]
+    max_k = 1000
+
+    def get(self, request):
+        params = request.query_params
+        errors = {}
+        try:
+            lat, lon = float(params["lat"]), float(params["lon"])
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError
+        except (KeyError, ValueError):
+            errors["lat"] = ["lat and lon are required: -90..90 and -180..180."]
+        try:
+            k = int(params.get("k", 10))
+            if not 1 <= k <= self.max_k:
+                raise ValueError
+        except ValueError:
+            errors["k"] = [f"k must be an integer between 1 and {self.max_k}."]
+        try:
+            max_m = float(params["max_m"]) if params.get("max_m") else None
+            if max_m is not None and max_m <= 0:
+                raise ValueError
+        except ValueError:
+            errors["max_m"] = ["max_m must be a positive number of metres."]
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        nearest = spatial.nearest_pivots(request.user.pk, lon, lat, k, max_m)
+        rows = CropPivot.objects.filter(pk__in=[pk for _, pk in nearest]).values(
+            "id", "logical_name", "center", "radius_m", "area", "color", "sector_id"
+        )
+        pivots = {row["id"]: row for row in rows}
+        results = [
+            {**pivots[pk], "distance_m": round(distance, 1)}
+            for distance, pk in nearest if pk in pivots
+        ]
+        return Response({"results": results})
+
+
+class PlotBulkView(APIView):
+    """POST a list to create plots, PATCH a list of partial items with ``id`` to update them."""
+    permission_classes = [IsAuthenticated]
+    item_serializer_class = None
+    max_items = 10000
 
+    def post(self, request):
+        return self.write(request, update=False)
 
-class CropRotationListCreate(generics.ListCreateAPIView):
+    def patch(self, request):
+        return self.write(request, update=True)
+
+    def write(self, request, update):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Expected a list of items."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_items:
+            return Response({"detail": f"At most {self.max_items} items per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        result = BulkPlotWriter(self.item_serializer_class, request.user).write(items, update=update)
+        written = result["updated" if update else "created"]
+        if not result["errors"]:
+            code = status.HTTP_200_OK if update else status.HTTP_201_CREATED
+        elif written:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response(result, status=code)
+
+class CropPivotBulk(PlotBulkView):
+    item_serializer_class = CropPivotBulkItemSerializer
+
+class CropFieldBulk(PlotBulkView):
+    item_serializer_class = CropFieldBulkItemSerializer
+
+
+class CropRotationListCreate(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = CropRotationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CropRotationPagination
 
     def get_queryset(self):
         return CropRotation.objects.filter(
-            pivot__sector__region__company__owner=self.request.user
-        ) | CropRotation.objects.filter(
-            field__sector__region__company__owner=self.request.user
-        )
+            owner=self.request.user
+        ).select_related('pivot', 'field').prefetch_related('entries__crop')
 
-class CropRotationDetail(generics.RetrieveUpdateDestroyAPIView):
+class CropRotationDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CropRotationSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         return CropRotation.objects.filter(
-            pivot__sector__region__company__owner=self.request.user
-        ) | CropRotation.objects.filter(
-            field__sector__region__company__owner=self.request.user
-        )
+            owner=self.request.user
+        ).select_related('pivot', 'field').prefetch_related('entries__crop')
 
 
-class CropRotationEntryListCreate(generics.ListCreateAPIView):
+class CropRotationEntryListCreate(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = CropRotationEntrySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return CropRotationEntry.objects.filter(
-            rotation__pivot__sector__region__company__owner=self.request.user
-        ) | CropRotationEntry.objects.filter(
-            rotation__field__sector__region__company__owner=self.request.user
-        )
+        return CropRotationEntry.objects.filter(owner=self.request.user).select_related('crop')
 
-class CropRotationEntryDetail(generics.RetrieveUpdateDestroyAPIView):
+class CropRotationEntryDetail(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CropRotationEntrySerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return CropRotationEntry.objects.filter(
-            rotation__pivot__sector__region__company__owner=self.request.user
-        ) | CropRotationEntry.objects.filter(
-            rotation__field__sector__region__company__owner=self.request.user
-        )
+        return CropRotationEntry.objects.filter(owner=self.request.user).select_related('crop')
+
+
+class CropRotationEntryUpsert(APIView):
+    """POST a list of entries; rows matching an existing (rotation, crop) are updated in place."""
+    permission_classes = [IsAuthenticated]
+    max_items = 50000
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Expected a list of items."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.max_items:
+            return Response({"detail": f"At most {self.max_items} items per request."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        result = upsert_rotation_entries(request.user, items)
+        if not result["errors"]:
+            code = status.HTTP_200_OK
+        elif result["created"] or result["updated"]:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response(result, status=code)
+
+
+class CsvImport(APIView):
+    """POST a CSV ``file`` of pivots, fields or yields; rows are validated and written in batches."""
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, kind):
+        if kind not in IMPORT_KINDS:
+            raise Http404
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response({"file": ["No file was submitted."]}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = importer_for(kind, request.user).run(csv_rows(upload.file))
+        if not report["rejected_count"]:
+            code = status.HTTP_200_OK
+        elif report["created"] or report["updated"]:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response(report, status=code)
+
+
+class GeoJSONLayers(ConditionalGetMixin, APIView):
+    """Stream the user's sectors, pivots and fields as one GeoJSON FeatureCollection (``?layers=``, ``?bbox=``, ``?zoom=``)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            layers = parse_layers(request.query_params.get("layers"))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        bbox = bbox_from_request(request)
+        querysets = {layer: layer_queryset(layer, request.user) for layer in layers}
+        if bbox is not None:
+            querysets = {layer: filter_bbox(queryset, bbox) for layer, queryset in querysets.items()}
+        zoom = zoom_from_request(request)
+        return StreamingHttpResponse(stream_feature_collection(querysets, zoom), content_type="application/geo+json")
+
+
+class RotationExport(ConditionalGetMixin, APIView):
+    """Stream every rotation with its entries, one row per entry, as ``rotations.csv`` or ``rotations.ndjson``."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, fmt):
+        if fmt not in EXPORT_FORMATS:
+            raise Http404
+        response = StreamingHttpResponse(stream_export(export_rows(request.user), fmt), content_type=EXPORT_FORMATS[fmt])
+        response["Content-Disposition"] = f'attachment; filename="rotations.{fmt}"'
+        return response
+
+
+class VectorTile(ConditionalGetMixin, APIView):
+    """Mapbox Vector Tile of the user's sectors, pivots and fields, served from the disk tile cache."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, z, x, y):
+        if z > tiles.MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            raise Http404
+        return HttpResponse(tiles.get_tile(request.user, z, x, y), content_type="application/vnd.mapbox-vector-tile")
+
+
+class ConflictReport(ConditionalGetMixin, APIView):
+    """Overlapping pivots/fields and plots outside their sector polygon, for the whole tenant."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(conflict_report(request.user.pk))
+
 
+class YieldAnalytics(ConditionalGetMixin, APIView):
+    """
+    Yield totals, means, percentiles and actual-vs-expected gap of the user's rotation entries.
 
-class CropListCreate(generics.ListCreateAPIView):
+    ``?group_by=`` takes a comma list of company, region, sector, crop and year
+    (default year); ``?percentiles=`` a comma list in (0, 100] (default 25,50,75).
+    ``?year_from=``, ``?year_to=`` and ``?crop=`` narrow the entries.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        errors = {}
+        try:
+            group_by = parse_group_by(params.get("group_by"))
+        except ValueError as exc:
+            errors["group_by"] = [str(exc)]
+        try:
+            percentiles = parse_percentiles(params.get("percentiles"))
+        except ValueError as exc:
+            errors["percentiles"] = [str(exc)]
+
+        filters = YieldAnalyticsFilterSerializer(data=params)
+        if not filters.is_valid():
+            errors.update(filters.errors)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+        entries = CropRotationEntry.objects.filter(owner=request.user)
+        for param, lookup in (("year_from", "rotation__year__gte"), ("year_to", "rotation__year__lte"), ("crop", "crop_id")):
+            value = filters.validated_data.get(param)
+            if value is not None:
+                entries = entries.filter(**{lookup: value})
+        return Response({
+            "group_by": group_by,
+            "results": yield_analytics(entries, group_by, percentiles),
+        })
+
+
+class Dashboard(ConditionalGetMixin, APIView):
+    """Per-company and per-region plot counts, hectares and yield by year, read from the rollup tables."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(dashboard(request.user))
+
+
+class PlotClusters(ConditionalGetMixin, APIView):
+    """Pivots and fields grouped into screen-grid clusters for ``?zoom=`` (``?layers=``, ``?bbox=``)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        zoom = zoom_from_request(request)
+        if zoom is None:
+            return Response({"zoom": ["This parameter is required."]}, status=status.HTTP_400_BAD_REQUEST)
+        value = request.query_params.get("layers")
+        layers = [layer.strip() for layer in value.split(",") if layer.strip()] if value else list(CLUSTER_LAYERS)
+        unknown = [layer for layer in layers if layer not in CLUSTER_LAYERS]
+        if unknown or not layers:
+            return Response({"layers": [f"Choose from: {', '.join(CLUSTER_LAYERS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        version = data_version(request.user, request_data_versions(request))
+        clusters = tenant_clusters(request.user, sorted(set(layers)), zoom, bbox_from_request(request), version)
+        return Response({"zoom": zoom, "clusters": clusters})
+
+
+class SpatialQuery(APIView):
+    """
+    Query the tenant's in-memory spatial index: ``?layer=sectors|fields`` plus one of
+    ``point=lon,lat``, ``bbox=min_lon,min_lat,max_lon,max_lat`` or ``wkt=POLYGON(...)``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        layer = params.get("layer", "sectors")
+        if layer not in spatial.POLYGON_LAYERS:
+            return Response({"layer": [f"Choose from: {', '.join(spatial.POLYGON_LAYERS)}."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+        index = spatial.get_index(request.user.pk).layers[layer]
+
+        if "point" in params:
+            try:
+                lon, lat = parse_point(params["point"])
+            except ValueError as exc:
+                return Response({"point": [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+            ids = index.query_point(lon, lat)
+        elif "bbox" in params:
+            ids = index.query_bbox(bbox_from_request(request))
+        elif "wkt" in params:
+            geometry = parse_geometry(params["wkt"])
+            polygons = geometry.polygons() if geometry is not None else []
+            if not polygons:
+                return Response({"wkt": ["Expected a POLYGON or MULTIPOLYGON."]}, status=status.HTTP_400_BAD_REQUEST)
+            ids = index.query_polygons(polygons)
+        else:
+            return Response({"detail": "Pass one of point, bbox or wkt."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"layer": layer, "ids": ids})
+
+
+class CropListCreate(ConditionalGetMixin, generics.ListCreateAPIView):
     queryset = Crop.objects.all()
     serializer_class = CropSerializer
     permission_classes = [IsAuthenticated]
+
+
+class CacheStats(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats())
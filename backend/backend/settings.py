@@ -41,6 +41,8 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
+    "PAGE_SIZE": 100,
 
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
@@ -137,6 +139,41 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Data version stamps live in the database (api.TenantVersion), so every process sees each write;
+# the cache only holds responses keyed by them. Local memory is per process, so with several
+# workers a shared backend saves each from rendering its own copy, e.g.
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache, CACHE_LOCATION=/var/tmp/api-cache
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "api-cache"),
+    }
+}
+
+# Upper bound on how long a cached list response lives; writes invalidate it sooner.
+API_CACHE_TIMEOUT = int(os.getenv("API_CACHE_TIMEOUT", "300"))
+
+
+# In-process spatial index (api.spatial): grid cell size in degrees and how many tenants stay in memory.
+SPATIAL_INDEX_CELL_DEGREES = float(os.getenv("SPATIAL_INDEX_CELL_DEGREES", "0.01"))
+SPATIAL_INDEX_MAX_TENANTS = int(os.getenv("SPATIAL_INDEX_MAX_TENANTS", "64"))
+
+
+# Memory budget of the parsed-geometry LRU (api.geometry.cached_geometry), in bytes.
+GEOMETRY_CACHE_BYTES = int(os.getenv("GEOMETRY_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+# Directory of the on-disk vector tile cache (api.tiles); writes delete only the tiles they touch.
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", str(BASE_DIR / "tile-cache"))
+
+
+# Reject pivot/field writes that overlap another plot or leave their sector (api.conflicts).
+PLOT_CONFLICT_CHECK = os.getenv("PLOT_CONFLICT_CHECK", "false").lower() == "true"
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -183,3 +220,6 @@ CORS_ALLOWED_ORIGINS = [origin.strip() for origin in cors_origins.split(",") if
 
 CORS_ALLOW_CREDENTIALS = False  # You're using token auth, not cookies
 
+
+# Covering indexes (Index(include=...)) are PostgreSQL-only; SQLite dev databases just build the key columns.
+SILENCED_SYSTEM_CHECKS = ["models.W040"]
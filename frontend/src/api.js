@@ -20,4 +20,22 @@ api.interceptors.request.use(
     }
 )
 
-export default api;
\ No newline at end of file
+export default api;
+
+// List endpoints are cursor-paginated; follow `next` links until every row is loaded.
+export const MAX_PAGE_SIZE = 1000;
+
+export async function fetchAll(url, pageSize = MAX_PAGE_SIZE) {
+    const rows = [];
+    let next = url;
+    let params = { page_size: pageSize };
+
+    while (next) {
+        const res = await api.get(next, { params });
+        rows.push(...res.data.results);
+        next = res.data.next;
+        params = undefined; // the next link already carries page_size and cursor
+    }
+
+    return rows;
+}
@@ -3,7 +3,7 @@ import L from "leaflet";
 import "leaflet/dist/leaflet.css";
 import "leaflet-draw/dist/leaflet.draw.css";
 import "leaflet-draw";
-import api from "../../api.js";
+import { fetchAll } from "../../api.js";
 import "../../styles/ModelAndMapLayout.css";
 
 function FieldForm({ initialData = {}, onSubmit, onCancel }) {
@@ -37,8 +37,8 @@ function FieldForm({ initialData = {}, onSubmit, onCancel }) {
     const drawnLayerRef = useRef(null);
 
     useEffect(() => {
-        api.get("/api/sectors/")
-            .then(res => setSectors(res.data))
+        fetchAll("/api/sectors/")
+            .then(rows => setSectors(rows))
             .catch(err => console.error("Failed to load sectors", err));
     }, []);
 
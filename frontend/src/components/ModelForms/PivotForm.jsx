@@ -3,7 +3,7 @@ import L from "leaflet";
 import "leaflet/dist/leaflet.css";
 import "leaflet-draw/dist/leaflet.draw.css";
 import "leaflet-draw";
-import api from "../../api.js";
+import { fetchAll } from "../../api.js";
 import "../../styles/ModelAndMapLayout.css";
 
 function PivotForm({ initialData = {}, onSubmit, onCancel }) {
@@ -41,8 +41,8 @@ function PivotForm({ initialData = {}, onSubmit, onCancel }) {
     const isDuplicateCrop = (crop, others) => crop !== "none" && others.includes(crop);
 
     useEffect(() => {
-        api.get("/api/sectors/")
-            .then(res => setSectors(res.data))
+        fetchAll("/api/sectors/")
+            .then(rows => setSectors(rows))
             .catch(err => console.error("Failed to fetch sectors", err));
     }, []);
 
@@ -3,7 +3,7 @@ import L from "leaflet";
 import "leaflet/dist/leaflet.css";
 import "leaflet-draw/dist/leaflet.draw.css";
 import "leaflet-draw";
-import api from "../../api.js";
+import { fetchAll } from "../../api.js";
 import "../../styles/ModelAndMapLayout.css";
 
 function RegionForm({ initialData = {}, onSubmit, onCancel }) {
@@ -34,8 +34,8 @@ function RegionForm({ initialData = {}, onSubmit, onCancel }) {
 
     // Load companies
     useEffect(() => {
-        api.get("/api/companies/")
-            .then(res => setCompanies(res.data))
+        fetchAll("/api/companies/")
+            .then(rows => setCompanies(rows))
             .catch(err => console.error("Failed to fetch companies", err));
     }, []);
 
@@ -4,7 +4,7 @@ import "leaflet/dist/leaflet.css";
 import "leaflet-draw/dist/leaflet.draw.css";
 import "leaflet-draw";
 
-import api from "../../api.js";
+import { fetchAll } from "../../api.js";
 import "../../styles/ModelAndMapLayout.css";
 
 function SectorForm({ initialData = {}, onSubmit, onCancel }) {
@@ -20,8 +20,8 @@ function SectorForm({ initialData = {}, onSubmit, onCancel }) {
     const drawnLayerRef = useRef(null);
 
     useEffect(() => {
-        api.get("/api/regions/")
-            .then(res => setRegions(res.data))
+        fetchAll("/api/regions/")
+            .then(rows => setRegions(rows))
             .catch(err => console.error("Failed to load regions", err));
     }, []);
 
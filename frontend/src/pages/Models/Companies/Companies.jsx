@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from "react";
 import { Link } from "react-router-dom";
-import api from "../../../api.js";
+import api, { fetchAll } from "../../../api.js";
 import "leaflet/dist/leaflet.css";
 import L from "leaflet";
 import "leaflet-draw/dist/leaflet.draw.css";
@@ -88,9 +88,9 @@ function Companies() {
         });
 
     useEffect(() => {
-        api.get("/api/companies/")
-            .then(res => {
-                const parsedCompanies = res.data.map(company => {
+        fetchAll("/api/companies/")
+            .then((rows) => {
+                const parsedCompanies = rows.map(company => {
                     let lat = null, lng = null;
                     if (company.center && company.center.includes("POINT")) {
                         const wkt = company.center.replace("SRID=4326;", "").trim();
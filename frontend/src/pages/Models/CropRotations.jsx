@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { Link } from "react-router-dom";
-import api from "../../api.js";
+import { fetchAll } from "../../api.js";
 import "../../styles/CropRotation.css";
 
 const YEARS = [2021, 2022, 2023, 2024, 2025];
@@ -11,9 +11,9 @@ function CropRotations() {
     const [fields, setFields] = useState([]);
 
     useEffect(() => {
-        api.get("/api/crop-rotations/").then(res => setRotations(res.data));
-        api.get("/api/pivots/").then(res => setPivots(res.data));
-        api.get("/api/fields/").then(res => setFields(res.data));
+        fetchAll("/api/crop-rotations/").then(rows => setRotations(rows));
+        fetchAll("/api/pivots/").then(rows => setPivots(rows));
+        fetchAll("/api/fields/").then(rows => setFields(rows));
     }, []);
 
     const getRotationCell = (modelType, modelId, year) => {
@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from "react";
 import { Link } from "react-router-dom";
-import api from "../../../api.js";
+import api, { fetchAll } from "../../../api.js";
 import L from "leaflet";
 import "leaflet/dist/leaflet.css";
 import { FaEdit, FaTrash } from "react-icons/fa";
@@ -58,9 +58,9 @@ function Fields() {
     }, {});
 
     useEffect(() => {
-        api.get("/api/fields/")
-            .then((res) => {
-                const parsed = res.data.map((field) => {
+        fetchAll("/api/fields/")
+            .then((rows) => {
+                const parsed = rows.map((field) => {
                     let polygonCoords = [];
                     if (field.shape && field.shape.includes("POLYGON")) {
                         const wkt = field.shape.replace("SRID=4326;", "").trim();
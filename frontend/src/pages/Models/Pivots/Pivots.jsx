@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from "react";
 import { Link } from "react-router-dom";
-import api from "../../../api.js";
+import api, { fetchAll } from "../../../api.js";
 import "leaflet/dist/leaflet.css";
 import L from "leaflet";
 import "leaflet-draw/dist/leaflet.draw.css";
@@ -71,9 +71,9 @@ function Pivots() {
     );
 
     useEffect(() => {
-        api.get("/api/pivots/")
-            .then((res) => {
-                const parsed = res.data.map((pivot) => {
+        fetchAll("/api/pivots/")
+            .then((rows) => {
+                const parsed = rows.map((pivot) => {
                     let lat = null, lng = null;
                     if (pivot.center && pivot.center.includes("POINT")) {
                         const wkt = pivot.center.replace("SRID=4326;", "").trim();
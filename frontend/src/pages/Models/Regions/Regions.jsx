@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from "react";
 import { Link } from "react-router-dom";
-import api from "../../../api.js";
+import api, { fetchAll } from "../../../api.js";
 import "leaflet/dist/leaflet.css";
 import L from "leaflet";
 import "leaflet-draw/dist/leaflet.draw.css";
@@ -88,9 +88,9 @@ function Regions() {
         });
 
     useEffect(() => {
-        api.get("/api/regions/")
-            .then((res) => {
-                const parsedRegions = res.data.map((region) => {
+        fetchAll("/api/regions/")
+            .then((rows) => {
+                const parsedRegions = rows.map((region) => {
                     let lat = null, lng = null;
                     if (region.center && region.center.includes("POINT")) {
                         const wkt = region.center.replace("SRID=4326;", "").trim();
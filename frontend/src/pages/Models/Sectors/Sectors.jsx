@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from "react";
 import {Link} from "react-router-dom";
-import api from "../../../api.js";
+import api, { fetchAll } from "../../../api.js";
 import "leaflet/dist/leaflet.css";
 import L from "leaflet";
 import markerIcon from "leaflet/dist/images/marker-icon.png";
@@ -67,9 +67,9 @@ function Sectors() {
 
     // Load & parse sectors
     useEffect(() => {
-        api.get("/api/sectors/")
-            .then((res) => {
-                const parsed = res.data.map((sector) => {
+        fetchAll("/api/sectors/")
+            .then((rows) => {
+                const parsed = rows.map((sector) => {
                     let polygonCoords = [];
 
                     if (sector.shape && sector.shape.includes("POLYGON")) {